@@ -0,0 +1,107 @@
+"""A cache of preprocessed data files, rebuilt whenever the source changes.
+
+Cached files are named after their source, a hash of its full path, and a
+key derived from its path, size and modification time, so editing or
+replacing the source makes the old entry unreachable; it's deleted the next
+time the entry is rebuilt. Sources with the same name in different
+directories have different entries, and never delete each other's.
+"""
+import contextlib
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from ghostwriter.paths import CACHE_DIR
+
+STARTUP_TIMES: Dict[str, float] = OrderedDict()
+
+
+def cache_key(source: str) -> str:
+    source = os.path.abspath(source)
+    stat = os.stat(source)
+    fingerprint = "{}:{}:{}".format(source, stat.st_size, stat.st_mtime)
+    return hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+
+def _entry_prefix(source: str) -> str:
+    """What every entry for `source` is named starting with."""
+    source = os.path.abspath(source)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return "{}-{}".format(stem, hashlib.sha1(source.encode("utf-8")).hexdigest()[:8])
+
+
+def cache_path(source: str, suffix: str, cache_dir: Optional[str] = None) -> str:
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    name = "{}-{}.{}".format(_entry_prefix(source), cache_key(source), suffix)
+    return os.path.join(cache_dir, name)
+
+
+def cached(
+    source: str,
+    suffix: str,
+    build: Callable[[str], None],
+    cache_dir: Optional[str] = None,
+) -> str:
+    """
+    Path of the `suffix` entry for `source`, calling `build(path)` to write
+    it first if it's missing or stale. `cache_dir` defaults to `CACHE_DIR`,
+    which the GHOSTWRITER_CACHE_DIR environment variable overrides.
+    """
+    logger = logging.getLogger(__name__)
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    path = cache_path(source, suffix, cache_dir)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    pattern = "{}-*.{}".format(glob.escape(_entry_prefix(source)), suffix)
+    for stale in glob.glob(os.path.join(cache_dir, pattern)):
+        # Another process may have just written the current entry, or
+        # removed this one.
+        if stale == path:
+            continue
+        logger.debug("Removing stale cache entry %s", stale)
+        try:
+            os.remove(stale)
+        except FileNotFoundError:
+            pass
+
+    # Build next to the destination and rename, so readers never see a
+    # half-written entry, and concurrent builders each write their own. The
+    # temporary name keeps the suffix's extension, since some writers pick
+    # their format from it.
+    directory, name = os.path.split(path)
+    temporary = os.path.join(
+        directory, "tmp{}-{}-{}".format(os.getpid(), threading.get_ident(), name)
+    )
+    logger.info("Caching %s as %s", source, path)
+    try:
+        build(temporary)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return path
+
+
+@contextlib.contextmanager
+def timed(label: str):
+    """Record how long the block takes under `label` in `STARTUP_TIMES`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMES[label] = time.perf_counter() - start
+
+
+def log_startup_times() -> None:
+    logger = logging.getLogger(__name__)
+    total = sum(STARTUP_TIMES.values())
+    for label, seconds in STARTUP_TIMES.items():
+        logger.info("Startup: %-40s %8.1f ms", label, 1000 * seconds)
+    logger.info("Startup: %-40s %8.1f ms", "total", 1000 * total)
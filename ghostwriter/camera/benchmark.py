@@ -0,0 +1,221 @@
+"""Headless, reproducible benchmarks of the camera effects.
+
+A clip is loaded into memory once and replayed through each stage, so the
+numbers don't depend on a camera or on decoding:
+
+    python -m ghostwriter.camera.benchmark --source synthetic:640x480
+    python -m ghostwriter.camera.benchmark --source clip.avi --stages gamma
+"""
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ghostwriter.camera.sources import load_clip
+from ghostwriter.paths import DATA_DIR
+from ghostwriter.utils import default_arguments, set_up_logging, source_spec
+
+Step = Callable[[np.ndarray], Any]
+
+
+class LatencyStats:
+    """Per-frame latencies of one stage, with percentiles."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.samples: List[float] = []
+        self.total = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.total += seconds
+
+    def percentile(self, q: float) -> float:
+        return float(np.percentile(self.samples, q)) if self.samples else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        count = len(self.samples)
+        return {
+            "stage": self.name,
+            "frames": count,
+            "fps": round(count / self.total, 1) if self.total else 0.0,
+            "mean_ms": round(1000 * self.total / count, 3) if count else 0.0,
+            "p50_ms": round(1000 * self.percentile(50), 3),
+            "p90_ms": round(1000 * self.percentile(90), 3),
+            "p99_ms": round(1000 * self.percentile(99), 3),
+            "max_ms": round(1000 * max(self.samples, default=0.0), 3),
+        }
+
+
+def run_benchmark(
+    name: str, step: Step, clip: Sequence[np.ndarray], warmup: int = 3
+) -> Dict[str, Any]:
+    """
+    Time `step` on every frame of `clip`, after `warmup` untimed frames from
+    its start. Frames are copied first, so steps may draw on them.
+    """
+    for frame in clip[:warmup]:
+        step(frame.copy())
+    stats = LatencyStats(name)
+    for frame in clip:
+        frame = frame.copy()
+        start = time.perf_counter()
+        step(frame)
+        stats.add(time.perf_counter() - start)
+    return stats.summary()
+
+
+def gamma_step() -> Step:
+    from ghostwriter.camera.gamma import GammaCorrector
+
+    corrector = GammaCorrector()
+    dst = []
+
+    def step(frame):
+        if not dst:
+            dst.append(np.empty_like(frame))
+        return corrector.correct(frame, 0.7, dst=dst[0])
+
+    return step
+
+
+def trail_step() -> Step:
+    """`TrailEffect` alone, on the bright parts of each frame as foreground."""
+    import cv2 as cv
+
+    from ghostwriter.camera.effects import TrailEffect
+
+    effect = TrailEffect()
+
+    def step(frame):
+        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        return effect(cv.threshold(gray, 127, 255, cv.THRESH_BINARY)[1])
+
+    return step
+
+
+def motion_step() -> Step:
+    """`MotionDetector`, as a motion gate runs it on every frame."""
+    from ghostwriter.camera.motion import MotionDetector
+
+    return MotionDetector()
+
+
+def background_step(
+    algorithm: str = "MOG2",
+    scale: float = 1.0,
+    trail_size: Optional[Tuple[int, int]] = None,
+) -> Step:
+    """
+    The background example's compositing, with its subtractor. With
+    `trail_size`, the output is left at that size, as for the LEDs alone.
+    """
+    from ghostwriter.camera.effects import TrailCompositor
+    from ghostwriter.camera.pipeline import FramePacket
+    from ghostwriter.camera.subtractors import BACKGROUND_SUBTRACTION_ALGORITHMS
+
+    compositor = TrailCompositor(
+        BACKGROUND_SUBTRACTION_ALGORITHMS[algorithm](),
+        scale=scale,
+        trail_size=trail_size,
+        full_size_views=("Output",) if trail_size is None else (),
+    )
+    index = [0]
+
+    def step(frame):
+        index[0] += 1
+        return compositor(FramePacket(index[0], 0.0, {"frame": frame}))
+
+    return step
+
+
+def detect_step(policy: Optional[str] = None) -> Step:
+    """`detect_and_draw` from the smile detector, minus the display."""
+    from ghostwriter.camera.detection import (
+        CascadeDetector,
+        DetectionScheduler,
+        load_cascade,
+    )
+    from ghostwriter.camera.examples.smile_detector import detect_and_draw
+
+    cascades = [
+        load_cascade("{}/haarcascades/{}".format(DATA_DIR, name))
+        for name in (
+            "haarcascade_frontalface_alt.xml",
+            "haarcascade_eye_tree_eyeglasses.xml",
+            "haarcascade_smile.xml",
+        )
+    ]
+    scheduler = None
+    if policy is not None:
+        scheduler = DetectionScheduler(CascadeDetector(*cascades), policy=policy)
+
+    def step(frame):
+        return detect_and_draw(frame, *cascades, scheduler=scheduler)
+
+    return step
+
+
+BENCHMARKS: Dict[str, Callable[[], Step]] = {
+    "gamma": gamma_step,
+    "motion": motion_step,
+    "trail": trail_step,
+    "background": background_step,
+    "background-quarter": lambda: background_step(scale=0.25),
+    "background-small-trail": lambda: background_step(trail_size=(64, 48)),
+    "detect": detect_step,
+    "detect-roi": lambda: detect_step("roi"),
+}
+
+
+def run_benchmarks(
+    clip: Sequence[np.ndarray], stages: Iterable[str] = tuple(BENCHMARKS)
+) -> List[Dict[str, Any]]:
+    logger = logging.getLogger(__name__)
+    results = []
+    for name in stages:
+        result = run_benchmark(name, BENCHMARKS[name](), clip)
+        logger.info("%s", result)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = default_arguments(description="Benchmark the camera effects.")
+    parser.add_argument("--frames", type=int, default=100, help="Clip length.")
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=sorted(BENCHMARKS),
+        default=sorted(BENCHMARKS),
+    )
+    parser.add_argument("--json", help="Also write the results to this file.")
+    # Reproducible by default; pass --camera or --source to use a real one.
+    parser.set_defaults(camera=None)
+    args = parser.parse_args()
+    set_up_logging(args.verbose)
+
+    if args.camera is None and args.source is None:
+        args.source = ["synthetic:640x480"]
+    clip = load_clip(source_spec(args), args.frames)
+    if not clip:
+        parser.error("No frames from {}".format(source_spec(args)))
+    results = run_benchmarks(clip, args.stages)
+    header = "{:<24}{:>8}{:>10}{:>10}{:>10}{:>10}".format(
+        "stage", "fps", "mean_ms", "p50_ms", "p90_ms", "p99_ms"
+    )
+    print(header)
+    for result in results:
+        print(
+            "{stage:<24}{fps:>8}{mean_ms:>10}{p50_ms:>10}{p90_ms:>10}"
+            "{p99_ms:>10}".format(**result)
+        )
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Reusable frame buffers, so hot loops don't allocate per frame."""
+import logging
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+_Key = Tuple[str, Tuple[int, ...], np.dtype]
+
+
+class FrameBufferPool:
+    """
+    An arena of preallocated arrays keyed by name, shape and dtype.
+
+    `get` returns the same array every time it's called with the same key, so
+    it suits state that is carried from one frame to the next. `next` cycles
+    through `depth` arrays per key, for outputs that outlive the call that
+    made them: a buffer is only reused after `depth - 1` newer frames.
+
+    That doesn't bound how long another thread may hold a buffer; a consumer
+    behind a queue that drops old frames can fall any number of frames
+    behind. Anything handed to another thread has to be copied, as the
+    pipelines do for their sinks and display (see `sink_buffer`).
+    """
+
+    def __init__(self, depth: int = 4):
+        self.logger = logging.getLogger(__name__)
+        self.depth = depth
+        self.allocations = 0
+        self._buffers: Dict[_Key, np.ndarray] = {}
+        self._rings: Dict[_Key, Tuple[np.ndarray, ...]] = {}
+        self._ring_positions: Dict[_Key, int] = {}
+
+    @property
+    def nbytes(self) -> int:
+        total = sum(buffer.nbytes for buffer in self._buffers.values())
+        for ring in self._rings.values():
+            total += sum(buffer.nbytes for buffer in ring)
+        return total
+
+    def _allocate(self, key: _Key, fill_value=None) -> np.ndarray:
+        _, shape, dtype = key
+        self.allocations += 1
+        self.logger.debug("Allocating %s buffer %s", key[0], shape)
+        if fill_value is None:
+            return np.empty(shape, dtype)
+        return np.full(shape, fill_value, dtype)
+
+    def get(self, name: str, shape: Sequence[int], dtype=np.uint8) -> np.ndarray:
+        """A persistent buffer; its contents are undefined on first use."""
+        key = (name, tuple(shape), np.dtype(dtype))
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = self._allocate(key)
+        return buffer
+
+    def zeros(self, name: str, shape: Sequence[int], dtype=np.uint8) -> np.ndarray:
+        """A persistent buffer that starts out zeroed."""
+        key = (name, tuple(shape), np.dtype(dtype))
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = self._allocate(key, fill_value=0)
+        return buffer
+
+    def full(self, name: str, shape: Sequence[int], fill_value, dtype=np.uint8):
+        """A persistent buffer filled with `fill_value` when it's created."""
+        key = (name, tuple(shape), np.dtype(dtype))
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = self._allocate(key, fill_value=fill_value)
+        return buffer
+
+    def next(self, name: str, shape: Sequence[int], dtype=np.uint8) -> np.ndarray:
+        """The next buffer in a ring of `depth` buffers."""
+        key = (name, tuple(shape), np.dtype(dtype))
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = tuple(
+                self._allocate(key) for _ in range(self.depth)
+            )
+            self._ring_positions[key] = 0
+        position = self._ring_positions[key]
+        self._ring_positions[key] = (position + 1) % self.depth
+        return ring[position]
+
+    def like(self, name: str, array: np.ndarray) -> np.ndarray:
+        return self.get(name, array.shape, array.dtype)
+
+    def clear(self) -> None:
+        self._buffers.clear()
+        self._rings.clear()
+        self._ring_positions.clear()
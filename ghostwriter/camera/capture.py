@@ -0,0 +1,206 @@
+"""Camera capture settings, and always reading the newest frame.
+
+Opened with defaults, a camera runs at whatever resolution and pixel format
+the driver picks, behind a queue of four or five frames that shows up as lag
+between motion and the LEDs. `configure_capture` asks for a mode and a short
+queue, and `LatestFrameCapture` grabs continuously on its own thread, so
+`read()` decodes only the newest frame instead of the oldest queued one.
+"""
+import logging
+import sys
+import threading
+from typing import Any, Dict, NamedTuple, Optional
+
+import cv2 as cv
+
+
+class CaptureSettings(NamedTuple):
+    """What to ask a camera for; None leaves the driver's choice."""
+
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    fourcc: Optional[str] = None
+    buffer_size: Optional[int] = None
+    latest: bool = False
+
+    @property
+    def configured(self) -> bool:
+        return any(
+            value is not None
+            for value in (
+                self.width,
+                self.height,
+                self.fps,
+                self.fourcc,
+                self.buffer_size,
+            )
+        )
+
+
+def fourcc_string(code: float) -> str:
+    code = int(code)
+    return "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4))
+
+
+def capture_mode(cap) -> Dict[str, Any]:
+    """The mode `cap` actually runs in."""
+    return {
+        "width": int(cap.get(cv.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv.CAP_PROP_FRAME_HEIGHT)),
+        "fps": round(cap.get(cv.CAP_PROP_FPS), 2),
+        "fourcc": fourcc_string(cap.get(cv.CAP_PROP_FOURCC)),
+        "buffer_size": int(cap.get(cv.CAP_PROP_BUFFERSIZE)),
+    }
+
+
+def configure_capture(cap, settings: CaptureSettings) -> Dict[str, Any]:
+    """
+    Ask `cap` for `settings` and return the mode it settled on, warning about
+    anything it wouldn't do. The pixel format goes first, since it limits
+    which sizes and rates the driver offers.
+    """
+    logger = logging.getLogger(__name__)
+    requests = []
+    if settings.fourcc is not None:
+        requests.append((cv.CAP_PROP_FOURCC, cv.VideoWriter_fourcc(*settings.fourcc)))
+    if settings.width is not None:
+        requests.append((cv.CAP_PROP_FRAME_WIDTH, settings.width))
+    if settings.height is not None:
+        requests.append((cv.CAP_PROP_FRAME_HEIGHT, settings.height))
+    if settings.fps is not None:
+        requests.append((cv.CAP_PROP_FPS, settings.fps))
+    if settings.buffer_size is not None:
+        requests.append((cv.CAP_PROP_BUFFERSIZE, settings.buffer_size))
+    for prop, value in requests:
+        cap.set(prop, value)
+
+    mode = capture_mode(cap)
+    for name in ("width", "height", "fps", "fourcc", "buffer_size"):
+        wanted = getattr(settings, name)
+        if wanted is not None and mode[name] != wanted:
+            logger.warning(
+                "Asked the camera for %s %s, got %s", name, wanted, mode[name]
+            )
+    logger.info("Capture mode %s", mode)
+    return mode
+
+
+class LatestFrameCapture:
+    """
+    Wraps a `cv.VideoCapture`, grabbing on a background thread so the driver's
+    queue never fills. `read()` returns the first frame grabbed after it's
+    called, so it's never older than a frame interval.
+
+    Grabbing without decoding is cheap; only frames that are read are decoded,
+    with `retrieve()`, and only the grabbing thread touches the camera.
+    """
+
+    def __init__(self, cap, timeout: float = 2.0):
+        self.logger = logging.getLogger(__name__)
+        self.cap = cap
+        self.timeout = timeout
+        self.grabbed = 0
+        self.frames = 0
+        self._ok = True
+        self._waiting = False
+        self._frame = None
+        self._grabbing = True
+        self._release_on_exit = False
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._grab, name="capture-grab", daemon=True
+        )
+        self._thread.start()
+
+    def _grab(self) -> None:
+        try:
+            self._grab_frames()
+        finally:
+            with self._condition:
+                self._grabbing = False
+                if self._release_on_exit:
+                    self.cap.release()
+
+    def _grab_frames(self) -> None:
+        while not self._stop_event.is_set():
+            ok = self.cap.grab()
+            frame = None
+            if ok and self._waiting:
+                ok, frame = self.cap.retrieve()
+            with self._condition:
+                if not ok:
+                    self._ok = False
+                    self._condition.notify_all()
+                    return
+                self.grabbed += 1
+                if frame is not None:
+                    self._frame = frame
+                    self._waiting = False
+                    self._condition.notify_all()
+
+    def read(self):
+        with self._condition:
+            # Anything left from a read that timed out is stale by now.
+            self._frame = None
+            self._waiting = True
+            self._condition.wait_for(
+                lambda: self._frame is not None or not self._ok, self.timeout
+            )
+            frame, self._frame = self._frame, None
+            self._waiting = False
+        if frame is None:
+            return False, None
+        self.frames += 1
+        return True, frame
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def get(self, prop: int) -> float:
+        return self.cap.get(prop)
+
+    def release(self) -> None:
+        """
+        Stop grabbing and release the camera. A grab that's stuck in the
+        driver can outlast the join, and releasing the camera under it can
+        crash, so then the grabbing thread releases it when the grab returns.
+        """
+        self._stop_event.set()
+        self._thread.join(self.timeout)
+        with self._condition:
+            if self._grabbing:
+                self.logger.warning("Capture thread still grabbing; releasing later")
+                self._release_on_exit = True
+                return
+        self.cap.release()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "stage": "grab",
+            "grabbed": self.grabbed,
+            "skipped": self.grabbed - self.frames,
+        }
+
+
+def capture_reporters(caps) -> list:
+    """The `summary` of every capture in `caps` that grabs on its own thread."""
+    return [cap.summary for cap in caps if isinstance(cap, LatestFrameCapture)]
+
+
+def open_camera(index: int, settings: Optional[CaptureSettings] = None):
+    """
+    Open camera `index` with `settings`. On Linux, configured cameras are
+    opened through V4L2, which honours the pixel format and buffer size.
+    """
+    settings = CaptureSettings() if settings is None else settings
+    if settings.configured and sys.platform.startswith("linux"):
+        cap = cv.VideoCapture(index, cv.CAP_V4L2)
+    else:
+        cap = cv.VideoCapture(index)
+    if cap.isOpened():
+        configure_capture(cap, settings)
+    if settings.latest:
+        return LatestFrameCapture(cap)
+    return cap
@@ -1,35 +1,173 @@
 """Utilities for naming and loading colors."""
 import os
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import cv2 as cv
 import numpy as np
 
+from ghostwriter.cache import cached, timed
 from ghostwriter.paths import DATA_DIR
 
 COLOR_FILE = os.path.join(DATA_DIR, "xkcd", "colors.txt")
 
 _XKCD_COLORS = None
+_XKCD_STORE = None
 
 
 def _get_color_bgr(color: str) -> Tuple[int, int, int]:
     return int(color[5:7], base=16), int(color[3:5], base=16), int(color[1:3], base=16)
 
 
-def load_xkcd_colors() -> Dict[str, Tuple[int, int, int]]:
-    """Loads XKCD colors as dict, in BGR order."""
-    global _XKCD_COLORS
-    if _XKCD_COLORS is not None:
-        return _XKCD_COLORS
+def _bgr_to_lab(bgr: np.ndarray) -> np.ndarray:
+    """CIE Lab coordinates of an `(n, 3)` uint8 BGR array, as float32."""
+    pixels = (bgr.reshape(-1, 1, 3) / 255.0).astype(np.float32)
+    return cv.cvtColor(pixels, cv.COLOR_BGR2Lab).reshape(-1, 3)
 
-    with open(COLOR_FILE, "r") as fp:
+
+def _parse_color_file(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    with open(path, "r") as fp:
         color_lines = fp.readlines()
 
     # Remove commented lines (start with '#')
-    colors = (line.split("\t") for line in color_lines if not line.startswith("#"))
-    _XKCD_COLORS = {
-        color_name: _get_color_bgr(color_value) for color_name, color_value in colors
-    }
+    colors = [line.split("\t") for line in color_lines if not line.startswith("#")]
+    names = np.array([color_name for color_name, _ in colors])
+    bgr = np.array([_get_color_bgr(color_value) for _, color_value in colors], np.uint8)
+    return names, bgr
+
+
+class ColorStore:
+    """
+    Named colors as an `(n, 3)` uint8 BGR array with a name index.
+
+    Nearest-color lookups compare colors in CIE Lab space, which tracks
+    perceived difference far better than BGR distance. `nearest` goes through
+    a `2**lut_bits` cubed table of palette indices built on first use, which
+    makes mapping a whole frame a single fancy-indexing pass; `exact=True`
+    compares against every palette entry instead, which is fine for a 16x16
+    LED grid.
+    """
+
+    def __init__(self, names: Sequence[str], bgr: np.ndarray, lut_bits: int = 5):
+        self.names: List[str] = list(names)
+        self.bgr = np.ascontiguousarray(bgr, np.uint8).reshape(-1, 3)
+        self.index = {name: number for number, name in enumerate(self.names)}
+        self.lut_bits = lut_bits
+        self._lab = _bgr_to_lab(self.bgr)
+        self._lab_norms = (self._lab**2).sum(axis=1)
+        self._lut = None
+        self.source = None
+
+    @classmethod
+    def from_file(
+        cls, path: str = COLOR_FILE, use_cache: bool = True, **kwargs
+    ) -> "ColorStore":
+        """
+        Load a tab-separated name/hex color file.
+
+        With `use_cache`, the parsed names and colors (and later the nearest
+        color table) are kept as `.npy` files in the cache directory; the
+        colors are memory-mapped from there on the next start.
+        """
+        if not use_cache:
+            return cls(*_parse_color_file(path), **kwargs)
+
+        parsed = []
+
+        def parse():
+            if not parsed:
+                parsed.extend(_parse_color_file(path))
+            return parsed
+
+        names_path = cached(path, "names.npy", lambda p: np.save(p, parse()[0]))
+        bgr_path = cached(path, "bgr.npy", lambda p: np.save(p, parse()[1]))
+        store = cls(
+            np.load(names_path).tolist(), np.load(bgr_path, mmap_mode="r"), **kwargs
+        )
+        store.source = path
+        return store
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, color_name: str) -> bool:
+        return color_name in self.index
+
+    def __getitem__(self, color_name: str) -> Tuple[int, int, int]:
+        return tuple(int(c) for c in self.bgr[self.index[color_name]])
+
+    def as_dict(self) -> Dict[str, Tuple[int, int, int]]:
+        return {name: self[name] for name in self.names}
+
+    def solid_like(self, matrix: np.ndarray, color_name: str) -> np.ndarray:
+        """A read-only solid color view shaped like `matrix`, without a copy."""
+        color = self.bgr[self.index[color_name]]
+        return np.broadcast_to(color.astype(matrix.dtype), matrix.shape)
+
+    def nearest_exact(self, image: np.ndarray, chunk: int = 4096) -> np.ndarray:
+        """Palette index of every pixel, comparing against every color."""
+        lab = _bgr_to_lab(np.asarray(image, np.uint8).reshape(-1, 3))
+        indices = np.empty(len(lab), np.uint16)
+        for start in range(0, len(lab), chunk):
+            block = lab[start : start + chunk]
+            # |a - b|^2 = |a|^2 - 2 a.b + |b|^2; |a|^2 doesn't change the argmin.
+            distances = self._lab_norms - 2 * block @ self._lab.T
+            indices[start : start + chunk] = distances.argmin(axis=1)
+        return indices.reshape(image.shape[:-1])
+
+    @property
+    def lut(self) -> np.ndarray:
+        """Palette indices for the centers of a `2**lut_bits` cubed BGR grid."""
+        if self._lut is None and self.source is not None:
+            lut_path = cached(
+                self.source,
+                "lut{}.npy".format(self.lut_bits),
+                lambda p: np.save(p, self._build_lut()),
+            )
+            self._lut = np.load(lut_path, mmap_mode="r")
+        elif self._lut is None:
+            self._lut = self._build_lut()
+        return self._lut
+
+    def _build_lut(self) -> np.ndarray:
+        size = 1 << self.lut_bits
+        step = 256 // size
+        centers = np.arange(size) * step + step // 2
+        grid = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), -1)
+        return self.nearest_exact(grid.reshape(-1, 3)).reshape(size, size, size)
+
+    def nearest(self, image: np.ndarray, exact: bool = False) -> np.ndarray:
+        """Palette index of every pixel of a BGR image."""
+        if exact:
+            return self.nearest_exact(image)
+        shift = 8 - self.lut_bits
+        bins = np.right_shift(image, shift)
+        return self.lut[bins[..., 0], bins[..., 1], bins[..., 2]]
+
+    def quantize(
+        self, image: np.ndarray, exact: bool = False, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """`image` with every pixel replaced by its nearest named color."""
+        return np.take(self.bgr, self.nearest(image, exact), axis=0, out=out)
+
+    def names_of(self, image: np.ndarray, exact: bool = True) -> np.ndarray:
+        """The name of every pixel's nearest color, e.g. for an LED grid."""
+        return np.array(self.names, dtype=object)[self.nearest(image, exact)]
+
+
+def load_xkcd_store() -> ColorStore:
+    """Loads XKCD colors as a `ColorStore`."""
+    global _XKCD_STORE
+    if _XKCD_STORE is None:
+        with timed("load xkcd colors"):
+            _XKCD_STORE = ColorStore.from_file(COLOR_FILE)
+    return _XKCD_STORE
+
+
+def load_xkcd_colors() -> Dict[str, Tuple[int, int, int]]:
+    """Loads XKCD colors as dict, in BGR order."""
+    global _XKCD_COLORS
+    if _XKCD_COLORS is None:
+        _XKCD_COLORS = load_xkcd_store().as_dict()
     return _XKCD_COLORS
 
 
@@ -40,6 +178,11 @@ def xkcd_color_matrix_like(matrix: np.ndarray, color_name: str) -> np.ndarray:
     return np.full_like(matrix, color)  # noqa
 
 
+def xkcd_color_view_like(matrix: np.ndarray, color_name: str) -> np.ndarray:
+    """Like `xkcd_color_matrix_like`, but a read-only view with no allocation."""
+    return load_xkcd_store().solid_like(matrix, color_name)
+
+
 def make_gray(frame: np.ndarray) -> np.ndarray:
     """Make an OpenCV BGR frame Gray."""
     frame_gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
@@ -0,0 +1,444 @@
+"""Face, eye and smile detection with region-of-interest tracking.
+
+A full-frame Haar cascade scan is by far the most expensive thing we do per
+frame. `DetectionScheduler` only runs it every N frames (or when every face
+has been lost); in between, each face is followed with a cheap downscaled
+template match and, depending on the policy, re-detected in a padded window
+around where the tracker put it. Eyes and smiles are only searched for in the
+parts of the face where they can be. Any scan can run on a downscaled
+pyramid level, chosen automatically from the sizes of the faces we see.
+"""
+import logging
+import os
+import time
+from collections import deque
+from functools import partial
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.cache import cached, timed
+from ghostwriter.metrics import METRICS
+
+Rect = Tuple[int, int, int, int]
+
+# Full-frame scan every frame; ROI re-detection between full scans; or only
+# the template tracker between full scans.
+DETECTION_POLICIES = ("full", "roi", "track")
+
+
+def _copy_file_node(storage, name: str, node) -> None:
+    if node.isMap():
+        storage.startWriteStruct(name, cv.FileNode_MAP)
+        for key in node.keys():
+            _copy_file_node(storage, key, node.getNode(key))
+        storage.endWriteStruct()
+    elif node.isSeq():
+        items = [node.at(i) for i in range(node.size())]
+        flags = cv.FileNode_SEQ
+        if all(item.isInt() or item.isReal() for item in items):
+            flags |= cv.FileNode_FLOW
+        storage.startWriteStruct(name, flags)
+        for item in items:
+            _copy_file_node(storage, "", item)
+        storage.endWriteStruct()
+    elif node.isInt():
+        storage.write(name, int(node.real()))
+    elif node.isReal():
+        storage.write(name, node.real())
+    elif node.isString():
+        storage.write(name, node.string())
+
+
+def _write_cascade(source: str, destination: str) -> None:
+    """Re-serialize a cascade in the format implied by `destination`."""
+    reader = cv.FileStorage(source, cv.FILE_STORAGE_READ)
+    writer = cv.FileStorage(destination, cv.FILE_STORAGE_WRITE)
+    root = reader.root()
+    for key in root.keys():
+        _copy_file_node(writer, key, root.getNode(key))
+    writer.release()
+    reader.release()
+
+
+def load_cascade(path: str, use_cache: bool = True):
+    """
+    Load a cascade classifier, from the cache when possible.
+
+    The cached copy is gzipped YAML: OpenCV parses it a little faster than the
+    commented XML we ship, and it's a sixth of the size to read off an SD card.
+    """
+    logger = logging.getLogger(__name__)
+    path = cv.samples.findFile(path)
+    with timed("load {}".format(os.path.basename(path))):
+        cascade = cv.CascadeClassifier()
+        if use_cache:
+            try:
+                cached_path = cached(path, "yml.gz", partial(_write_cascade, path))
+                if cascade.load(cached_path):
+                    return cascade
+                logger.warning("Could not load cached %s; using the original", path)
+            except (OSError, cv.error):
+                logger.exception("Could not cache %s", path)
+        if not cascade.load(path):
+            raise IOError("Error loading cascade {}".format(path))
+    return cascade
+
+
+class Detection(NamedTuple):
+    """A face and the features found in it, all in frame coordinates."""
+
+    face: Rect
+    eyes: List[Rect]
+    smiles: List[Rect]
+
+
+def _pad(rect: Rect, padding: float, shape: Tuple[int, ...]) -> Rect:
+    """Grow `rect` by `padding` times its size on each side, clipped."""
+    x, y, w, h = rect
+    dx, dy = int(w * padding), int(h * padding)
+    x0, y0 = max(x - dx, 0), max(y - dy, 0)
+    x1, y1 = min(x + w + dx, shape[1]), min(y + h + dy, shape[0])
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _offset(rects, dx: int, dy: int) -> List[Rect]:
+    return [(int(x + dx), int(y + dy), int(w), int(h)) for (x, y, w, h) in rects]
+
+
+def _scale_size(size: Optional[Tuple[int, int]], scale: float):
+    if size is None:
+        return None
+    return int(size[0] * scale), int(size[1] * scale)
+
+
+def detect_scaled(
+    cascade,
+    image: np.ndarray,
+    scale: float = 1.0,
+    minSize: Optional[Tuple[int, int]] = None,
+    maxSize: Optional[Tuple[int, int]] = None,
+    **kwargs
+) -> List[Rect]:
+    """
+    Run `cascade` on `image` shrunk by `scale` and map the hits back.
+
+    `minSize` and `maxSize` are in the coordinates of `image`. Scanning half
+    the resolution costs roughly a quarter as much, at the price of losing
+    objects that end up smaller than the cascade's window.
+    """
+    if scale < 1.0:
+        size = int(image.shape[1] * scale), int(image.shape[0] * scale)
+        if min(size) < 1:
+            return []
+        image = cv.resize(image, size, interpolation=cv.INTER_AREA)
+    minSize, maxSize = _scale_size(minSize, scale), _scale_size(maxSize, scale)
+    if minSize is not None:
+        kwargs["minSize"] = minSize
+    if maxSize is not None:
+        kwargs["maxSize"] = maxSize
+    rects = cascade.detectMultiScale(image, **kwargs)
+    return [
+        (int(x / scale), int(y / scale), int(w / scale), int(h / scale))
+        for (x, y, w, h) in rects
+    ]
+
+
+class ScaleSelector:
+    """
+    Picks the coarsest pyramid level at which the faces we see stay findable.
+
+    The smallest recently observed face must still be `min_face` pixels wide
+    at the chosen level. After `patience` full scans without a face, the
+    selector steps one level finer in case faces have become too small.
+    """
+
+    def __init__(
+        self,
+        levels: Tuple[float, ...] = (1.0, 0.5, 0.25),
+        min_face: int = 48,
+        history: int = 30,
+        patience: int = 5,
+    ):
+        self.levels = tuple(sorted(levels, reverse=True))
+        self.min_face = min_face
+        self.patience = patience
+        self._widths = deque(maxlen=history)
+        self._misses = 0
+        self._index = 0
+
+    @property
+    def scale(self) -> float:
+        return self.levels[self._index]
+
+    def observe(self, faces: List[Rect]) -> None:
+        if not faces:
+            self._misses += 1
+            if self._misses >= self.patience and self._index > 0:
+                self._index -= 1
+                self._misses = 0
+                self._widths.clear()
+            return
+        self._misses = 0
+        self._widths.extend(w for (_, _, w, _) in faces)
+        smallest = min(self._widths)
+        index = 0
+        for candidate, level in enumerate(self.levels):
+            if smallest * level >= self.min_face:
+                index = candidate
+        self._index = index
+
+
+class CascadeDetector:
+    """
+    Runs the face cascade and the eye/smile cascades within each face.
+
+    Faces are searched for at `scale` times the frame resolution, or at a
+    level picked by `scale_selector`. Eyes and smiles are searched for at the
+    same level when the face is at least `min_feature_face` pixels wide there,
+    and at full resolution otherwise: eyes are about a fifth of a face wide,
+    and the eye cascade's window is 20 pixels, so smaller faces lose them.
+    All returned rectangles are in full-frame coordinates.
+    """
+
+    def __init__(
+        self,
+        face_cascade,
+        eyes_cascade,
+        smile_cascade,
+        eyes_region: Tuple[float, float] = (0.0, 0.5),
+        smile_region: Tuple[float, float] = (2.0 / 3.0, 1.0),
+        scale: float = 1.0,
+        scale_selector: Optional[ScaleSelector] = None,
+        scale_factor: float = 1.1,
+        min_face: Optional[Tuple[int, int]] = None,
+        min_feature_face: int = 100,
+    ):
+        self.face_cascade = face_cascade
+        self.eyes_cascade = eyes_cascade
+        self.smile_cascade = smile_cascade
+        self.eyes_region = eyes_region
+        self.smile_region = smile_region
+        self.scale_selector = scale_selector
+        self.scale_factor = scale_factor
+        self.min_face = min_face
+        self.min_feature_face = min_feature_face
+        self._scale = scale
+
+    @property
+    def scale(self) -> float:
+        if self.scale_selector is not None:
+            return self.scale_selector.scale
+        return self._scale
+
+    @scale.setter
+    def scale(self, value: float) -> None:
+        self._scale = value
+
+    def detect_faces(self, gray: np.ndarray, roi: Optional[Rect] = None, **kwargs):
+        """Faces in `gray`, or only within `roi`, in frame coordinates."""
+        kwargs.setdefault("scaleFactor", self.scale_factor)
+        kwargs.setdefault("minSize", self.min_face)
+        if roi is None:
+            faces = detect_scaled(self.face_cascade, gray, self.scale, **kwargs)
+            if self.scale_selector is not None:
+                self.scale_selector.observe(faces)
+            return faces
+        x, y, w, h = roi
+        faces = detect_scaled(
+            self.face_cascade, gray[y : y + h, x : x + w], self.scale, **kwargs
+        )
+        return _offset(faces, x, y)
+
+    def _detect_in_band(self, cascade, gray, face, band, **kwargs) -> List[Rect]:
+        x, y, w, h = face
+        top, bottom = y + int(h * band[0]), y + int(h * band[1])
+        region = gray[top:bottom, x : x + w]
+        if region.size == 0:
+            return []
+        scale = self.scale if w * self.scale >= self.min_feature_face else 1.0
+        return _offset(detect_scaled(cascade, region, scale, **kwargs), x, top)
+
+    def detect_features(self, gray: np.ndarray, face: Rect) -> Detection:
+        eyes = self._detect_in_band(self.eyes_cascade, gray, face, self.eyes_region)
+        smiles = self._detect_in_band(
+            self.smile_cascade,
+            gray,
+            face,
+            self.smile_region,
+            scaleFactor=1.8,
+            minNeighbors=20,
+        )
+        return Detection(face, eyes, smiles)
+
+    @METRICS.timed("detection")
+    def detect(self, gray: np.ndarray) -> List[Detection]:
+        return [self.detect_features(gray, face) for face in self.detect_faces(gray)]
+
+
+class _Track:
+    """A face followed by matching a small template of its last sighting."""
+
+    TEMPLATE_WIDTH = 24
+
+    def __init__(self, gray: np.ndarray, face: Rect):
+        self.misses = 0
+        self.update(gray, face)
+
+    def update(self, gray: np.ndarray, face: Rect) -> None:
+        x, y, w, h = face
+        self.face = face
+        self.scale = min(1.0, self.TEMPLATE_WIDTH / float(w))
+        self.template = cv.resize(
+            gray[y : y + h, x : x + w], None, fx=self.scale, fy=self.scale
+        )
+
+    def predict(self, gray: np.ndarray, padding: float, threshold: float) -> bool:
+        """Move the track to the best template match nearby; False if lost."""
+        x, y, w, h = _pad(self.face, padding, gray.shape)
+        window = cv.resize(
+            gray[y : y + h, x : x + w], None, fx=self.scale, fy=self.scale
+        )
+        template_h, template_w = self.template.shape
+        if window.shape[0] < template_h or window.shape[1] < template_w:
+            return False
+        scores = cv.matchTemplate(window, self.template, cv.TM_CCOEFF_NORMED)
+        _, score, _, (match_x, match_y) = cv.minMaxLoc(scores)
+        if score < threshold:
+            return False
+        _, _, face_w, face_h = self.face
+        self.face = (
+            x + int(match_x / self.scale),
+            y + int(match_y / self.scale),
+            face_w,
+            face_h,
+        )
+        return True
+
+
+class DetectionStats:
+    """Counts of scans and faces, reported per second."""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.frames = 0
+        self.full_scans = 0
+        self.roi_scans = 0
+        self.faces = 0
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        return {
+            "stage": "detection",
+            "frames": self.frames,
+            "full_scans": self.full_scans,
+            "roi_scans": self.roi_scans,
+            "detections_per_second": round(self.faces / elapsed, 1),
+            "fps": round(self.frames / elapsed, 1),
+        }
+
+
+class DetectionScheduler:
+    """
+    Decides per frame between a full scan and tracking the known faces.
+
+    :param policy: One of `DETECTION_POLICIES`.
+    :param interval: Run a full-frame scan at least every `interval` frames.
+    :param padding: How far around a face to search, as a fraction of its size.
+    :param max_misses: ROI scans a face may miss before its track is dropped.
+    :param match_threshold: Minimum normalized template match to keep a track.
+    """
+
+    def __init__(
+        self,
+        detector: CascadeDetector,
+        policy: str = "roi",
+        interval: int = 10,
+        padding: float = 0.25,
+        max_misses: int = 2,
+        match_threshold: float = 0.5,
+    ):
+        if policy not in DETECTION_POLICIES:
+            raise ValueError("Unknown detection policy {!r}".format(policy))
+        self.logger = logging.getLogger(__name__)
+        self.detector = detector
+        self.policy = policy
+        self.interval = max(int(interval), 1)
+        self.padding = padding
+        self.max_misses = max_misses
+        self.match_threshold = match_threshold
+        self.stats = DetectionStats()
+        self._tracks: List[_Track] = []
+        self._since_full_scan = None
+
+    def summary(self) -> Dict[str, Any]:
+        summary = self.stats.summary()
+        summary["scale"] = self.detector.scale
+        return summary
+
+    def _full_scan(self, gray: np.ndarray) -> List[Rect]:
+        self.stats.full_scans += 1
+        self._since_full_scan = 0
+        faces = self.detector.detect_faces(gray)
+        self._tracks = [_Track(gray, face) for face in faces]
+        return faces
+
+    def _rescan(self, gray: np.ndarray, track: _Track) -> bool:
+        """Look for the face again close to where the tracker put it."""
+        self.stats.roi_scans += 1
+        _, _, w, h = track.face
+        roi = _pad(track.face, self.padding, gray.shape)
+        faces = self.detector.detect_faces(
+            gray,
+            roi=roi,
+            minSize=(int(0.7 * w), int(0.7 * h)),
+            maxSize=(int(1.4 * w) + 1, int(1.4 * h) + 1),
+        )
+        if not faces:
+            track.misses += 1
+            return track.misses <= self.max_misses
+        track_x, track_y = track.face[0] + w / 2.0, track.face[1] + h / 2.0
+        nearest = min(
+            faces,
+            key=lambda f: (f[0] + f[2] / 2.0 - track_x) ** 2
+            + (f[1] + f[3] / 2.0 - track_y) ** 2,
+        )
+        track.misses = 0
+        track.update(gray, nearest)
+        return True
+
+    def _track(self, gray: np.ndarray) -> List[Rect]:
+        tracks = []
+        for track in self._tracks:
+            if not track.predict(gray, self.padding, self.match_threshold):
+                continue
+            if self.policy == "roi" and not self._rescan(gray, track):
+                continue
+            tracks.append(track)
+        self._tracks = tracks
+        self._since_full_scan += 1
+        return [track.face for track in tracks]
+
+    def faces(self, gray: np.ndarray) -> List[Rect]:
+        if (
+            self.policy == "full"
+            or self._since_full_scan is None
+            or self._since_full_scan + 1 >= self.interval
+        ):
+            return self._full_scan(gray)
+        if not self._tracks:
+            self._since_full_scan += 1
+            return []
+        faces = self._track(gray)
+        if not faces:
+            self.logger.debug("Lost every track; rescanning the full frame.")
+            return self._full_scan(gray)
+        return faces
+
+    @METRICS.timed("detection")
+    def __call__(self, gray: np.ndarray) -> List[Detection]:
+        faces = self.faces(gray)
+        self.stats.frames += 1
+        self.stats.faces += len(faces)
+        return [self.detector.detect_features(gray, face) for face in faces]
@@ -0,0 +1,212 @@
+"""Frame effects for the camera examples."""
+from typing import Iterable, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.buffers import FrameBufferPool
+from ghostwriter.camera.colors import load_xkcd_colors
+from ghostwriter.camera.pipeline import FramePacket
+from ghostwriter.metrics import METRICS
+from ghostwriter.pixel.layout import downsample
+
+TRAIL_KERNEL = np.array(
+    [
+        [2.0, 0.5, 0.5, -1.0],
+        [0.5, -1, 1, 0.5],
+        [0, 1, -1, 0.5],
+        [1.0, 0.5, 0.5, 2.0],
+    ],
+    np.float32,
+)
+TRAIL_KERNEL = 0.9 * TRAIL_KERNEL / TRAIL_KERNEL.sum()
+
+
+class TrailEffect:
+    """
+    Paints a foreground mask hot pink over a decaying neon green trail.
+
+    The trail is one channel of green intensity rather than a color image, so
+    it's filtered on a third of the data, and the output is colored in a
+    palette lookup. Each pixel gets a code: the trail's intensity, up
+    to `LAST_PINK - 1`, then `LAST_PINK` for black where only the last frame
+    was foreground and `PINK` where this one is. That's six single-channel
+    passes and two color ones, where `TrailCompositor` used to make a dozen
+    color passes. The result differs from its per-channel trail only by
+    rounding, and where a subtractor marks shadows: they count as
+    foreground, where the old trail wrapped around.
+
+    Buffers come from `pool`, like `TrailCompositor`'s; the output is
+    overwritten `pool.depth` frames later, so copy it to keep it.
+    """
+
+    LAST_PINK = 254
+    PINK = 255
+
+    def __init__(
+        self,
+        pool: Optional[FrameBufferPool] = None,
+        kernel: np.ndarray = TRAIL_KERNEL,
+        pink_color: Optional[Tuple[int, int, int]] = None,
+        green_color: Optional[Tuple[int, int, int]] = None,
+    ):
+        self.pool = FrameBufferPool() if pool is None else pool
+        self.kernel = kernel
+        colors = load_xkcd_colors()
+        pink = colors["hot pink"] if pink_color is None else pink_color
+        green = colors["neon green"] if green_color is None else green_color
+        levels = np.arange(self.LAST_PINK, dtype=np.float32)[:, np.newaxis] / 255
+        self.palette = np.zeros((256, 3), np.uint8)
+        self.palette[: self.LAST_PINK] = np.round(levels * green)
+        self.palette[self.PINK] = pink
+        self._lut = self.palette.reshape(256, 1, 3)
+        self.foreground = None
+
+    @METRICS.timed("composite")
+    def __call__(self, foreground_mask: np.ndarray) -> np.ndarray:
+        """The output for a mask, where any nonzero pixel is foreground."""
+        pool = self.pool
+        shape = foreground_mask.shape[:2]
+        trail = pool.zeros("trail", shape)
+        last = pool.zeros("last_foreground", shape)
+        # Shadows, which some subtractors mark 127, count as foreground.
+        _, foreground = cv.threshold(
+            foreground_mask,
+            0,
+            255,
+            cv.THRESH_BINARY,
+            dst=pool.next("foreground", shape),
+        )
+        # New foreground joins the trail at full intensity, then it all decays.
+        scratch = np.maximum(trail, foreground, out=pool.get("trail_scratch", shape))
+        cv.filter2D(scratch, -1, self.kernel, dst=trail)
+
+        code = np.minimum(trail, self.LAST_PINK - 1, out=pool.get("code", shape))
+        np.maximum(code, last, out=code)
+        np.maximum(code, foreground, out=code)
+        np.bitwise_and(foreground, self.LAST_PINK, out=last)
+        self.foreground = foreground
+        # Spread the codes over three channels and look each up in its own.
+        output = cv.cvtColor(
+            code, cv.COLOR_GRAY2BGR, dst=pool.next("output", shape + (3,))
+        )
+        return cv.LUT(output, self._lut, dst=output)
+
+
+class TrailCompositor:
+    """
+    Paints the foreground hot pink over a decaying neon green trail, using a
+    background subtractor for the mask and a `TrailEffect` for the painting.
+
+    Every intermediate lives in a `FrameBufferPool` and is written with
+    `dst=`/`out=`, so once the first frame has sized the pool, steady-state
+    frames allocate no frame-sized arrays. The views in the returned packet are
+    pooled too, and overwritten `pool.depth` frames later; the pipelines hand
+    sinks and the display copies (see `sink_buffer`).
+
+    :param led_downsample: How "OutputDown" is shrunk to `led_size`; see
+        `ghostwriter.pixel.layout.downsample`.
+    :param scale: Subtract the background and composite on the frame shrunk
+        by this factor, which cuts their cost by its square. The LEDs only
+        need `led_size` pixels, and the trail spreads that much further.
+    :param full_size_views: Views scaled back up to the frame's size when
+        they're smaller, for recording or display; the rest stay small.
+    :param trail_size: Keep the trail at this (width, height), e.g. a few
+        times `led_size`, instead of the processing size, so compositing
+        costs the same whatever the camera's resolution. "Output" and
+        "Foreground Mask" come out at this size; leave them out of
+        `full_size_views` and have the sinks that show them enlarge them,
+        with `enlarge_views`, only for the frames they show.
+    :param background_view: Include the subtractor's "Background image".
+        Otherwise it's only fetched by `background_image()`.
+    """
+
+    def __init__(
+        self,
+        back_sub,
+        learning_rate: float = 0.1,
+        led_size: Tuple[int, int] = (16, 16),
+        pool: Optional[FrameBufferPool] = None,
+        led_downsample: str = "nearest",
+        scale: float = 1.0,
+        full_size_views: Iterable[str] = ("Output",),
+        trail_size: Optional[Tuple[int, int]] = None,
+        background_view: bool = False,
+    ):
+        if not 0 < scale <= 1:
+            raise ValueError("scale must be in (0, 1], not {}".format(scale))
+        self.back_sub = back_sub
+        self.learning_rate = learning_rate
+        self.scale = scale
+        self.full_size_views = frozenset(full_size_views)
+        self.background_view = background_view
+        self._shape = None
+        self.led_size = led_size
+        self.led_downsample = led_downsample
+        self.pool = FrameBufferPool() if pool is None else pool
+        self.trail_size = None if trail_size is None else tuple(trail_size)
+        self.effect = TrailEffect(self.pool)
+
+    def __call__(self, packet: FramePacket) -> Optional[FramePacket]:
+        full_frame = packet.images["frame"]
+        pool = self.pool
+        frame = self._shrink(full_frame)
+        shape = self._shape = frame.shape
+        with METRICS.timer("background"):
+            foreground_mask = self.back_sub.apply(
+                frame,
+                fgmask=pool.get("foreground_mask", shape[:2]),
+                learningRate=self.learning_rate,
+            )
+        if self.trail_size is not None:
+            foreground_mask = cv.resize(
+                foreground_mask,
+                self.trail_size,
+                dst=pool.get("trail_mask", self.trail_size[::-1]),
+                interpolation=cv.INTER_AREA,
+            )
+        output = self.effect(foreground_mask)
+
+        output_down = downsample(
+            output,
+            self.led_size,
+            self.led_downsample,
+            dst=pool.next("output_down", self.led_size[::-1] + shape[2:]),
+        )
+        images = {
+            "Frame": full_frame,
+            "Foreground Mask": self.effect.foreground,
+            "Output": output,
+        }
+        if self.background_view:
+            background_image = self.background_image()
+            if background_image is not None:
+                images["Background image"] = background_image
+        for view in self.full_size_views.intersection(images):
+            if images[view].shape[:2] != full_frame.shape[:2]:
+                images[view] = self._enlarge(view, images[view], full_frame.shape)
+        images["OutputDown"] = output_down
+        return packet._replace(images=images)
+
+    def background_image(self) -> Optional[np.ndarray]:
+        """The subtractor's background model, at the processing size."""
+        if self._shape is None:
+            return None
+        try:
+            return self.back_sub.getBackgroundImage(
+                backgroundImage=self.pool.next("background_image", self._shape)
+            )
+        except cv.error:
+            return None
+
+    def _shrink(self, frame: np.ndarray) -> np.ndarray:
+        if self.scale == 1:
+            return frame
+        height, width = frame.shape[:2]
+        size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+        small = self.pool.get("small_frame", size[::-1] + frame.shape[2:])
+        return cv.resize(frame, size, dst=small, interpolation=cv.INTER_AREA)
+
+    def _enlarge(self, view: str, image: np.ndarray, shape) -> np.ndarray:
+        full = self.pool.next(view, shape[:2] + image.shape[2:])
+        return cv.resize(image, shape[1::-1], dst=full, interpolation=cv.INTER_NEAREST)
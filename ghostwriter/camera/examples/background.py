@@ -1,118 +1,309 @@
 import logging
+import os
 
 import cv2 as cv
 import numpy as np
 
-from ghostwriter.camera.colors import xkcd_color_matrix_like
-from ghostwriter.camera.keymap import QUIT
-from ghostwriter.utils import default_arguments, set_up_logging
+from ghostwriter.cache import log_startup_times, timed
+from ghostwriter.camera.capture import capture_reporters
+from ghostwriter.camera.effects import TrailCompositor
+from ghostwriter.camera.gif import GifSink
+from ghostwriter.camera.motion import gate_process
+from ghostwriter.camera.pipeline import EnlargedSink, LedSink, Pipeline
+from ghostwriter.camera.multicamera import MultiCameraPipeline
+from ghostwriter.camera.preview import build_camera_previews, build_preview
+from ghostwriter.camera.sources import open_source
+from ghostwriter.camera.recording import RecordingSink
+from ghostwriter.camera.subtractors import (
+    BACKGROUND_SUBTRACTION_ALGORITHMS,
+    benchmark_subtractors,
+    choose_subtractor,
+    format_results,
+)
+from ghostwriter.metrics import profile_reporters
+from ghostwriter.pixel.framebuffer import LedFramebuffer, NeoPixelBackend
+from ghostwriter.pixel.layout import DOWNSAMPLING, PanelLayout, TiledLayout
+from ghostwriter.utils import (
+    capture_settings,
+    default_arguments,
+    motion_gate,
+    set_up_logging,
+    source_specs,
+)
 
-BACKGROUND_SUBTRACTION_ALGORITHMS = {
-    "MOG2": cv.createBackgroundSubtractorMOG2,
-    "KNN": cv.createBackgroundSubtractorKNN,
-    "CNT": cv.bgsegm.createBackgroundSubtractorCNT,
-    "GMG": cv.bgsegm.createBackgroundSubtractorGMG,  # Fucking great
-    "GSOC": cv.bgsegm.createBackgroundSubtractorGSOC,  # Meh
-    "LSBP": cv.bgsegm.createBackgroundSubtractorLSBP,  # Interesting
-    "MOG": cv.bgsegm.createBackgroundSubtractorMOG,
-}
+
+def sample_frames(cap, count: int) -> list:
+    """Up to `count` frames from `cap`, to try the subtractors on."""
+    frames = []
+    while len(frames) < count:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    return frames
+
+
+def led_layout(args):
+    """The wiring of the LED wall given by --led-panel and --led-tiles."""
+    if args.led_panel is None:
+        return None
+    panel = PanelLayout(*args.led_panel)
+    columns, rows = args.led_tiles
+    if columns * rows == 1:
+        return panel
+    return TiledLayout(panel, columns, rows)
+
+
+def led_sink(layout, brightness: float) -> LedSink:
+    """Shows "OutputDown" on a WS2812 strip wired as `layout`, on GPIO 18."""
+    # Only importable on the Pi.
+    from adafruit_blinka.board.raspberrypi.raspi_40pin import pin
+    import neopixel
+
+    pixels = neopixel.NeoPixel(pin.D18, layout.count, auto_write=False)
+    width, height = layout.size
+    framebuffer = LedFramebuffer(
+        NeoPixelBackend(pixels),
+        width=width,
+        height=height,
+        brightness=brightness,
+        input_order="BGR",
+        index=layout.index,
+    )
+    return LedSink(framebuffer.show)
 
 
 def main():
     parser = default_arguments(description="Background substraction methods.")
     parser.add_argument(
         "--algorithm",
-        choices=sorted(BACKGROUND_SUBTRACTION_ALGORITHMS),
+        choices=sorted(BACKGROUND_SUBTRACTION_ALGORITHMS) + ["auto"],
         default="GMG",
+        help="auto picks the best one that keeps up with --target-fps.",
+    )
+    parser.add_argument(
+        "--target-fps",
+        type=float,
+        default=12.0,
+        help="Frame rate the auto algorithm has to keep up with.",
+    )
+    parser.add_argument(
+        "--benchmark-algorithms",
+        action="store_true",
+        help="Time every algorithm on frames from the source, then exit.",
+    )
+    parser.add_argument(
+        "--benchmark-frames",
+        type=int,
+        default=60,
+        help="Frames to try each algorithm on.",
+    )
+    parser.add_argument(
+        "--benchmark-scales",
+        type=float,
+        nargs="+",
+        default=[1.0, 0.5, 0.25],
+        help="Resolutions to benchmark at, as fractions of the source's.",
+    )
+    parser.add_argument(
+        "--led-downsample",
+        choices=sorted(DOWNSAMPLING),
+        default="nearest",
+        help="Pick one pixel per LED (nearest) or average the pixels it covers "
+        "(area).",
+    )
+    parser.add_argument(
+        "--led-panel",
+        type=int,
+        nargs=2,
+        metavar=("WIDTH", "HEIGHT"),
+        help="Show the output on a serpentine WS2812 panel of this many LEDs "
+        "on GPIO 18; with several cameras, the first camera's.",
+    )
+    parser.add_argument(
+        "--led-tiles",
+        type=int,
+        nargs=2,
+        default=[1, 1],
+        metavar=("COLUMNS", "ROWS"),
+        help="The --led-panel panels are tiled this many across and down, "
+        "chained row by row.",
+    )
+    parser.add_argument(
+        "--led-brightness",
+        type=float,
+        default=0.05,
+        help="LED brightness, from 0 to 1.",
+    )
+    parser.add_argument(
+        "--process-scale",
+        type=float,
+        default=1.0,
+        help="Subtract the background at this fraction of the capture size.",
+    )
+    parser.add_argument(
+        "--trail-size",
+        type=int,
+        nargs=2,
+        metavar=("WIDTH", "HEIGHT"),
+        help="Keep the trail at this size, e.g. 64 64, and only enlarge the "
+        "output for the frames that are shown or recorded.",
+    )
+    parser.add_argument(
+        "--show-background",
+        action="store_true",
+        help="Also show the subtractor's background image.",
+    )
+    parser.add_argument(
+        "--record-dir", default="recordings", help="Where to save the output video."
+    )
+    parser.add_argument("--gif", help="Also write the output to this GIF file.")
+    parser.add_argument(
+        "--segment-seconds",
+        type=float,
+        default=300.0,
+        help="Start a new video file after this many seconds.",
+    )
+    parser.add_argument(
+        "--max-segments",
+        type=int,
+        default=12,
+        help="Keep only this many of the newest video files.",
     )
 
     args = parser.parse_args()
     set_up_logging(args.verbose)
     logger = logging.getLogger(__name__)
 
-    back_sub = BACKGROUND_SUBTRACTION_ALGORITHMS[args.algorithm]()
-
-    camera_device = args.camera
-    # -- 2. Read the video stream
-    cap = cv.VideoCapture(camera_device)
-    if not cap.isOpened:
+    # -- 2. Read the video streams
+    specs = source_specs(args)
+    settings = capture_settings(args)
+    with timed("open camera"):
+        caps = [open_source(spec, settings=settings) for spec in specs]
+    if not all(cap.isOpened() for cap in caps):
         logger.error("Error opening video capture")
         return
 
-    ret, frame = cap.read()
-    codec = cv.VideoWriter_fourcc(*"MJPG")
-    video_writer = cv.VideoWriter(
-        filename="outpy.avi",
-        apiPreference=0,
-        fourcc=codec,
-        fps=12.0,
-        frameSize=frame.shape[:2][::-1],
-        isColor=1,
-    )
-    writing_started = False
-    assert video_writer.isOpened()
-    output = np.zeros_like(frame)
-
-    output_green = output.copy()
-    last_pink = output.copy()
-    pink = xkcd_color_matrix_like(frame, color_name="hot pink")
-    green = xkcd_color_matrix_like(frame, color_name="neon green")
-
-    kernel = np.array(
-        [
-            [2.0, 0.5, 0.5, -1.0],
-            [0.5, -1, 1, 0.5],
-            [0, 1, -1, 0.5],
-            [1.0, 0.5, 0.5, 2.0],
-        ],
-        np.float32,
-    )
-    kernel = 0.9 * kernel / kernel.sum()
-    cv.namedWindow("OutputDown", cv.WINDOW_NORMAL)
-    cv.resizeWindow("OutputDown", 400, 400)
-    while cv.waitKey(33) != QUIT and frame is not None:
-        ret, frame = cap.read()
-        foreground_mask = back_sub.apply(frame, learningRate=0.1)
-        try:
-            background_image = back_sub.getBackgroundImage()
-        except cv.error:
-            background_image = None
-        background_mask = ~foreground_mask
-        pink_mask = cv.bitwise_and(pink, pink, mask=foreground_mask)
-        green_mask = cv.bitwise_and(green, green, mask=foreground_mask)
-
-        output_green = cv.bitwise_and(output_green, output_green, mask=background_mask)
-        output_green += green_mask
-        output_green = cv.filter2D(output_green, -1, kernel)
-
-        output = pink_mask.copy()
-        mask = (np.maximum(pink_mask, last_pink).sum(axis=2) < 150).astype(np.uint8)
-        last_pink = output.copy()
-        output += cv.bitwise_and(output_green, output_green, mask=mask)
-
-        output_down = cv.resize(
-            output,
-            (16, 16),
-            interpolation=cv.INTER_NEAREST,
+    if args.benchmark_algorithms:
+        clip = sample_frames(caps[0], args.benchmark_frames)
+        for cap in caps:
+            cap.release()
+        print(format_results(benchmark_subtractors(clip, scales=args.benchmark_scales)))
+        return
+
+    algorithm = args.algorithm
+    if algorithm == "auto":
+        with timed("choose subtractor"):
+            clip = sample_frames(caps[0], min(args.benchmark_frames, 30))
+            algorithm = choose_subtractor(
+                clip, args.target_fps, scale=args.process_scale
+            )
+        logger.info("Using %s", algorithm)
+
+    # With a small trail, only the sinks that show the output enlarge it.
+    if args.trail_size is None:
+        full_size_views, enlarged = ("Output",), ()
+    else:
+        full_size_views, enlarged = (), ("Output",)
+
+    layout = led_layout(args)
+    led_size = (16, 16) if layout is None else layout.size
+
+    def enlarging(sink):
+        return EnlargedSink(sink, enlarged) if enlarged else sink
+
+    def compositor():
+        return TrailCompositor(
+            BACKGROUND_SUBTRACTION_ALGORITHMS[algorithm](),
+            led_size=led_size,
+            led_downsample=args.led_downsample,
+            scale=args.process_scale,
+            full_size_views=full_size_views,
+            trail_size=args.trail_size,
+            background_view=args.show_background,
         )
-        cv.imshow("Frame", frame)
-        cv.imshow("Foreground Mask", pink_mask)
-        if background_image is not None:
-            cv.imshow("Background image", background_image)
-        cv.imshow("Output", output)
-        cv.imshow("OutputDown", output_down)
-
-        if np.any(output) or writing_started:
-            writing_started = True
-            video_writer.write(output)
-
-        key = cv.waitKey(10)
-        logger.debug("Key = %s", key)
-        if key == QUIT:
-            logger.info("Quit key pressed.")
-            break
-    video_writer.release()
-    cap.release()
+
+    gates = []
+
+    def camera_process():
+        """A compositor, behind a motion gate with --motion-gate."""
+        process = compositor()
+        gate = motion_gate(args)
+        if gate is None:
+            return process
+        gates.append(gate)
+        return gate_process(process, gate)
+
+    def recorder(prefix):
+        return RecordingSink(
+            directory=args.record_dir,
+            view="Output",
+            prefix=prefix,
+            fps=12.0,
+            segment_seconds=args.segment_seconds,
+            max_segments=args.max_segments,
+            start_when=np.any,
+        )
+
+    if len(caps) == 1:
+        led_windows = ["OutputDown"]
+        recorders = [recorder("outpy")]
+        process = camera_process()
+        display, previews = build_preview(args, full_size_views=enlarged)
+        sinks = [enlarging(recorders[0])] + previews
+        if args.gif:
+            sinks.append(enlarging(GifSink(args.gif, view="Output", start_when=np.any)))
+        if layout is not None:
+            sinks.append(led_sink(layout, args.led_brightness))
+        pipeline = Pipeline(
+            source=caps[0],
+            process=process,
+            sinks=sinks,
+            display=display,
+            reporters=[recorders[0].summary]
+            + [gate.summary for gate in gates]
+            + capture_reporters(caps)
+            + profile_reporters(args),
+        )
+    else:
+        # One background model, recording and GIF per camera, all composited
+        # on one shared pool of workers.
+        names = ["cam{}".format(i) for i in range(len(caps))]
+        led_windows = [name + ": OutputDown" for name in names]
+        recorders = [recorder("outpy-" + name) for name in names]
+        processes = [camera_process() for _ in caps]
+        display, previews = build_camera_previews(args, names, full_size_views=enlarged)
+        sinks = [
+            [enlarging(rec)] + camera_previews
+            for rec, camera_previews in zip(recorders, previews)
+        ]
+        if args.gif:
+            stem, extension = os.path.splitext(args.gif)
+            for name, camera_sinks in zip(names, sinks):
+                gif = "{}-{}{}".format(stem, name, extension)
+                camera_sinks.append(
+                    enlarging(GifSink(gif, view="Output", start_when=np.any))
+                )
+        if layout is not None:
+            sinks[0].append(led_sink(layout, args.led_brightness))
+        pipeline = MultiCameraPipeline(
+            sources=caps,
+            processes=processes,
+            sinks=sinks,
+            display=display,
+            workers=args.workers,
+            reporters=[rec.summary for rec in recorders]
+            + [gate.summary for gate in gates]
+            + capture_reporters(caps)
+            + profile_reporters(args),
+            names=names,
+        )
+    if display is not None:
+        for window in led_windows:
+            cv.namedWindow(window, cv.WINDOW_NORMAL)
+            cv.resizeWindow(window, 400, 400)
+    log_startup_times()
+    pipeline.run()
 
 
 if __name__ == "__main__":
@@ -1,14 +1,36 @@
-from typing import Dict
+from typing import Dict, Optional
 
 import cv2 as cv
 import logging
 import numpy as np
 from matplotlib.image import AxesImage
 
+from ghostwriter.cache import log_startup_times, timed
+from ghostwriter.metrics import profile_reporters
 from ghostwriter.paths import DATA_DIR
-from ghostwriter.utils import default_arguments, set_up_logging
+from ghostwriter.utils import (
+    capture_settings,
+    default_arguments,
+    motion_gate,
+    set_up_logging,
+    source_specs,
+)
+from ghostwriter.camera.capture import capture_reporters
+from ghostwriter.camera.detection import (
+    CascadeDetector,
+    DetectionScheduler,
+    ScaleSelector,
+    load_cascade,
+)
+from ghostwriter.camera.exposure import AutoExposure
 from ghostwriter.camera.gamma import GammaCorrector
+from ghostwriter.camera.motion import gate_process
 from ghostwriter.camera.keymap import KEY_UP, KEY_DOWN, KEY_LEFT, KEY_RIGHT, QUIT
+from ghostwriter.camera.parallel import CascadeDetectorFactory, DetectionPool
+from ghostwriter.camera.multicamera import MultiCameraPipeline
+from ghostwriter.camera.pipeline import FramePacket, Pipeline
+from ghostwriter.camera.preview import build_camera_previews, build_preview
+from ghostwriter.camera.sources import open_source
 
 import matplotlib
 from matplotlib import pyplot as plt
@@ -17,6 +39,8 @@ from scripts.python_info import is_m1_mac
 
 _WINDOWS: Dict[str, AxesImage] = {}
 
+WINDOW_NAME = "Capture - Face detection"
+
 
 def on_close(event):
     event.canvas.figure.has_been_closed = True
@@ -26,14 +50,15 @@ def imshow(window_name: str, opencv_image: np.ndarray):
     rgb_image = cv.cvtColor(opencv_image, cv.COLOR_BGR2RGB)
     window = _WINDOWS.get(window_name)
     if window is None or window.figure.has_been_closed:
-        window = plt.imshow(rgb_image)
-        window.figure.has_been_closed = False
-        window.figure.canvas.mpl_connect("close_event", on_close)
+        # A figure per window, so each camera's views get their own.
+        figure = plt.figure(window_name)
+        window = figure.gca().imshow(rgb_image)
+        figure.has_been_closed = False
+        figure.canvas.mpl_connect("close_event", on_close)
     else:
         window.set_data(rgb_image)
     _WINDOWS[window_name] = window
-    print("Drawing")
-    plt.gcf().canvas.draw_idle()
+    window.figure.canvas.draw_idle()
     plt.pause(0.0001)
 
 
@@ -49,39 +74,63 @@ def update_gamma_from_key_press(gamma, key, factor=1.1):
     return new_gamma
 
 
-def detect_and_display(frame, face_cascade, eyes_cascade, smile_cascade):
+def draw_detections(frame, detections):
     logger = logging.getLogger(__name__)
-    frame_gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
-    frame_gray = cv.equalizeHist(frame_gray)
-
-    # -- Detect faces
-    faces = face_cascade.detectMultiScale(frame_gray)
-    for (x, y, w, h) in faces:
+    for (x, y, w, h), eyes, smiles in detections:
         center = (x + w // 2, y + h // 2)
         frame = cv.ellipse(frame, center, (w // 2, h // 2), 0, 0, 360, (255, 0, 255), 4)
-        faceROI = frame_gray[y : y + h, x : x + w]
-
-        # -- In each face, detect eyes and smiles
-        eyes = eyes_cascade.detectMultiScale(faceROI)
-        smiles = smile_cascade.detectMultiScale(faceROI, 1.8, 20)
 
-        for (x2, y2, w2, h2) in eyes:
-            eye_center = (x + x2 + w2 // 2, y + y2 + h2 // 2)
+        for x2, y2, w2, h2 in eyes:
+            eye_center = (x2 + w2 // 2, y2 + h2 // 2)
             radius = int(round((w2 + h2) * 0.25))
             frame = cv.circle(frame, eye_center, radius, (255, 0, 0), 4)
 
-        for (x2, y2, w2, h2) in smiles:
-            pt1 = (x + x2, y + y2)
-            pt2 = (x + x2 + w2, y + y2 + h2)
+        for x2, y2, w2, h2 in smiles:
+            pt1 = (x2, y2)
+            pt2 = (x2 + w2, y2 + h2)
             logger.debug("Smile detected!")
             frame = cv.rectangle(frame, pt1, pt2, color=(255, 255, 0))
+    return frame
+
+
+def equalized_gray(frame, frame_gray=None):
+    if frame_gray is None:
+        frame_gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+    return cv.equalizeHist(frame_gray)
 
+
+def detect_and_draw(
+    frame, face_cascade, eyes_cascade, smile_cascade, scheduler=None, frame_gray=None
+):
+    """Detect faces, eyes and smiles and draw them on the frame.
+
+    Without a `DetectionScheduler`, the full frame is scanned every time. Pass
+    `frame_gray` if the grayscale frame has already been computed.
+    """
+    frame_gray = equalized_gray(frame, frame_gray)
+
+    if scheduler is None:
+        detector = CascadeDetector(face_cascade, eyes_cascade, smile_cascade)
+        detections = detector.detect(frame_gray)
+    else:
+        detections = scheduler(frame_gray)
+    return draw_detections(frame, detections)
+
+
+def detect_and_display(
+    frame, face_cascade, eyes_cascade, smile_cascade, scheduler=None
+):
+    frame = detect_and_draw(
+        frame, face_cascade, eyes_cascade, smile_cascade, scheduler=scheduler
+    )
     # cv.imshow("Capture - Face detection", frame)
-    imshow("Capture - Face detection", frame)
+    imshow(WINDOW_NAME, frame)
 
 
 def main():
-    parser = default_arguments(description="Code for Cascade Classifier tutorial.")
+    parser = default_arguments(
+        description="Code for Cascade Classifier tutorial.", detection=True
+    )
     parser.add_argument(
         "--face_cascade",
         help="Path to face cascade.",
@@ -97,6 +146,17 @@ def main():
         help="Path to eyes cascade.",
         default="{}/haarcascades/haarcascade_eye_tree_eyeglasses.xml".format(DATA_DIR),
     )
+    parser.add_argument(
+        "--auto-exposure",
+        action="store_true",
+        help="Adjust gamma to keep the mean brightness at --exposure-target.",
+    )
+    parser.add_argument(
+        "--exposure-target",
+        type=float,
+        default=0.45,
+        help="Target mean brightness for --auto-exposure, from 0 to 1.",
+    )
 
     # Turn on mac
     if is_m1_mac():
@@ -105,45 +165,158 @@ def main():
     args = parser.parse_args()
     set_up_logging(args.verbose)
     logger = logging.getLogger(__name__)
-    gamma_corrector = GammaCorrector()
+    with timed("gamma tables"):
+        gamma_corrector = GammaCorrector()
     face_cascade_name = args.face_cascade
     eyes_cascade_name = args.eyes_cascade
     smile_cascade_name = args.smile_cascade
 
-    face_cascade = cv.CascadeClassifier()
-    eyes_cascade = cv.CascadeClassifier()
-    smile_cascade = cv.CascadeClassifier()
     # -- 1. Load the cascades
-    if not face_cascade.load(cv.samples.findFile(face_cascade_name)):
-        logger.error("Error loading face cascade")
-        return
-    if not eyes_cascade.load(cv.samples.findFile(eyes_cascade_name)):
-        logger.error("Error loading eyes cascade")
-        return
-    if not smile_cascade.load(cv.samples.findFile(smile_cascade_name)):
-        logger.error("Error loading smile cascade")
+    try:
+        face_cascade = load_cascade(face_cascade_name)
+        eyes_cascade = load_cascade(eyes_cascade_name)
+        smile_cascade = load_cascade(smile_cascade_name)
+    except IOError as error:
+        logger.error("%s", error)
         return
 
-    camera_device = args.camera
-    # -- 2. Read the video stream
-    cap = cv.VideoCapture(camera_device)
-    if not cap.isOpened:
+    # -- 2. Read the video streams
+    settings = capture_settings(args)
+    with timed("open camera"):
+        caps = [open_source(spec, settings=settings) for spec in source_specs(args)]
+    if not all(cap.isOpened() for cap in caps):
         logger.error("Error opening video capture")
         return
 
     gamma = 1.0
 
-    while True:
-        ret, frame = cap.read()
-        if frame is None:
-            logger.error("No captured frame; is your camera available?")
-            break
-        detect_and_display(
-            gamma_corrector.correct(frame, gamma),
-            face_cascade=face_cascade,
-            eyes_cascade=eyes_cascade,
-            smile_cascade=smile_cascade,
+    def make_scheduler(cascades) -> DetectionScheduler:
+        if args.detection_scale == "auto":
+            detector = CascadeDetector(*cascades, scale_selector=ScaleSelector())
+        else:
+            detector = CascadeDetector(*cascades, scale=args.detection_scale)
+        return DetectionScheduler(
+            detector,
+            policy=args.detection_policy,
+            interval=args.detection_interval,
+        )
+
+    def make_exposure() -> Optional[AutoExposure]:
+        if args.auto_exposure:
+            return AutoExposure(target=args.exposure_target)
+        return None
+
+    def expose(frame, exposure):
+        """The gamma-corrected frame, and the grayscale of the original.
+
+        Gamma is monotonic, so equalizing the uncorrected grayscale gives the
+        cascades what they'd get from the corrected one, and the same image
+        feeds the exposure histogram.
+        """
+        frame_gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        frame_gamma = gamma if exposure is None else exposure.update(frame_gray)
+        return gamma_corrector.correct(frame, frame_gamma), frame_gray
+
+    def gated(process, reporters):
+        """`process` behind a motion gate with --motion-gate, so the cascades
+        only run while something moves."""
+        gate = motion_gate(args)
+        if gate is None:
+            return process
+        reporters.append(gate.summary)
+        return gate_process(process, gate)
+
+    def thread_process(cascades):
+        """Detection on the processing thread, with its own tracking and
+        exposure, and the reporters for them."""
+        scheduler = make_scheduler(cascades)
+        exposure = make_exposure()
+
+        def detect_in_thread(packet: FramePacket) -> FramePacket:
+            frame, frame_gray = expose(packet.images["frame"], exposure)
+            frame = detect_and_draw(
+                frame, *cascades, scheduler=scheduler, frame_gray=frame_gray
+            )
+            return packet._replace(images={WINDOW_NAME: frame})
+
+        reporters = [scheduler.summary]
+        if exposure is not None:
+            reporters.append(exposure.summary)
+        return gated(detect_in_thread, reporters), reporters
+
+    cascades = (face_cascade, eyes_cascade, smile_cascade)
+    cascade_names = (face_cascade_name, eyes_cascade_name, smile_cascade_name)
+    pool = None
+    if len(caps) > 1:
+        if args.detection_workers > 0:
+            logger.warning(
+                "--detection-workers serves one camera; detecting on the shared "
+                "worker threads instead."
+            )
+        processes, reporters = [], []
+        for number in range(len(caps)):
+            # Cascades keep scratch buffers, so workers mustn't share them.
+            if number:
+                cascades = tuple(load_cascade(name) for name in cascade_names)
+            process, camera_reporters = thread_process(cascades)
+            processes.append(process)
+            reporters.extend(camera_reporters)
+        reporters.extend(capture_reporters(caps))
+        reporters.extend(profile_reporters(args))
+        names = ["cam{}".format(i) for i in range(len(caps))]
+        display, previews = build_camera_previews(
+            args, names, show=imshow, wait_key=lambda delay: -1
+        )
+        pipeline = MultiCameraPipeline(
+            sources=caps,
+            processes=processes,
+            sinks=previews,
+            display=display,
+            workers=args.workers,
+            reporters=reporters,
+            names=names,
+        )
+    else:
+        process, reporters = thread_process(cascades)
+        if args.detection_workers > 0:
+            exposure = make_exposure()
+            pool = DetectionPool(
+                CascadeDetectorFactory(*cascade_names, scale=args.detection_scale),
+                workers=args.detection_workers,
+            )
+
+            def detect_in_pool(packet: FramePacket) -> Optional[FramePacket]:
+                frame, frame_gray = expose(packet.images["frame"], exposure)
+                gray = equalized_gray(frame, frame_gray)
+                pool.submit(packet.index, gray, context=(packet, frame))
+                result = pool.next_result()
+                if result is None:
+                    return None
+                _, (done, frame), detections = result
+                frame = draw_detections(frame, detections)
+                return done._replace(images={WINDOW_NAME: frame})
+
+            reporters = [pool.summary]
+            if exposure is not None:
+                reporters.append(exposure.summary)
+            process = gated(detect_in_pool, reporters)
+        reporters.extend(capture_reporters(caps))
+        reporters.extend(profile_reporters(args))
+
+        display, previews = build_preview(args, show=imshow, wait_key=lambda delay: -1)
+        pipeline = Pipeline(
+            source=caps[0],
+            process=process,
+            sinks=previews,
+            display=display,
+            reporters=reporters,
         )
+    log_startup_times()
+    try:
+        pipeline.run()
+    finally:
+        if pool is not None:
+            pool.close()
 
 
 if __name__ == "__main__":
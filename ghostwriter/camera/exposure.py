@@ -0,0 +1,110 @@
+"""Automatic exposure control through gamma correction."""
+import logging
+import time
+from typing import Any, Dict
+
+import cv2 as cv
+import numpy as np
+
+
+class AutoExposure:
+    """
+    Steers the gamma so the corrected frame's mean luminance hits a target.
+
+    Each frame contributes a histogram of a subsampled grayscale image (use the
+    one computed for `equalizeHist` anyway) to an exponentially smoothed
+    histogram. The gamma that maps the smoothed histogram's mean onto `target`
+    is found by bisection over its 256 bins, and the working gamma moves part
+    of the way there each frame. If a frame's update takes longer than
+    `budget` seconds, the histogram is taken over every other row and column
+    more; when it's well under, the stride shrinks again.
+
+    :param target: Desired mean luminance, from 0 to 1.
+    :param smoothing: Weight of the newest histogram in the running estimate.
+    :param gain: Fraction of the way the gamma moves towards its goal per frame.
+    :param stride: Initial subsampling step in each direction.
+    :param budget: Per-frame time budget in seconds.
+    """
+
+    _LEVELS = np.linspace(0, 1, 256)
+
+    def __init__(
+        self,
+        target: float = 0.45,
+        smoothing: float = 0.1,
+        gain: float = 0.3,
+        stride: int = 4,
+        budget: float = 0.001,
+        gamma: float = 1.0,
+        gamma_min: float = 0.1,
+        gamma_max: float = 5.0,
+        max_stride: int = 32,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.target = target
+        self.smoothing = smoothing
+        self.gain = gain
+        self.stride = stride
+        self.budget = budget
+        self.gamma = gamma
+        self.gamma_min = gamma_min
+        self.gamma_max = gamma_max
+        self.max_stride = max_stride
+        self.elapsed = 0.0
+        self._histogram = None
+
+    @property
+    def mean(self) -> float:
+        """Smoothed mean luminance before correction, from 0 to 1."""
+        if self._histogram is None:
+            return float("nan")
+        return float(self._histogram @ self._LEVELS)
+
+    def histogram(self, gray: np.ndarray) -> np.ndarray:
+        """Normalized 256-bin histogram of every `stride`-th pixel."""
+        sample = np.ascontiguousarray(gray[:: self.stride, :: self.stride])
+        counts = cv.calcHist([sample], [0], None, [256], [0, 256]).ravel()
+        return counts / max(counts.sum(), 1.0)
+
+    def corrected_mean(self, histogram: np.ndarray, gamma: float) -> float:
+        return float(histogram @ np.power(self._LEVELS, gamma))
+
+    def _solve(self, histogram: np.ndarray, iterations: int = 16) -> float:
+        # The corrected mean only falls as gamma grows, so bisect on log gamma.
+        low, high = np.log(self.gamma_min), np.log(self.gamma_max)
+        for _ in range(iterations):
+            middle = 0.5 * (low + high)
+            if self.corrected_mean(histogram, np.exp(middle)) > self.target:
+                low = middle
+            else:
+                high = middle
+        return float(np.exp(0.5 * (low + high)))
+
+    def update(self, gray: np.ndarray) -> float:
+        """Fold in one grayscale frame and return the gamma to apply to it."""
+        start = time.perf_counter()
+        histogram = self.histogram(gray)
+        if self._histogram is None:
+            self._histogram = histogram
+        else:
+            self._histogram *= 1 - self.smoothing
+            self._histogram += self.smoothing * histogram
+        goal = self._solve(self._histogram)
+        self.gamma *= (goal / self.gamma) ** self.gain
+        self.elapsed = time.perf_counter() - start
+
+        if self.elapsed > self.budget and self.stride < self.max_stride:
+            self.stride *= 2
+            self.logger.debug("Exposure over budget; stride now %s", self.stride)
+        elif self.elapsed < self.budget / 4 and self.stride > 1:
+            self.stride //= 2
+        return self.gamma
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "stage": "exposure",
+            "gamma": round(self.gamma, 3),
+            "mean": round(self.mean, 3),
+            "stride": self.stride,
+            "ms": round(1000 * self.elapsed, 3),
+        }
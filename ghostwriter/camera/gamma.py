@@ -1,38 +1,124 @@
 """Gamma correction."""
 import logging
+from typing import Optional, Union
 
 import cv2 as cv
 import numpy as np
 
+from ghostwriter.metrics import METRICS
+
+GammaLike = Union[float, np.ndarray]
+
 
 class GammaCorrector:
     """
-    Gamma correction using pre-computed lookup table.
+    Gamma correction using pre-computed lookup tables.
+
+    The tables for `num_levels` log-spaced gammas live in one contiguous
+    `(num_levels, 256)` uint8 array, and each level is only computed the first
+    time it's used. A gamma between two levels snaps to the nearest one, or
+    with `interpolate=True` blends the two neighbouring tables.
     """
 
     _BASE = np.linspace(0, 1, 256)
 
-    def __init__(self, num_levels=128, gamma_min=0.001, gamma_max=5.0):
+    def __init__(
+        self, num_levels=128, gamma_min=0.001, gamma_max=5.0, interpolate=False
+    ):
         self.logger = logging.getLogger(__name__)
-
-        self.logger.debug("Building lookup tables")
         self._gamma_min = gamma_min
         self._gamma_max = gamma_max
+        self.interpolate = interpolate
+        self._log_min = np.log(gamma_min)
+        self._log_step = (np.log(gamma_max) - self._log_min) / max(num_levels - 1, 1)
         self._gammas = np.logspace(np.log10(gamma_min), np.log10(gamma_max), num_levels)
-        self._lookup_tables = [
-            self._generate_lookup_table(gamma) for gamma in self._gammas
-        ]
-        self.logger.debug("Done building lookup tables.")
+        self._tables = np.zeros((num_levels, 256), np.uint8)
+        self._built = np.zeros(num_levels, bool)
+
+    @property
+    def num_levels(self) -> int:
+        return len(self._gammas)
+
+    @property
+    def lookup_tables(self) -> np.ndarray:
+        """All `(num_levels, 256)` tables, building any that are missing."""
+        self._build(np.arange(self.num_levels))
+        return self._tables
 
     @classmethod
     def _generate_lookup_table(cls, gamma):
+        """Tables for one gamma, or one row per gamma for an array of them."""
+        gamma = np.asarray(gamma, float)[..., np.newaxis]
         look_up_table = np.clip(np.power(cls._BASE, gamma) * 255.0, 0, 255)
         return look_up_table.astype(np.uint8)
 
-    def _get_lookup_table(self, gamma):
+    def _build(self, levels: np.ndarray) -> None:
+        missing = np.unique(levels[~self._built[levels]])
+        if missing.size:
+            self.logger.debug("Building %s lookup tables", missing.size)
+            self._tables[missing] = self._generate_lookup_table(self._gammas[missing])
+            self._built[missing] = True
+
+    def _positions(self, gamma: GammaLike) -> np.ndarray:
+        """Fractional level of each gamma, clipped to the table."""
         gamma = np.clip(gamma, self._gamma_min, self._gamma_max)
-        index = np.searchsorted(self._gammas, gamma)
-        return self._lookup_tables[index]
+        positions = (np.log(gamma) - self._log_min) / self._log_step
+        return np.clip(positions, 0, self.num_levels - 1)
+
+    def lookup_table(self, gamma: GammaLike) -> np.ndarray:
+        """
+        The table for `gamma`, shaped `(..., 256)` like `gamma` plus one axis.
+        """
+        positions = self._positions(gamma)
+        if not self.interpolate:
+            levels = np.rint(positions).astype(np.intp)
+            self._build(np.atleast_1d(levels))
+            return self._tables[levels]
+        lower = np.floor(positions).astype(np.intp)
+        upper = np.minimum(lower + 1, self.num_levels - 1)
+        self._build(np.atleast_1d(np.concatenate([np.ravel(lower), np.ravel(upper)])))
+        weight = (positions - lower)[..., np.newaxis]
+        blended = (1 - weight) * self._tables[lower] + weight * self._tables[upper]
+        return np.rint(blended).astype(np.uint8)
+
+    def _channel_table(self, gamma: GammaLike) -> np.ndarray:
+        """A table `cv.LUT` accepts: `(256,)` or `(1, 256, channels)`."""
+        table = self.lookup_table(gamma)
+        if table.ndim == 1:
+            return table
+        return np.ascontiguousarray(table.T[np.newaxis])
+
+    @METRICS.timed("gamma")
+    def correct(self, image, gamma: GammaLike, dst: Optional[np.ndarray] = None):
+        """Correct one image, with one gamma or one gamma per channel."""
+        return cv.LUT(image, self._channel_table(gamma), dst=dst)
+
+    def correct_batch(
+        self, frames: np.ndarray, gammas: GammaLike, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Correct a stack of frames shaped `(n, height, width[, channels])`.
 
-    def correct(self, image, gamma):
-        return cv.LUT(image, self._get_lookup_table(gamma))
+        `gammas` is a scalar, one gamma per channel `(channels,)`, one per frame
+        `(n, 1)`, or one per frame and channel `(n, channels)`. When every frame
+        shares its gammas, the whole stack goes through a single `cv.LUT`.
+        """
+        if out is None:
+            out = np.empty_like(frames)
+        gammas = np.asarray(gammas, float)
+        if gammas.ndim < 2 or np.all(gammas == gammas[:1]):
+            shared = gammas if gammas.ndim < 2 else gammas[0]
+            if shared.ndim and shared.size == 1:
+                shared = shared.reshape(())
+            n, height = frames.shape[:2]
+            stacked = frames.reshape((n * height,) + frames.shape[2:])
+            cv.LUT(
+                stacked,
+                self._channel_table(shared),
+                dst=out.reshape((n * height,) + frames.shape[2:]),
+            )
+            return out
+        for frame, gamma, frame_out in zip(frames, gammas, out):
+            gamma = gamma.reshape(()) if gamma.size == 1 else gamma
+            self.correct(frame, gamma, dst=frame_out)
+        return out
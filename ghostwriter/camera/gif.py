@@ -0,0 +1,302 @@
+"""Streaming animated GIF export.
+
+Frames are palettized, diffed against the previous frame and written as they
+arrive, so neither the decoded video nor the GIF's frames are ever held all at
+once. Pillow does the LZW compression of each frame.
+
+    python -m ghostwriter.camera.gif recordings/outpy-20200101-120000-0000.avi
+"""
+import argparse
+import logging
+import os
+from typing import BinaryIO, Callable, Optional, Union
+
+import cv2 as cv
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+from ghostwriter.camera.colors import ColorStore, load_xkcd_store
+from ghostwriter.camera.pipeline import FramePacket, Sink
+from ghostwriter.utils import set_up_logging
+
+# Pillow 9.1 moved the quantizers into an enum and later dropped the old names.
+MEDIANCUT = getattr(Image, "Quantize", Image).MEDIANCUT
+
+# Palette index reserved for pixels that didn't change since the last frame.
+TRANSPARENT = 255
+MAX_COLORS = 255
+
+
+def downscale(image: np.ndarray, width: Optional[int]) -> np.ndarray:
+    """Shrink `image` to `width` pixels across, keeping its aspect ratio."""
+    if width is None or image.shape[1] <= width:
+        return image
+    height = max(1, round(image.shape[0] * width / image.shape[1]))
+    return cv.resize(image, (width, height), interpolation=cv.INTER_AREA)
+
+
+def adaptive_palette(image: np.ndarray, colors: int = MAX_COLORS) -> ColorStore:
+    """A median-cut palette for a BGR image."""
+    rgb = Image.fromarray(cv.cvtColor(image, cv.COLOR_BGR2RGB))
+    quantized = rgb.quantize(colors, method=MEDIANCUT)
+    used = sorted(index for _, index in quantized.getcolors(colors))
+    rgb_palette = np.array(quantized.getpalette(), np.uint8).reshape(-1, 3)
+    bgr = np.ascontiguousarray(rgb_palette[used, ::-1])
+    names = ["#{:02x}{:02x}{:02x}".format(*color[::-1]) for color in bgr]
+    return ColorStore(names, bgr)
+
+
+def xkcd_palette(
+    image: np.ndarray, colors: int = MAX_COLORS, store: Optional[ColorStore] = None
+) -> ColorStore:
+    """The XKCD colors `image` uses most, at most `colors` of them."""
+    store = load_xkcd_store() if store is None else store
+    counts = np.bincount(store.nearest(image).ravel(), minlength=len(store))
+    chosen = np.argsort(counts)[::-1][:colors]
+    chosen = np.sort(chosen[counts[chosen] > 0])
+    return ColorStore([store.names[i] for i in chosen], store.bgr[chosen])
+
+
+PALETTES = {"adaptive": adaptive_palette, "xkcd": xkcd_palette}
+
+
+class GifWriter:
+    """
+    Writes an animated GIF one frame at a time.
+
+    Each frame is shown until the next one's timestamp. A frame identical to
+    the one before just extends its display time, and with `delta` only the
+    rectangle that changed is stored, with unchanged pixels transparent.
+    Only the last frame is held back, to learn how long it's shown.
+
+    :param output: A path or a binary file object.
+    :param palette: "adaptive", "xkcd" or a `ColorStore` of at most 255 colors.
+        Named palettes are fitted to the first frame and kept for the rest,
+        so identical colors get identical indices from frame to frame.
+    :param loop: Times to repeat; 0 repeats forever.
+    """
+
+    def __init__(
+        self,
+        output: Union[str, BinaryIO],
+        palette: Union[str, ColorStore] = "adaptive",
+        loop: int = 0,
+        delta: bool = True,
+    ):
+        self.logger = logging.getLogger(__name__)
+        if isinstance(palette, ColorStore) and len(palette) > MAX_COLORS:
+            raise ValueError("A GIF palette holds at most {}".format(MAX_COLORS))
+        self._owns_file = isinstance(output, str)
+        self._fp = open(output, "wb") if self._owns_file else output
+        self.palette = palette
+        self.loop = loop
+        self.delta = delta
+        self.frames = 0
+        self.skipped = 0
+        self._start = None
+        self._latest = None
+        self._elapsed_cs = 0
+        self._previous = None
+        self._pending = None
+
+    def __enter__(self) -> "GifWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, image: np.ndarray, timestamp: float) -> None:
+        """Add a BGR frame, shown from `timestamp` seconds."""
+        if self._start is None:
+            self._begin(image, timestamp)
+        elif image.shape[:2] != self._previous.shape:
+            raise ValueError("Frame size changed to {}".format(image.shape))
+        self._latest = timestamp
+        indices = self.palette.nearest(image).astype(np.uint8)
+
+        if self._pending is not None:
+            delay = self._centiseconds(timestamp) - self._elapsed_cs
+            # Viewers stretch delays under 2 cs to 10 cs; drop such frames.
+            if delay < 2 or np.array_equal(indices, self._previous):
+                self.skipped += 1
+                return
+            self._flush(delay)
+
+        offset, patch, transparency = (0, 0), indices, None
+        if self.delta and self._previous is not None:
+            changed = indices != self._previous
+            rows = np.flatnonzero(changed.any(axis=1))
+            columns = np.flatnonzero(changed.any(axis=0))
+            top, bottom = rows[0], rows[-1] + 1
+            left, right = columns[0], columns[-1] + 1
+            offset = (int(left), int(top))
+            patch = indices[top:bottom, left:right].copy()
+            patch[~changed[top:bottom, left:right]] = TRANSPARENT
+            transparency = TRANSPARENT
+        self._pending = (patch, offset, transparency)
+        self._previous = indices
+
+    def _begin(self, image: np.ndarray, timestamp: float) -> None:
+        if isinstance(self.palette, str):
+            self.palette = PALETTES[self.palette](image)
+        self._start = timestamp
+        height, width = image.shape[:2]
+        colors = np.zeros((256, 3), np.uint8)
+        colors[: len(self.palette)] = self.palette.bgr[:, ::-1]
+        self._fp.write(
+            b"GIF89a"
+            + width.to_bytes(2, "little")
+            + height.to_bytes(2, "little")
+            # Global color table of 2 ** (7 + 1) entries, 8 bits per primary.
+            + bytes([0xF7, 0, 0])
+            + colors.tobytes()
+            + b"!\xff\x0bNETSCAPE2.0\x03\x01"
+            + self.loop.to_bytes(2, "little")
+            + b"\x00"
+        )
+
+    def _centiseconds(self, timestamp: float) -> int:
+        return round(100 * (timestamp - self._start))
+
+    def _flush(self, delay_cs: int) -> None:
+        patch, offset, transparency = self._pending
+        frame = Image.frombytes("P", patch.shape[::-1], patch.tobytes())
+        params = {"duration": 10 * delay_cs, "disposal": 1}
+        if transparency is not None:
+            params["transparency"] = transparency
+        for chunk in GifImagePlugin.getdata(frame, offset, **params):
+            self._fp.write(chunk)
+        self._elapsed_cs += delay_cs
+        self._pending = None
+        self.frames += 1
+
+    def close(self, last_duration: float = 0.1) -> None:
+        """
+        Finish the file, showing the last frame until `last_duration` seconds
+        after the last frame written.
+        """
+        if self._fp is None:
+            return
+        if self._pending is not None:
+            end = self._centiseconds(self._latest) + round(100 * last_duration)
+            self._flush(max(2, end - self._elapsed_cs))
+        if self._start is not None:
+            self._fp.write(b";")
+        if self._owns_file:
+            self._fp.close()
+        self._fp = None
+
+
+class GifSink(Sink):
+    """
+    Writes one view of the live pipeline to a GIF, at most `fps` frames a
+    second and at most `width` pixels across.
+
+    :param start_when: Don't start the GIF until this returns True for a
+        frame, e.g. `np.any` to skip the initial black frames, which would
+        otherwise be all an adaptive palette is fitted to.
+    """
+
+    def __init__(
+        self,
+        filename: Union[str, BinaryIO],
+        view: str,
+        fps: float = 10.0,
+        width: Optional[int] = 320,
+        palette: Union[str, ColorStore] = "adaptive",
+        start_when: Optional[Callable[[np.ndarray], bool]] = None,
+    ):
+        self.view = view
+        self.interval = 1.0 / fps
+        self.width = width
+        self.start_when = start_when
+        self.writer = GifWriter(filename, palette)
+        self._started = False
+        self._next = None
+
+    def write(self, packet: FramePacket) -> None:
+        image = packet.images.get(self.view)
+        if image is None or (self._next and packet.timestamp < self._next):
+            return
+        if not self._started:
+            if self.start_when is not None and not self.start_when(image):
+                return
+            self._started = True
+        self._next = packet.timestamp + self.interval
+        self.writer.write(downscale(image, self.width), packet.timestamp)
+
+    def close(self) -> None:
+        self.writer.close(self.interval)
+
+
+def export_gif(
+    source: str,
+    output: Union[str, BinaryIO],
+    fps: float = 10.0,
+    width: Optional[int] = 320,
+    palette: Union[str, ColorStore] = "adaptive",
+    delta: bool = True,
+) -> GifWriter:
+    """
+    Convert a video file to a GIF, streaming frame by frame.
+
+    Every n-th frame is kept to get close to `fps`, and frames are downscaled
+    to `width` before palettizing.
+    """
+    logger = logging.getLogger(__name__)
+    capture = cv.VideoCapture(source)
+    if not capture.isOpened():
+        raise IOError("Could not open {}".format(source))
+    source_fps = capture.get(cv.CAP_PROP_FPS) or fps
+    step = max(1, round(source_fps / fps))
+    writer = GifWriter(output, palette, delta=delta)
+    index = 0
+    try:
+        while True:
+            # grab() skips decoding the frames we don't keep.
+            if not capture.grab():
+                break
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                writer.write(downscale(frame, width), index / source_fps)
+            index += 1
+    finally:
+        capture.release()
+        writer.close(step / source_fps)
+    logger.info(
+        "Wrote %s frames from %s (%s unchanged or too close)",
+        writer.frames,
+        source,
+        writer.skipped,
+    )
+    return writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a video to a GIF.")
+    parser.add_argument("input", help="Video file.")
+    parser.add_argument(
+        "-o", "--output", help="GIF file; defaults to the input with .gif."
+    )
+    parser.add_argument("--fps", type=float, default=10.0)
+    parser.add_argument(
+        "--width", type=int, default=320, help="Maximum width in pixels."
+    )
+    parser.add_argument("--palette", choices=sorted(PALETTES), default="adaptive")
+    parser.add_argument(
+        "--no-delta",
+        dest="delta",
+        action="store_false",
+        help="Store whole frames instead of just what changed.",
+    )
+    parser.add_argument("-v", "--verbose", type=int, default=1)
+    args = parser.parse_args()
+    set_up_logging(args.verbose)
+    output = args.output or os.path.splitext(args.input)[0] + ".gif"
+    export_gif(args.input, output, args.fps, args.width, args.palette, args.delta)
+
+
+if __name__ == "__main__":
+    main()
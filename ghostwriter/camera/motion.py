@@ -0,0 +1,163 @@
+"""Skipping the expensive work while nothing in front of the camera moves.
+
+`MotionDetector` shrinks each frame to a few hundred pixels and compares it
+with a slowly-adapting reference, which costs a fraction of a millisecond.
+`MotionGate` turns that into a decision per frame with hysteresis: any
+motion wakes it at once, but it only goes idle after a stretch of stillness
+long enough for the trails to fade out, and while idle it still lets a frame
+through every so often so background models keep learning and the LEDs
+follow slow changes in the light.
+
+Wrap a pipeline's `process` with `gate_process` to drop the frames the gate
+rejects; a dropped frame never reaches the cascades, the background
+subtractor, the compositor or the LED and preview sinks.
+"""
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.pipeline import FramePacket
+from ghostwriter.metrics import METRICS
+
+
+class MotionDetector:
+    """
+    How much of the scene changed: the fraction of pixels of the frame,
+    shrunk to `size`, that differ by more than `threshold` levels from a
+    reference that follows the frames at `adapt` per frame. Shrinking
+    averages away sensor noise, and the slow reference absorbs gradual
+    changes in the light.
+    """
+
+    def __init__(
+        self,
+        size: Tuple[int, int] = (32, 24),
+        threshold: float = 12.0,
+        adapt: float = 0.05,
+    ):
+        self.size = size
+        self.threshold = threshold
+        self.adapt = adapt
+        self.reference: Optional[np.ndarray] = None
+        self._gray = np.empty(size[::-1], np.uint8)
+        self._current = np.empty(size[::-1], np.float32)
+        self._difference = np.empty(size[::-1], np.float32)
+
+    def reset(self) -> None:
+        self.reference = None
+
+    @METRICS.timed("motion")
+    def __call__(self, frame: np.ndarray) -> float:
+        small = cv.resize(frame, self.size, interpolation=cv.INTER_AREA)
+        if small.ndim == 3:
+            cv.cvtColor(small, cv.COLOR_BGR2GRAY, dst=self._gray)
+            small = self._gray
+        current = self._current
+        current[...] = small
+        if self.reference is None:
+            # Everything is new on the first frame.
+            self.reference = current.copy()
+            return 1.0
+        cv.absdiff(current, self.reference, dst=self._difference)
+        changed = np.count_nonzero(self._difference > self.threshold)
+        cv.accumulateWeighted(current, self.reference, self.adapt)
+        return changed / current.size
+
+
+class MotionGate:
+    """
+    Decides, frame by frame, whether to do the full work.
+
+    :param detector: Measures the change in each frame.
+    :param start: Change at or above which the gate wakes up.
+    :param stop: Change below which the scene counts as still; between `stop`
+        and `start` the gate stays as it is.
+    :param hold_seconds: How long the scene has to be still before the gate
+        goes idle.
+    :param idle_fps: Frames let through per second while idle; 0 for none.
+    """
+
+    def __init__(
+        self,
+        detector: Optional[MotionDetector] = None,
+        start: float = 0.01,
+        stop: float = 0.002,
+        hold_seconds: float = 3.0,
+        idle_fps: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if stop > start:
+            raise ValueError("stop must not be above start")
+        self.logger = logging.getLogger(__name__)
+        self.detector = MotionDetector() if detector is None else detector
+        self.start = start
+        self.stop = stop
+        self.hold_seconds = hold_seconds
+        self.idle_interval = 1.0 / idle_fps if idle_fps > 0 else None
+        self.clock = clock
+        self.active = True
+        self.level = 0.0
+        self.processed = 0
+        self.skipped = 0
+        self.wakes = 0
+        self._still_since: Optional[float] = None
+        self._next_idle = 0.0
+
+    def __call__(self, frame: np.ndarray) -> bool:
+        """Whether to process `frame`."""
+        now = self.clock()
+        self.level = self.detector(frame)
+        if self.level >= self.start:
+            self._still_since = None
+            if not self.active:
+                self.logger.debug("Motion (%.3f); waking up", self.level)
+                self.active = True
+                self.wakes += 1
+        elif self.level < self.stop:
+            if self._still_since is None:
+                self._still_since = now
+            if self.active and now - self._still_since >= self.hold_seconds:
+                self.logger.debug("Still for %.1f s; idling", now - self._still_since)
+                self.active = False
+                self._next_idle = now + (self.idle_interval or 0.0)
+
+        if self.active:
+            process = True
+        elif self.idle_interval is not None and now >= self._next_idle:
+            self._next_idle = now + self.idle_interval
+            process = True
+        else:
+            process = False
+        if process:
+            self.processed += 1
+        else:
+            self.skipped += 1
+        return process
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "stage": "motion",
+            "active": self.active,
+            "level": round(self.level, 4),
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "wakes": self.wakes,
+        }
+
+
+def gate_process(
+    process: Callable[[FramePacket], Optional[FramePacket]],
+    gate: MotionGate,
+    view: str = "frame",
+) -> Callable[[FramePacket], Optional[FramePacket]]:
+    """`process`, run only on the packets whose `view` the gate lets through."""
+
+    def gated(packet: FramePacket) -> Optional[FramePacket]:
+        if not gate(packet.images[view]):
+            return None
+        return process(packet)
+
+    return gated
@@ -0,0 +1,331 @@
+"""Several cameras sharing one pool of processing threads.
+
+Each camera is read on its own thread into its own small queue, and a fixed
+number of workers take frames from those queues in turn, so a busy camera
+can't starve the others and adding a camera adds a capture thread, not a
+process. OpenCV and NumPy release the GIL in their heavy loops, so the
+workers spread over the cores.
+
+A camera has at most one frame in a worker at a time, so its `process`,
+which usually holds state like a background model, sees its frames in order
+and never from two threads at once.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from ghostwriter.camera.keymap import QUIT
+from ghostwriter.camera.pipeline import (
+    CaptureStage,
+    DisplaySink,
+    FramePacket,
+    PrefixedSink,
+    RingBuffer,
+    Sink,
+    SinkStage,
+    Stage,
+    StageStats,
+    prefix_views,
+    sink_buffer,
+    sink_name,
+)
+from ghostwriter.metrics import METRICS
+
+Process = Callable[[FramePacket], Optional[FramePacket]]
+
+
+class _Lane:
+    """One camera's queue in a `FairQueue`, with the `RingBuffer` interface
+    `CaptureStage` writes to."""
+
+    def __init__(self, queue: "FairQueue", index: int):
+        self.queue = queue
+        self.index = index
+
+    def __len__(self) -> int:
+        return len(self.queue._items[self.index])
+
+    @property
+    def dropped(self) -> int:
+        return self.queue.dropped[self.index]
+
+    @property
+    def closed(self) -> bool:
+        return self.queue._closed[self.index]
+
+    def put(self, item: Any) -> None:
+        self.queue.put(self.index, item)
+
+    def close(self) -> None:
+        self.queue.close(self.index)
+
+
+class FairQueue:
+    """
+    Per-camera queues, each dropping its oldest frame when full, served
+    round-robin to any number of workers.
+
+    `get` hands out the next frame of the first camera after the last one
+    served that has a frame and none in progress; the worker calls `done`
+    with the camera once it's finished with it.
+    """
+
+    def __init__(self, lanes: int, maxlen: int = 2):
+        self._items = [deque(maxlen=maxlen) for _ in range(lanes)]
+        self._busy = [False] * lanes
+        self._closed = [False] * lanes
+        self.dropped = [0] * lanes
+        self._next = 0
+        self._condition = threading.Condition()
+
+    @property
+    def lanes(self) -> List[_Lane]:
+        return [_Lane(self, index) for index in range(len(self._items))]
+
+    @property
+    def finished(self) -> bool:
+        """Every camera is closed and drained."""
+        with self._condition:
+            return all(self._closed) and not any(self._items)
+
+    def put(self, lane: int, item: Any) -> None:
+        with self._condition:
+            items = self._items[lane]
+            if len(items) == items.maxlen:
+                self.dropped[lane] += 1
+            items.append(item)
+            self._condition.notify()
+
+    def close(self, lane: int) -> None:
+        with self._condition:
+            self._closed[lane] = True
+            self._condition.notify_all()
+
+    def _ready(self) -> Optional[int]:
+        count = len(self._items)
+        for offset in range(count):
+            lane = (self._next + offset) % count
+            if self._items[lane] and not self._busy[lane]:
+                return lane
+        return None
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[int, Any]]:
+        """The next `(lane, item)`, or None on timeout or once finished."""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._ready() is not None
+                or (all(self._closed) and not any(self._items)),
+                timeout,
+            )
+            lane = self._ready()
+            if lane is None:
+                return None
+            self._busy[lane] = True
+            self._next = (lane + 1) % len(self._items)
+            return lane, self._items[lane].popleft()
+
+    def done(self, lane: int) -> None:
+        with self._condition:
+            self._busy[lane] = False
+            self._condition.notify()
+
+
+class WorkerStage(Stage):
+    """Processes frames from any camera, with that camera's `process`."""
+
+    def __init__(
+        self,
+        queue: FairQueue,
+        processes: Sequence[Process],
+        outputs: Sequence[Sequence[RingBuffer]],
+        name: str = "worker",
+    ):
+        super().__init__(name=name)
+        self.queue = queue
+        self.processes = processes
+        self.outputs = outputs
+
+    def step(self) -> None:
+        item = self.queue.get(timeout=0.1)
+        if item is None:
+            if self.queue.finished:
+                self.stop()
+            return
+        lane, packet = item
+        # The camera's next frame waits until this one is published, so its
+        # sinks get its frames in order.
+        try:
+            with METRICS.timer("process"):
+                result = self.processes[lane](packet)
+            self.stats.tick()
+            METRICS.tick(self.name)
+            if result is not None:
+                for output in self.outputs[lane]:
+                    output.put(result)
+        finally:
+            self.queue.done(lane)
+
+
+class MultiCameraPipeline:
+    """
+    Captures from each of `sources` on its own thread and processes them on
+    `workers` shared threads, with the display on the calling thread.
+
+    :param processes: One `process` per source, as for `Pipeline`.
+    :param sinks: One list of sinks per source; each sink gets that camera's
+        packets only.
+    :param display: Shows the latest views of every camera, each named
+        "<camera>: <view>".
+    :param workers: Processing threads; by default one per camera, up to the
+        number of cores.
+    :param names: Camera names, for views and stats; "cam0", "cam1", ...
+    """
+
+    def __init__(
+        self,
+        sources: Sequence[Any],
+        processes: Sequence[Process],
+        sinks: Optional[Sequence[Iterable[Sink]]] = None,
+        display: Optional[DisplaySink] = None,
+        workers: Optional[int] = None,
+        buffer_size: int = 2,
+        reporters: Iterable[Callable[[], Dict[str, Any]]] = (),
+        names: Optional[Sequence[str]] = None,
+    ):
+        if len(processes) != len(sources):
+            raise ValueError("Need one process per source")
+        self.logger = logging.getLogger(__name__)
+        self.names = list(names or ["cam{}".format(i) for i in range(len(sources))])
+        self.reporters = list(reporters)
+        sinks = [list(camera_sinks) for camera_sinks in (sinks or [()] * len(sources))]
+        if workers is None:
+            workers = min(len(sources), os.cpu_count() or 1)
+
+        self.queue = FairQueue(len(sources), buffer_size)
+        self.captures = [
+            CaptureStage(source, [lane], name="capture-" + name)
+            for source, lane, name in zip(sources, self.queue.lanes, self.names)
+        ]
+        self.display = display
+        self.display_buffers = []
+        self.display_stats = StageStats("display")
+        self.sinks = []
+        outputs = []
+        for name, camera_sinks in zip(self.names, sinks):
+            buffers = [sink_buffer(sink, buffer_size) for sink in camera_sinks]
+            self.sinks.extend(
+                SinkStage(sink, buffer, name="{}-{}".format(sink_name(sink), name))
+                for sink, buffer in zip(camera_sinks, buffers)
+            )
+            if display is not None:
+                # The display's views are named "<camera>: <view>".
+                prefixed = PrefixedSink(display, name + ": ")
+                self.display_buffers.append(sink_buffer(prefixed, 1))
+                buffers.append(self.display_buffers[-1])
+            outputs.append(buffers)
+        self.outputs = outputs
+        self.workers = [
+            WorkerStage(self.queue, processes, outputs, name="worker-{}".format(i))
+            for i in range(workers)
+        ]
+
+    @property
+    def stages(self) -> List[Stage]:
+        return self.captures + self.workers + self.sinks
+
+    def start(self) -> None:
+        for stage in reversed(self.stages):
+            stage.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        """Stop capturing, then let the workers and sinks drain."""
+        for capture in self.captures:
+            capture.stop()
+        for capture in self.captures:
+            self._finish(capture, timeout)
+            for lane in capture.outputs:
+                lane.close()
+        for worker in self.workers:
+            self._finish(worker, timeout)
+        for buffers in self.outputs:
+            for buffer in buffers:
+                buffer.close()
+        for sink in self.sinks:
+            self._finish(sink, timeout)
+
+    @staticmethod
+    def _finish(stage: Stage, timeout: float) -> None:
+        if stage.is_alive():
+            stage.join(timeout)
+        stage.stop()
+
+    @property
+    def processing(self) -> bool:
+        return not all(worker.stopped for worker in self.workers)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        stats = []
+        for capture, lane in zip(self.captures, self.queue.lanes):
+            summary = capture.summary()
+            summary.update(queue=len(lane), dropped=lane.dropped)
+            stats.append(summary)
+        stats.extend(stage.summary() for stage in self.workers + self.sinks)
+        if self.display is not None:
+            stats.append(
+                {
+                    "stage": self.display_stats.name,
+                    "frames": self.display_stats.frames,
+                    "fps": round(self.display_stats.fps, 1),
+                }
+            )
+        stats.extend(report() for report in self.reporters)
+        return stats
+
+    def log_stats(self) -> None:
+        for stage in self.stats():
+            self.logger.info("%s", stage)
+
+    def _show(self) -> None:
+        for name, buffer in zip(self.names, self.display_buffers):
+            packet = buffer.get_latest(timeout=0)
+            if packet is not None:
+                with METRICS.timer("display"):
+                    self.display.write(prefix_views(packet, name + ": "))
+                self.display_stats.tick()
+                METRICS.tick("display")
+
+    def run(self, stats_interval: float = 5.0) -> None:
+        """Run until every source is exhausted or the quit key is pressed."""
+        self.start()
+        next_report = time.monotonic() + stats_interval
+        try:
+            while self.processing:
+                if self.display is not None:
+                    if self.display.due():
+                        self._show()
+                    time.sleep(0.005)
+                    if self.display.poll() == QUIT:
+                        self.logger.info("Quit key pressed.")
+                        break
+                else:
+                    self.workers[0].join(0.1)
+                if time.monotonic() >= next_report:
+                    self.log_stats()
+                    next_report += stats_interval
+        finally:
+            self.stop()
+            if self.display is not None:
+                self.display.close()
+            self.log_stats()
@@ -0,0 +1,359 @@
+"""Cascade detection spread over a pool of worker processes.
+
+Frames go to the workers through a block of shared memory split into slots,
+so only a small task tuple is pickled per frame. A worker that finds faces in
+a frame queues one eye/smile task per face back onto the shared task queue,
+so the sub-detections of a crowded frame fan out over every worker. Results
+come back tagged with their frame index and are released in submission order.
+"""
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.detection import (
+    CascadeDetector,
+    Detection,
+    ScaleSelector,
+    load_cascade,
+)
+
+
+class CascadeDetectorFactory:
+    """
+    Builds a `CascadeDetector` from cascade files, inside each worker.
+
+    With `scale="auto"`, a `DetectionPool` picks the scale for every frame
+    from the faces all the workers found, and sends it with the frame.
+    """
+
+    def __init__(self, face_path: str, eyes_path: str, smile_path: str, scale="auto"):
+        self.face_path = face_path
+        self.eyes_path = eyes_path
+        self.smile_path = smile_path
+        self.scale = scale
+
+    def __call__(self) -> CascadeDetector:
+        cascades = [
+            load_cascade(path)
+            for path in (self.face_path, self.eyes_path, self.smile_path)
+        ]
+        if self.scale == "auto":
+            return CascadeDetector(*cascades)
+        return CascadeDetector(*cascades, scale=float(self.scale))
+
+
+def _detection_worker(detector_factory, buffer, slot_size, tasks, results):
+    logger = logging.getLogger(__name__)
+    # The pool is the parallelism; don't let every worker spawn its own threads.
+    cv.setNumThreads(1)
+    try:
+        detector = detector_factory()
+    except Exception as error:
+        results.put(("error", repr(error)))
+        return
+    frames = np.frombuffer(buffer, np.uint8).reshape(-1, slot_size)
+    results.put(("ready", None))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        kind, index, slot, shape, scale = task[:5]
+        if scale is not None:
+            detector.scale = scale
+        gray = frames[slot, : shape[0] * shape[1]].reshape(shape)
+        try:
+            if kind == "faces":
+                faces = detector.detect_faces(gray)
+                results.put(("faces", index, faces))
+                for number, face in enumerate(faces):
+                    tasks.put(("features", index, slot, shape, scale, number, face))
+            else:
+                number, face = task[5:]
+                detection = detector.detect_features(gray, face)
+                results.put(("features", index, number, detection))
+        except Exception:
+            logger.exception("Detection failed on frame %s", index)
+            if kind == "faces":
+                results.put(("faces", index, []))
+            else:
+                results.put(("features", index, number, Detection(face, [], [])))
+
+
+class ReorderBuffer:
+    """Releases results in the order their indices were announced."""
+
+    def __init__(self):
+        self._order = deque()
+        self._done: Dict[int, Any] = {}
+        self._condition = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def expect(self, index: int) -> None:
+        with self._condition:
+            self._order.append(index)
+
+    def put(self, index: int, item: Any) -> None:
+        with self._condition:
+            self._done[index] = item
+            self._condition.notify_all()
+
+    def get(self, timeout: Optional[float] = 0) -> Optional[Tuple[int, Any]]:
+        """The next result in order, or None if it isn't ready in time."""
+
+        def ready():
+            return self._order and self._order[0] in self._done
+
+        with self._condition:
+            if not self._condition.wait_for(ready, timeout):
+                return None
+            index = self._order.popleft()
+            return index, self._done.pop(index)
+
+
+class _PendingFrame:
+    def __init__(self, slot: int, context: Any, submitted: float):
+        self.slot = slot
+        self.context = context
+        self.submitted = submitted
+        self.faces: Optional[List] = None
+        self.detections: Dict[int, Detection] = {}
+
+    @property
+    def complete(self) -> bool:
+        return self.faces is not None and len(self.detections) == len(self.faces)
+
+
+class DetectionPool:
+    """
+    Runs face, eye and smile detection for grayscale frames on `workers`
+    processes.
+
+    :param detector_factory: Picklable callable returning a `CascadeDetector`;
+        called once in every worker.
+    :param workers: Number of worker processes.
+    :param slots: Frames that may be in flight at once; `submit` blocks while
+        all of them are taken. Defaults to twice the number of workers.
+    :param context: `multiprocessing` start method. "spawn" is the default,
+        since forking a process that already runs capture threads is unsafe.
+    :param scale_selector: Picks the scale of each frame's scan from the
+        faces found so far, here rather than in each worker, so every worker
+        scans at the same scale. By default there's one if the factory's
+        `scale` is "auto".
+    :param start_timeout: How long the workers may take to start.
+
+    If a worker dies, the next `start`, `submit` or `next_result` call that
+    waits raises `RuntimeError` instead of waiting forever.
+    """
+
+    def __init__(
+        self,
+        detector_factory,
+        workers: int = 3,
+        slots: Optional[int] = None,
+        context: str = "spawn",
+        scale_selector: Optional[ScaleSelector] = None,
+        start_timeout: float = 60.0,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.detector_factory = detector_factory
+        self.num_workers = workers
+        self.num_slots = slots or 2 * workers
+        if (
+            scale_selector is None
+            and getattr(detector_factory, "scale", None) == "auto"
+        ):
+            scale_selector = ScaleSelector()
+        self.scale_selector = scale_selector
+        self.start_timeout = start_timeout
+        self._context = multiprocessing.get_context(context)
+        self._workers = []
+        self._pending: Dict[int, _PendingFrame] = {}
+        self._lock = threading.Lock()
+        self._ready = ReorderBuffer()
+        self._free_slots = queue.Queue()
+        self._slot_size = None
+        self._collector = None
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self._latency = 0.0
+        self._started = None
+
+    def start(self, frame_shape: Tuple[int, int]) -> None:
+        """Allocate slots for frames of `frame_shape` and wait for the workers."""
+        ctx = self._context
+        self._slot_size = int(frame_shape[0] * frame_shape[1])
+        buffer = ctx.RawArray("B", self.num_slots * self._slot_size)
+        self._frames = np.frombuffer(buffer, np.uint8).reshape(-1, self._slot_size)
+        for slot in range(self.num_slots):
+            self._free_slots.put(slot)
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        for _ in range(self.num_workers):
+            worker = ctx.Process(
+                target=_detection_worker,
+                args=(
+                    self.detector_factory,
+                    buffer,
+                    self._slot_size,
+                    self._tasks,
+                    self._results,
+                ),
+                daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+        deadline = time.monotonic() + self.start_timeout
+        try:
+            for _ in self._workers:
+                kind, detail = self._wait(self._results.get, deadline)
+                if kind != "ready":
+                    raise RuntimeError("Detection worker failed: {}".format(detail))
+        except Exception:
+            for worker in self._workers:
+                worker.terminate()
+            raise
+        self._collector = threading.Thread(
+            target=self._collect, name="detection-collector", daemon=True
+        )
+        self._collector.start()
+        self._started = time.monotonic()
+        self.logger.info("Started %s detection workers", self.num_workers)
+
+    def _check_workers(self) -> None:
+        for worker in self._workers:
+            if worker.exitcode is not None:
+                raise RuntimeError(
+                    "Detection worker {} exited with code {}".format(
+                        worker.pid, worker.exitcode
+                    )
+                )
+
+    def _wait(self, get, deadline: Optional[float], poll: float = 0.5):
+        """
+        `get(timeout=...)` in short waits, raising `RuntimeError` if a worker
+        has died in the meantime and `TimeoutError` at `deadline`.
+        """
+        while True:
+            wait = poll
+            if deadline is not None:
+                wait = min(poll, max(0.0, deadline - time.monotonic()))
+            try:
+                return get(timeout=wait)
+            except queue.Empty:
+                pass
+            self._check_workers()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError
+
+    def submit(
+        self,
+        index: int,
+        gray: np.ndarray,
+        context: Any = None,
+        timeout: Optional[float] = None,
+    ) -> bool:
+        """
+        Queue `gray` for detection, waiting up to `timeout` for a free slot.
+
+        `context` comes back with the result, e.g. the color frame to draw on.
+        Returns False if the frame was dropped for lack of a slot.
+        """
+        if self._slot_size is None:
+            self.start(gray.shape)
+        if gray.size > self._slot_size:
+            raise ValueError(
+                "Frame {} is larger than the pool's slots".format(gray.shape)
+            )
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            slot = self._wait(self._free_slots.get, deadline)
+        except TimeoutError:
+            self.dropped += 1
+            return False
+        self._frames[slot, : gray.size] = gray.ravel()
+        with self._lock:
+            self._pending[index] = _PendingFrame(slot, context, time.monotonic())
+        self._ready.expect(index)
+        scale = None if self.scale_selector is None else self.scale_selector.scale
+        self._tasks.put(("faces", index, slot, gray.shape, scale))
+        self.submitted += 1
+        return True
+
+    def next_result(
+        self, timeout: Optional[float] = 0
+    ) -> Optional[Tuple[int, Any, List[Detection]]]:
+        """The next finished (index, context, detections), in submission order."""
+
+        def ready(timeout):
+            result = self._ready.get(timeout)
+            if result is None:
+                raise queue.Empty
+            return result
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            result = self._wait(ready, deadline)
+        except TimeoutError:
+            return None
+        index, (context, detections) = result
+        return index, context, detections
+
+    def _collect(self) -> None:
+        while True:
+            message = self._results.get()
+            if message is None:
+                break
+            kind, index = message[:2]
+            with self._lock:
+                pending = self._pending[index]
+                if kind == "faces":
+                    pending.faces = message[2]
+                    if self.scale_selector is not None:
+                        self.scale_selector.observe(pending.faces)
+                else:
+                    number, detection = message[2:]
+                    pending.detections[number] = detection
+                if not pending.complete:
+                    continue
+                del self._pending[index]
+            detections = [pending.detections[n] for n in range(len(pending.faces))]
+            latency = time.monotonic() - pending.submitted
+            self._latency = 0.9 * self._latency + 0.1 * latency
+            self.completed += 1
+            self._free_slots.put(pending.slot)
+            self._ready.put(index, (pending.context, detections))
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        return {
+            "stage": "detection-pool",
+            "workers": self.num_workers,
+            "frames": self.completed,
+            "fps": round(self.completed / elapsed, 1) if elapsed else 0.0,
+            "in_flight": self.submitted - self.completed,
+            "dropped": self.dropped,
+            "latency_ms": round(1000 * self._latency, 1),
+        }
+
+    def close(self, timeout: float = 2.0) -> None:
+        if self._collector is None:
+            return
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self._results.put(None)
+        self._collector.join(timeout)
+        self._collector = None
@@ -0,0 +1,617 @@
+"""Threaded capture, processing and output stages.
+
+The camera is read on its own thread into a small ring buffer that drops the
+oldest frame when full, so a slow consumer never blocks the capture. A single
+processing thread turns frames into named views, which are then fanned out to
+sinks (LED output, video writer, ...) that each run on their own thread. The
+display runs on the main thread, since GUI toolkits insist on it.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.keymap import QUIT
+from ghostwriter.metrics import METRICS
+
+
+class FramePacket(NamedTuple):
+    """A captured frame and the named views derived from it."""
+
+    index: int
+    timestamp: float
+    images: Dict[str, np.ndarray]
+
+
+class RingBuffer:
+    """
+    Bounded, thread-safe FIFO that drops the oldest item when full.
+
+    With `drop="newest"` it refuses the incoming item instead, which keeps
+    what's already queued contiguous. `prepare`, if given, is applied to each
+    item on the thread that puts it, e.g. to copy what the consumer reads.
+    """
+
+    def __init__(
+        self,
+        maxlen: int = 2,
+        drop: str = "oldest",
+        prepare: Optional[Callable[[Any], Any]] = None,
+    ):
+        if drop not in ("oldest", "newest"):
+            raise ValueError("Unknown drop policy {!r}".format(drop))
+        self.prepare = prepare
+        self._items = deque(maxlen=maxlen)
+        self._condition = threading.Condition()
+        self._closed = False
+        self.drop = drop
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def maxlen(self) -> int:
+        return self._items.maxlen
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def put(self, item: Any) -> None:
+        if self.prepare is not None:
+            item = self.prepare(item)
+        with self._condition:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+                if self.drop == "newest":
+                    return
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """Oldest item, or None on timeout or once closed and drained."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._items or self._closed, timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def get_latest(self, timeout: Optional[float] = None) -> Any:
+        """Newest item, discarding (and counting) anything older."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._items or self._closed, timeout)
+            if not self._items:
+                return None
+            self.dropped += len(self._items) - 1
+            item = self._items.pop()
+            self._items.clear()
+            return item
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class StageStats:
+    """Frame counter with an exponentially smoothed frames-per-second."""
+
+    def __init__(self, name: str, smoothing: float = 0.9):
+        self.name = name
+        self.frames = 0
+        self._smoothing = smoothing
+        self._fps = 0.0
+        self._last = None
+
+    @property
+    def fps(self) -> float:
+        return self._fps
+
+    def tick(self) -> None:
+        now = time.monotonic()
+        if self._last is not None and now > self._last:
+            rate = 1.0 / (now - self._last)
+            if self.frames > 1:
+                rate = self._smoothing * self._fps + (1 - self._smoothing) * rate
+            self._fps = rate
+        self._last = now
+        self.frames += 1
+
+
+class Stage(threading.Thread):
+    """A pipeline stage that repeatedly calls `step` on its own thread."""
+
+    def __init__(self, name: str, input_buffer: Optional[RingBuffer] = None):
+        super().__init__(name=name, daemon=True)
+        self.logger = logging.getLogger(__name__)
+        self.input_buffer = input_buffer
+        self.stats = StageStats(name)
+        self._stop_event = threading.Event()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def step(self) -> None:
+        raise NotImplementedError
+
+    def on_stop(self) -> None:
+        pass
+
+    def run(self) -> None:
+        try:
+            while not self.stopped:
+                self.step()
+        except Exception:
+            self.logger.exception("Stage %s failed", self.name)
+        finally:
+            self.stop()
+            self.on_stop()
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {"stage": self.name, "frames": self.stats.frames}
+        summary["fps"] = round(self.stats.fps, 1)
+        if self.input_buffer is not None:
+            summary["queue"] = len(self.input_buffer)
+            summary["dropped"] = self.input_buffer.dropped
+        return summary
+
+    def _next_packet(self, timeout: float = 0.1) -> Optional[FramePacket]:
+        packet = self.input_buffer.get(timeout=timeout)
+        if packet is None and self.input_buffer.closed:
+            self.stop()
+        return packet
+
+
+class CaptureStage(Stage):
+    """Reads frames from anything with a `read()` like `cv.VideoCapture`."""
+
+    def __init__(self, source, outputs: Iterable[RingBuffer], name="capture"):
+        super().__init__(name=name)
+        self.source = source
+        self.outputs = list(outputs)
+
+    def step(self) -> None:
+        with METRICS.timer(self.name):
+            ret, frame = self.source.read()
+        if not ret or frame is None:
+            # Files and clips run out; a source that never delivers is broken.
+            if self.stats.frames:
+                self.logger.info("Source ended after %d frames", self.stats.frames)
+            else:
+                self.logger.error("No captured frame; is your camera available?")
+            self.stop()
+            return
+        packet = FramePacket(self.stats.frames, time.time(), {"frame": frame})
+        self.stats.tick()
+        METRICS.tick(self.name)
+        for output in self.outputs:
+            output.put(packet)
+
+    def on_stop(self) -> None:
+        for output in self.outputs:
+            output.close()
+        if hasattr(self.source, "release"):
+            self.source.release()
+
+
+class ProcessStage(Stage):
+    """Maps packets through `process`; a None result drops the frame."""
+
+    def __init__(
+        self,
+        process: Callable[[FramePacket], Optional[FramePacket]],
+        input_buffer: RingBuffer,
+        outputs: Iterable[RingBuffer],
+        name="process",
+    ):
+        super().__init__(name=name, input_buffer=input_buffer)
+        self.process = process
+        self.outputs = list(outputs)
+
+    def step(self) -> None:
+        packet = self._next_packet()
+        if packet is None:
+            return
+        with METRICS.timer(self.name):
+            result = self.process(packet)
+        self.stats.tick()
+        METRICS.tick(self.name)
+        if result is None:
+            return
+        for output in self.outputs:
+            output.put(result)
+
+    def on_stop(self) -> None:
+        for output in self.outputs:
+            output.close()
+
+
+class Sink:
+    """
+    Consumes processed packets.
+
+    A sink may set `buffer_size` and `drop` to size its input queue and pick
+    what a full queue drops; see `RingBuffer`. By default it gets the
+    pipeline's `buffer_size` and drops the oldest packet.
+
+    Processing reuses its output buffers a few frames later, sooner than a
+    queued packet may reach a slow sink, so pipelines queue copies of the
+    views a sink reads: its `views`, or its one `view`, or by default all of
+    them (see `sink_buffer`). A sink can keep what it's given for as long
+    as it likes.
+    """
+
+    buffer_size: Optional[int] = None
+    drop = "oldest"
+    views: Optional[List[str]] = None
+
+    def write(self, packet: FramePacket) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class PrefixedSink(Sink):
+    """Passes packets on to `sink` with each view renamed `prefix + view`."""
+
+    def __init__(self, sink: Sink, prefix: str):
+        self.sink = sink
+        self.prefix = prefix
+        self.buffer_size = sink.buffer_size
+        self.drop = sink.drop
+
+    @property
+    def views(self) -> Optional[List[str]]:
+        views = sink_views(self.sink)
+        if views is None:
+            return None
+        return [
+            view[len(self.prefix) :] for view in views if view.startswith(self.prefix)
+        ]
+
+    def write(self, packet: FramePacket) -> None:
+        self.sink.write(prefix_views(packet, self.prefix))
+
+    def close(self) -> None:
+        self.sink.close()
+
+
+def sink_views(sink: Sink) -> Optional[List[str]]:
+    """The views `sink` reads: its `views`, or its one `view`; None for all."""
+    views = getattr(sink, "views", None)
+    if views is not None:
+        return list(views)
+    view = getattr(sink, "view", None)
+    return None if view is None else [view]
+
+
+def copy_views(
+    packet: FramePacket, views: Optional[Iterable[str]] = None
+) -> FramePacket:
+    """
+    `packet` with its `views`, or all of them, copied, so whoever produced
+    it can reuse their buffers. Any other views are passed on as they are.
+    """
+    images = dict(packet.images)
+    for view in images if views is None else views:
+        image = images.get(view)
+        if image is not None:
+            images[view] = image.copy()
+    return packet._replace(images=images)
+
+
+def sink_buffer(sink: Sink, buffer_size: int) -> RingBuffer:
+    """
+    The queue in front of `sink`, as long and dropping what it asks for,
+    which copies the views it reads as packets are put in.
+    """
+    return RingBuffer(
+        sink.buffer_size or buffer_size,
+        sink.drop,
+        prepare=partial(copy_views, views=sink_views(sink)),
+    )
+
+
+def prefix_views(packet: FramePacket, prefix: str) -> FramePacket:
+    return packet._replace(
+        images={prefix + view: image for view, image in packet.images.items()}
+    )
+
+
+def enlarge_views(packet: FramePacket, views: Iterable[str]) -> FramePacket:
+    """
+    `packet` with each of `views` scaled up to the size of its largest view,
+    normally the camera frame, for effects rendered at a smaller size. Pixels
+    are repeated, not blended, so they look like the LEDs.
+    """
+    images = packet.images
+    views = [view for view in views if images.get(view) is not None]
+    if not views or not images:
+        return packet
+    largest = max(images.values(), key=lambda image: image.shape[0] * image.shape[1])
+    size = largest.shape[1::-1]
+    images = dict(images)
+    for view in views:
+        if images[view].shape[1::-1] != size:
+            images[view] = cv.resize(images[view], size, interpolation=cv.INTER_NEAREST)
+    return packet._replace(images=images)
+
+
+class EnlargedSink(Sink):
+    """Passes packets on to `sink` with `views` enlarged by `enlarge_views`."""
+
+    def __init__(self, sink: Sink, views: Iterable[str]):
+        self.sink = sink
+        self.full_size_views = list(views)
+        self.buffer_size = sink.buffer_size
+        self.drop = sink.drop
+
+    @property
+    def views(self) -> Optional[List[str]]:
+        return sink_views(self.sink)
+
+    def write(self, packet: FramePacket) -> None:
+        self.sink.write(enlarge_views(packet, self.full_size_views))
+
+    def close(self) -> None:
+        self.sink.close()
+
+
+def sink_name(sink: Sink) -> str:
+    """The class name of `sink`, or of the sink it wraps, to name its stage."""
+    while isinstance(sink, (PrefixedSink, EnlargedSink)):
+        sink = sink.sink
+    return type(sink).__name__
+
+
+class SinkStage(Stage):
+    """Feeds packets to a sink on a dedicated thread."""
+
+    def __init__(self, sink: Sink, input_buffer: RingBuffer, name="sink"):
+        super().__init__(name=name, input_buffer=input_buffer)
+        self.sink = sink
+
+    def step(self) -> None:
+        packet = self._next_packet()
+        if packet is None:
+            return
+        with METRICS.timer(self.name):
+            self.sink.write(packet)
+        self.stats.tick()
+        METRICS.tick(self.name)
+
+    def on_stop(self) -> None:
+        self.sink.close()
+
+
+class CallbackSink(Sink):
+    """Calls `callback` with one named view, e.g. to push it to the LEDs."""
+
+    def __init__(self, callback: Callable[[np.ndarray], Any], view: str):
+        self.callback = callback
+        self.view = view
+
+    def write(self, packet: FramePacket) -> None:
+        image = packet.images.get(self.view)
+        if image is not None:
+            self.callback(image)
+
+
+class LedSink(CallbackSink):
+    """Pushes the LED-resolution view to a strip writer."""
+
+    def __init__(self, write: Callable[[np.ndarray], Any], view: str = "OutputDown"):
+        super().__init__(write, view)
+
+
+class VideoWriterSink(Sink):
+    """Writes one named view to a video file, opened on the first frame."""
+
+    def __init__(
+        self,
+        filename: str,
+        view: str,
+        fps: float = 12.0,
+        fourcc: str = "MJPG",
+        start_when: Optional[Callable[[np.ndarray], bool]] = None,
+    ):
+        self.filename = filename
+        self.view = view
+        self.fps = fps
+        self.fourcc = fourcc
+        self.start_when = start_when
+        self._writer = None
+
+    def write(self, packet: FramePacket) -> None:
+        image = packet.images.get(self.view)
+        if image is None:
+            return
+        if self._writer is None:
+            if self.start_when is not None and not self.start_when(image):
+                return
+            self._writer = cv.VideoWriter(
+                filename=self.filename,
+                apiPreference=0,
+                fourcc=cv.VideoWriter_fourcc(*self.fourcc),
+                fps=self.fps,
+                frameSize=image.shape[:2][::-1],
+                isColor=image.ndim == 3,
+            )
+            assert self._writer.isOpened()
+        self._writer.write(image)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+
+
+class DisplaySink(Sink):
+    """Shows named views on the main thread.
+
+    `show` is called as `show(window_name, image)` for each view and
+    `wait_key(ms)` services the GUI event loop, returning a key code. With
+    `max_fps`, frames are shown at most that often, whatever the processing
+    rate; the event loop is still serviced in between. `full_size_views`
+    are enlarged with `enlarge_views` as they're shown, so frames that are
+    never shown are never enlarged.
+    """
+
+    def __init__(
+        self,
+        views: Optional[Iterable[str]] = None,
+        show: Callable[[str, np.ndarray], Any] = cv.imshow,
+        wait_key: Callable[[int], int] = cv.waitKey,
+        on_key: Optional[Callable[[int], Any]] = None,
+        max_fps: Optional[float] = None,
+        full_size_views: Iterable[str] = (),
+    ):
+        self.views = None if views is None else list(views)
+        self.full_size_views = list(full_size_views)
+        self.show = show
+        self.wait_key = wait_key
+        self.on_key = on_key
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self._next = 0.0
+
+    def due(self) -> bool:
+        """Whether it's time to show another frame."""
+        return time.monotonic() >= self._next
+
+    def write(self, packet: FramePacket) -> None:
+        self._next = time.monotonic() + self.interval
+        if self.full_size_views:
+            packet = enlarge_views(packet, self.full_size_views)
+        views = self.views if self.views is not None else list(packet.images)
+        for view in views:
+            image = packet.images.get(view)
+            if image is not None:
+                self.show(view, image)
+
+    def poll(self, delay_ms: int = 1) -> int:
+        key = self.wait_key(delay_ms)
+        if key is not None and key != -1 and self.on_key is not None:
+            self.on_key(key)
+        return key
+
+
+class Pipeline:
+    """Capture -> process -> sinks, with the display on the calling thread."""
+
+    def __init__(
+        self,
+        source,
+        process: Callable[[FramePacket], Optional[FramePacket]],
+        sinks: Iterable[Sink] = (),
+        display: Optional[DisplaySink] = None,
+        buffer_size: int = 2,
+        reporters: Iterable[Callable[[], Dict[str, Any]]] = (),
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.reporters = list(reporters)
+        capture_buffer = RingBuffer(buffer_size)
+        sinks = list(sinks)
+        sink_buffers = [sink_buffer(sink, buffer_size) for sink in sinks]
+        self.display = display
+        self.display_buffer = None
+        if display is not None:
+            self.display_buffer = sink_buffer(display, 1)
+        self.display_stats = StageStats("display")
+
+        process_outputs = list(sink_buffers)
+        if self.display_buffer is not None:
+            process_outputs.append(self.display_buffer)
+
+        self.capture = CaptureStage(source, [capture_buffer])
+        self.processor = ProcessStage(process, capture_buffer, process_outputs)
+        self.sinks = [
+            SinkStage(sink, buffer, name=sink_name(sink))
+            for sink, buffer in zip(sinks, sink_buffers)
+        ]
+
+    @property
+    def stages(self) -> List[Stage]:
+        return [self.capture, self.processor] + self.sinks
+
+    def start(self) -> None:
+        for stage in reversed(self.stages):
+            stage.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        """Stop capturing, then let the downstream stages drain."""
+        self.capture.stop()
+        self._finish(self.capture, timeout)
+        for buffer in self.capture.outputs:
+            buffer.close()
+        self._finish(self.processor, timeout)
+        for buffer in self.processor.outputs:
+            buffer.close()
+        for sink in self.sinks:
+            self._finish(sink, timeout)
+
+    @staticmethod
+    def _finish(stage: Stage, timeout: float) -> None:
+        if stage.is_alive():
+            stage.join(timeout)
+        stage.stop()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        stats = [stage.summary() for stage in self.stages]
+        if self.display_buffer is not None:
+            stats.append(
+                {
+                    "stage": self.display_stats.name,
+                    "frames": self.display_stats.frames,
+                    "fps": round(self.display_stats.fps, 1),
+                    "queue": len(self.display_buffer),
+                    "dropped": self.display_buffer.dropped,
+                }
+            )
+        stats.extend(report() for report in self.reporters)
+        return stats
+
+    def log_stats(self) -> None:
+        for stage in self.stats():
+            self.logger.info("%s", stage)
+
+    def run(self, stats_interval: float = 5.0) -> None:
+        """Run until the source is exhausted or the quit key is pressed."""
+        self.start()
+        next_report = time.monotonic() + stats_interval
+        try:
+            while not self.processor.stopped:
+                if self.display is not None:
+                    packet = None
+                    if self.display.due():
+                        packet = self.display_buffer.get_latest(timeout=0.01)
+                    else:
+                        time.sleep(0.005)
+                    if packet is not None:
+                        with METRICS.timer("display"):
+                            self.display.write(packet)
+                        self.display_stats.tick()
+                        METRICS.tick("display")
+                    if self.display.poll() == QUIT:
+                        self.logger.info("Quit key pressed.")
+                        break
+                else:
+                    self.processor.join(0.1)
+                if time.monotonic() >= next_report:
+                    self.log_stats()
+                    next_report += stats_interval
+        finally:
+            self.stop()
+            if self.display is not None:
+                self.display.close()
+            self.log_stats()
@@ -0,0 +1,274 @@
+"""Previews that don't need a desktop session.
+
+`MjpegServer` serves the latest frame of each view over HTTP, as a snapshot
+(`/<view>.jpg`) or an MJPEG stream (`/<view>.mjpg`) any browser can show;
+`PreviewSink` feeds it from the pipeline at a limited rate, so encoding JPEGs
+never competes with processing for more than `fps` frames a second.
+"""
+import argparse
+import html
+import logging
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.pipeline import (
+    DisplaySink,
+    FramePacket,
+    PrefixedSink,
+    Sink,
+    enlarge_views,
+)
+
+BOUNDARY = "ghostwriterframe"
+
+
+class _PreviewHandler(BaseHTTPRequestHandler):
+    server_version = "ghostwriter"
+
+    def do_GET(self):
+        preview = self.server.preview
+        path = unquote(self.path.split("?", 1)[0]).strip("/")
+        if not path:
+            self._send_index(preview.views)
+        elif path.endswith(".mjpg"):
+            self._send_stream(preview, path[: -len(".mjpg")])
+        elif path.endswith(".jpg"):
+            frame = preview.latest(path[: -len(".jpg")])
+            if frame is None:
+                self.send_error(404, "No such view")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(frame[1])))
+            self.end_headers()
+            self.wfile.write(frame[1])
+        else:
+            self.send_error(404)
+
+    def _send_index(self, views: List[str]) -> None:
+        images = "".join(
+            '<h2>{}</h2><img src="/{}.mjpg">'.format(html.escape(view), quote(view))
+            for view in views
+        )
+        body = "<html><body>{}</body></html>".format(images).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, preview: "MjpegServer", view: str) -> None:
+        self.send_response(200)
+        self.send_header(
+            "Content-Type", "multipart/x-mixed-replace; boundary=" + BOUNDARY
+        )
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        version = -1
+        try:
+            while True:
+                frame = preview.wait(view, version, timeout=1.0)
+                if preview.closed:
+                    return
+                if frame is None:
+                    continue
+                version, jpeg = frame
+                self.wfile.write(
+                    "--{}\r\nContent-Type: image/jpeg\r\n"
+                    "Content-Length: {}\r\n\r\n".format(BOUNDARY, len(jpeg)).encode()
+                )
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        logging.getLogger(__name__).debug(format, *args)
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    """An HTTP server with a thread per client, which Python 3.7 calls
+    `ThreadingHTTPServer`."""
+
+    daemon_threads = True
+
+
+class MjpegServer:
+    """
+    Serves the latest JPEG of each view over HTTP, on a background thread.
+
+    Each frame is encoded once by `publish`, however many clients watch.
+    Binds to the loopback interface by default; pass `host="0.0.0.0"` to
+    watch from elsewhere on the network.
+
+    :param port: Port to listen on; 0 picks a free one (see `port`).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080, quality: int = 80):
+        self.logger = logging.getLogger(__name__)
+        self.host = host
+        self.quality = quality
+        self.closed = False
+        self._frames: Dict[str, Tuple[int, bytes]] = {}
+        self._condition = threading.Condition()
+        self._httpd = _Server((host, port), _PreviewHandler)
+        self._httpd.preview = self
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="preview-server", daemon=True
+        )
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    @property
+    def views(self) -> List[str]:
+        with self._condition:
+            return list(self._frames)
+
+    def start(self) -> "MjpegServer":
+        self._thread.start()
+        self.logger.info("Preview at http://%s:%s/", self.host, self.port)
+        return self
+
+    def publish(self, view: str, image: np.ndarray) -> None:
+        ok, jpeg = cv.imencode(".jpg", image, [cv.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        with self._condition:
+            version = self._frames.get(view, (0, b""))[0] + 1
+            self._frames[view] = (version, jpeg.tobytes())
+            self._condition.notify_all()
+
+    def latest(self, view: str) -> Optional[Tuple[int, bytes]]:
+        with self._condition:
+            return self._frames.get(view)
+
+    def wait(
+        self, view: str, after: int, timeout: Optional[float] = None
+    ) -> Optional[Tuple[int, bytes]]:
+        """The latest frame of `view` newer than version `after`, once there is one."""
+
+        def fresh():
+            frame = self._frames.get(view)
+            return self.closed or (frame is not None and frame[0] > after)
+
+        with self._condition:
+            if not self._condition.wait_for(fresh, timeout) or self.closed:
+                return None
+            return self._frames[view]
+
+    def close(self) -> None:
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class PreviewSink(Sink):
+    """
+    Publishes views to an `MjpegServer`, at most `fps` times a second.
+
+    :param views: Names of the views to publish; all of them by default.
+    :param full_size_views: Views to enlarge, with `enlarge_views`, in the
+        frames that are published.
+    """
+
+    # Only the newest frame matters to a preview.
+    buffer_size = 1
+
+    def __init__(
+        self,
+        server: MjpegServer,
+        views: Optional[Iterable[str]] = None,
+        fps: float = 10.0,
+        full_size_views: Iterable[str] = (),
+    ):
+        self.server = server
+        self.views = None if views is None else list(views)
+        self.full_size_views = list(full_size_views)
+        self.interval = 1.0 / fps
+        self._next = None
+
+    def write(self, packet: FramePacket) -> None:
+        if self._next is not None and packet.timestamp < self._next:
+            return
+        self._next = packet.timestamp + self.interval
+        if self.full_size_views:
+            packet = enlarge_views(packet, self.full_size_views)
+        views = self.views if self.views is not None else list(packet.images)
+        for view in views:
+            image = packet.images.get(view)
+            if image is not None:
+                self.server.publish(view, image)
+
+    def close(self) -> None:
+        self.server.close()
+
+
+def build_preview(
+    args: argparse.Namespace,
+    views: Optional[Iterable[str]] = None,
+    full_size_views: Iterable[str] = (),
+    **display_kwargs
+) -> Tuple[Optional[DisplaySink], List[Sink]]:
+    """
+    The display and preview sinks the command line asks for, enlarging
+    `full_size_views` in the frames they show.
+    """
+    full_size_views = list(full_size_views)
+    display = None
+    if not args.headless:
+        display = DisplaySink(
+            views,
+            max_fps=args.preview_fps,
+            full_size_views=full_size_views,
+            **display_kwargs
+        )
+    sinks = []
+    if args.preview_port is not None:
+        server = MjpegServer(args.preview_host, args.preview_port).start()
+        sinks.append(
+            PreviewSink(
+                server, views, fps=args.preview_fps, full_size_views=full_size_views
+            )
+        )
+    return display, sinks
+
+
+def build_camera_previews(
+    args: argparse.Namespace,
+    names: Iterable[str],
+    views: Optional[Iterable[str]] = None,
+    full_size_views: Iterable[str] = (),
+    **display_kwargs
+) -> Tuple[Optional[DisplaySink], List[List[Sink]]]:
+    """
+    Like `build_preview` for a `MultiCameraPipeline`: one preview server for
+    every camera, with the views of each named "<camera>: <view>".
+    """
+    names = list(names)
+    full_size_views = [
+        "{}: {}".format(name, view) for name in names for view in full_size_views
+    ]
+    display = None
+    if not args.headless:
+        display = DisplaySink(
+            max_fps=args.preview_fps, full_size_views=full_size_views, **display_kwargs
+        )
+    sinks = [[] for _ in names]
+    if args.preview_port is not None:
+        server = MjpegServer(args.preview_host, args.preview_port).start()
+        for name, camera_sinks in zip(names, sinks):
+            preview = PreviewSink(
+                server, views, fps=args.preview_fps, full_size_views=full_size_views
+            )
+            camera_sinks.append(PrefixedSink(preview, name + ": "))
+    return display, sinks
@@ -0,0 +1,285 @@
+"""List a camera's modes and measure how long light takes to reach the LEDs.
+
+For each mode the camera accepts, the probe measures the frame rate it
+delivers, and with `--flash` the glass-to-LED latency: it lights the LEDs (or
+a window on screen, pointed at the camera) and times how long until a frame
+read from the camera shows it. That's the time a pass-through loop needs to
+react to light, including one write to the LEDs.
+
+    python -m ghostwriter.camera.probe --camera 0 --flash screen
+    python -m ghostwriter.camera.probe --camera 0 --flash leds --latest-frame
+"""
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.benchmark import LatencyStats
+from ghostwriter.camera.capture import (
+    CaptureSettings,
+    LatestFrameCapture,
+    capture_mode,
+    configure_capture,
+    open_camera,
+)
+from ghostwriter.utils import (
+    capture_settings,
+    default_arguments,
+    set_up_logging,
+    source_spec,
+)
+
+Flash = Callable[[bool], None]
+
+CANDIDATE_SIZES = (
+    (320, 240),
+    (640, 480),
+    (800, 600),
+    (1280, 720),
+    (1920, 1080),
+)
+CANDIDATE_FOURCCS = ("MJPG", "YUYV")
+CANDIDATE_FPS = (30.0, 60.0)
+
+
+def brightness(frame: np.ndarray) -> float:
+    """Mean level of a frame, over its color channels."""
+    return float(np.mean(cv.mean(frame)[: 1 if frame.ndim == 2 else 3]))
+
+
+def enumerate_modes(
+    cap,
+    sizes: Iterable[Tuple[int, int]] = CANDIDATE_SIZES,
+    fourccs: Iterable[str] = CANDIDATE_FOURCCS,
+    rates: Iterable[float] = CANDIDATE_FPS,
+) -> List[Dict[str, Any]]:
+    """
+    The distinct modes `cap` settles on when asked for each combination of
+    pixel format, size and rate. Drivers round requests to the nearest mode
+    they have, so asking is the only portable way to find out.
+    """
+    modes = []
+    for fourcc in fourccs:
+        for width, height in sizes:
+            for fps in rates:
+                settings = CaptureSettings(width, height, fps, fourcc)
+                mode = configure_capture(cap, settings)
+                mode.pop("buffer_size")
+                if mode not in modes:
+                    modes.append(mode)
+    return modes
+
+
+def measure_fps(cap, frames: int = 30) -> float:
+    """The rate `cap` delivers frames at, after the first."""
+    ok, _ = cap.read()
+    if not ok:
+        return 0.0
+    start = time.perf_counter()
+    for _ in range(frames):
+        ok, _ = cap.read()
+        if not ok:
+            return 0.0
+    return frames / (time.perf_counter() - start)
+
+
+def wait_for_brightness(
+    cap, above: float, timeout: float = 2.0
+) -> Tuple[Optional[float], float]:
+    """
+    Read frames until one is brighter than `above`. Returns when that frame's
+    read finished, or None after `timeout` seconds, and the last level seen.
+    """
+    deadline = time.perf_counter() + timeout
+    level = 0.0
+    while time.perf_counter() < deadline:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        now = time.perf_counter()
+        level = brightness(frame)
+        if level > above:
+            return now, level
+    return None, level
+
+
+def settle(cap, seconds: float) -> float:
+    """Read frames for `seconds`, and return the brightness of the last."""
+    level = 0.0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        level = brightness(frame)
+    return level
+
+
+def measure_latency(
+    cap,
+    flash: Flash,
+    trials: int = 5,
+    threshold: float = 30.0,
+    dark_seconds: float = 0.5,
+    timeout: float = 2.0,
+) -> Dict[str, Any]:
+    """
+    Time from switching `flash` on until a frame read from `cap` is at least
+    `threshold` levels brighter than with it off, over `trials` flashes.
+    """
+    logger = logging.getLogger(__name__)
+    stats = LatencyStats("latency")
+    missed = 0
+    for _ in range(trials):
+        flash(False)
+        dark = settle(cap, dark_seconds)
+        start = time.perf_counter()
+        flash(True)
+        seen, level = wait_for_brightness(cap, dark + threshold, timeout)
+        if seen is None:
+            logger.warning("Missed a flash: %.1f dark, %.1f lit", dark, level)
+            missed += 1
+        else:
+            stats.add(seen - start)
+    flash(False)
+    summary = stats.summary()
+    summary["missed"] = missed
+    return summary
+
+
+class ScreenFlash:
+    """Flashes a full-screen window, for a camera pointed at the screen."""
+
+    def __init__(self, name: str = "probe"):
+        self.name = name
+        cv.namedWindow(name, cv.WINDOW_NORMAL)
+        cv.setWindowProperty(name, cv.WND_PROP_FULLSCREEN, cv.WINDOW_FULLSCREEN)
+        self._images = {
+            on: np.full((480, 640, 3), 255 if on else 0, np.uint8)
+            for on in (False, True)
+        }
+
+    def __call__(self, on: bool) -> None:
+        cv.imshow(self.name, self._images[on])
+        cv.waitKey(1)
+
+    def close(self) -> None:
+        cv.destroyWindow(self.name)
+
+
+class LedFlash:
+    """Flashes the LED panel, for a camera pointed at the LEDs."""
+
+    def __init__(self, framebuffer):
+        self.framebuffer = framebuffer
+
+    def __call__(self, on: bool) -> None:
+        self.framebuffer.fill(255 if on else 0)
+
+    def close(self) -> None:
+        self.framebuffer.clear()
+
+
+def led_flash(count: int = 16 * 16) -> LedFlash:
+    from adafruit_blinka.board.raspberrypi.raspi_40pin import pin
+    import neopixel
+
+    from ghostwriter.pixel.framebuffer import LedFramebuffer, NeoPixelBackend
+
+    pixels = neopixel.NeoPixel(pin.D18, count, auto_write=False)
+    return LedFlash(LedFramebuffer(NeoPixelBackend(pixels), width=count, height=1))
+
+
+def probe(
+    index: int,
+    settings: CaptureSettings,
+    flash: Optional[Flash] = None,
+    trials: int = 5,
+    dark_seconds: float = 0.5,
+    open_capture: Callable[[int, CaptureSettings], Any] = open_camera,
+) -> List[Dict[str, Any]]:
+    """
+    Every mode of camera `index` with the frame rate it delivers and, given
+    `flash`, its latency, with `settings`' buffer size and newest-frame
+    reading applied in each. Each flash is preceded by `dark_seconds` with
+    the flash off.
+    """
+    logger = logging.getLogger(__name__)
+    # Asking for a pixel format opens the camera the way the modes will be,
+    # through V4L2 on Linux, so the modes found are that backend's.
+    cap = open_capture(index, CaptureSettings(fourcc=CANDIDATE_FOURCCS[0]))
+    if not cap.isOpened():
+        raise IOError("Could not open camera {}".format(index))
+    try:
+        modes = enumerate_modes(cap)
+    finally:
+        cap.release()
+
+    results = []
+    for mode in modes:
+        mode_settings = settings._replace(
+            width=mode["width"],
+            height=mode["height"],
+            fps=mode["fps"],
+            fourcc=mode["fourcc"],
+        )
+        cap = open_capture(index, mode_settings)
+        try:
+            result = capture_mode(cap)
+            result["latest"] = isinstance(cap, LatestFrameCapture)
+            result["measured_fps"] = round(measure_fps(cap), 1)
+            if flash is not None:
+                latency = measure_latency(cap, flash, trials, dark_seconds=dark_seconds)
+                result.update(
+                    latency_ms=latency["p50_ms"],
+                    latency_p90_ms=latency["p90_ms"],
+                    missed=latency["missed"],
+                )
+        finally:
+            cap.release()
+        logger.info("%s", result)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = default_arguments(description="List camera modes and their latency.")
+    parser.add_argument(
+        "--flash",
+        choices=("screen", "leds"),
+        help="Measure latency by flashing a window or the LEDs at the camera.",
+    )
+    parser.add_argument("--trials", type=int, default=5, help="Flashes per mode.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+    set_up_logging(args.verbose)
+
+    flash = None
+    if args.flash == "screen":
+        flash = ScreenFlash()
+    elif args.flash == "leds":
+        flash = led_flash()
+    try:
+        results = probe(
+            int(source_spec(args)), capture_settings(args), flash, args.trials
+        )
+    finally:
+        if flash is not None:
+            flash.close()
+
+    columns = ["fourcc", "width", "height", "fps", "measured_fps", "buffer_size"]
+    if flash is not None:
+        columns += ["latency_ms", "latency_p90_ms", "missed"]
+    print("".join("{:>15}".format(column) for column in columns))
+    for result in results:
+        print("".join("{:>15}".format(result[column]) for column in columns))
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
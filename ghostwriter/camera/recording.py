@@ -0,0 +1,191 @@
+"""Video recording in time- and size-limited segments."""
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.pipeline import FramePacket, Sink
+
+
+class RecordingSink(Sink):
+    """
+    Records one named view as a rolling series of video files.
+
+    Like every sink it encodes on its own thread, here behind a queue of
+    `buffer_size` frames that drops new frames while the encoder is behind.
+    Frames are placed by their capture timestamps: the container's fixed rate
+    is met by repeating a frame when capture runs slower than `fps` and
+    skipping frames when it runs faster, so recordings play back in real
+    time. Pauses longer than `max_gap` seconds are cut rather than filled.
+
+    :param directory: Where segments go; created if missing.
+    :param view: Name of the view to record.
+    :param segment_seconds: Start a new segment after this long.
+    :param segment_bytes: Also start one once a file grows past this size.
+    :param max_segments: Delete the oldest segments beyond this many.
+    :param start_when: Don't start recording until this returns True for a
+        frame, e.g. `np.any` to skip the initial black frames.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        view: str,
+        prefix: str = "recording",
+        fps: float = 12.0,
+        fourcc: str = "MJPG",
+        extension: str = ".avi",
+        segment_seconds: Optional[float] = 300.0,
+        segment_bytes: Optional[int] = None,
+        max_segments: Optional[int] = None,
+        buffer_size: int = 8,
+        drop: str = "newest",
+        start_when: Optional[Callable[[np.ndarray], bool]] = None,
+        max_gap: float = 1.0,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.view = view
+        self.prefix = prefix
+        self.fps = fps
+        self.fourcc = fourcc
+        self.extension = extension
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.buffer_size = buffer_size
+        self.drop = drop
+        self.start_when = start_when
+        self.max_gap = max_gap
+        self.segments = deque()
+        self.segment_count = 0
+        self.frames = 0
+        self.repeated = 0
+        self.skipped = 0
+        self.gaps = 0
+        self.deleted = 0
+        self._writer = None
+        self._started = False
+        self._segment_start = 0.0
+        self._segment_frames = 0
+        self._encode_time = 0.0
+
+    @property
+    def filename(self) -> Optional[str]:
+        """The segment being written, if any."""
+        return self.segments[-1] if self._writer is not None else None
+
+    def write(self, packet: FramePacket) -> None:
+        image = packet.images.get(self.view)
+        if image is None:
+            return
+        if not self._started:
+            if self.start_when is not None and not self.start_when(image):
+                return
+            self._started = True
+        if self._writer is None:
+            self._open(image, packet.timestamp)
+        elif self._segment_full(packet.timestamp):
+            self._close_segment()
+            self._open(image, packet.timestamp)
+
+        # Frames due by now, with a little slack for timestamps on the grid.
+        due = int((packet.timestamp - self._segment_start) * self.fps + 1e-6) + 1
+        repeats = due - self._segment_frames
+        if repeats <= 0:
+            self.skipped += 1
+            return
+        if repeats > 1 + self.max_gap * self.fps:
+            # Restart the clock instead of filling the pause with copies.
+            self._segment_start = packet.timestamp - self._segment_frames / self.fps
+            self.gaps += 1
+            repeats = 1
+        start = time.perf_counter()
+        for _ in range(repeats):
+            self._writer.write(image)
+        elapsed = time.perf_counter() - start
+        self._encode_time = 0.9 * self._encode_time + 0.1 * elapsed
+        self._segment_frames += repeats
+        self.repeated += repeats - 1
+        self.frames += 1
+
+    def _segment_full(self, timestamp: float) -> bool:
+        if self.segment_seconds is not None:
+            if timestamp - self._segment_start >= self.segment_seconds:
+                return True
+        if self.segment_bytes is not None:
+            try:
+                return os.path.getsize(self.segments[-1]) >= self.segment_bytes
+            except OSError:
+                return False
+        return False
+
+    def _open(self, image: np.ndarray, timestamp: float) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(timestamp))
+        filename = os.path.join(
+            self.directory,
+            "{}-{}-{:04d}{}".format(
+                self.prefix, stamp, self.segment_count, self.extension
+            ),
+        )
+        self._writer = cv.VideoWriter(
+            filename=filename,
+            apiPreference=0,
+            fourcc=cv.VideoWriter_fourcc(*self.fourcc),
+            fps=self.fps,
+            frameSize=image.shape[:2][::-1],
+            isColor=image.ndim == 3,
+        )
+        if not self._writer.isOpened():
+            self._writer = None
+            raise IOError("Could not open {} for writing".format(filename))
+        self.logger.info("Recording to %s", filename)
+        self.segments.append(filename)
+        self.segment_count += 1
+        self._segment_start = timestamp
+        self._segment_frames = 0
+        self._prune()
+
+    def _prune(self) -> None:
+        if self.max_segments is None:
+            return
+        while len(self.segments) > self.max_segments:
+            oldest = self.segments.popleft()
+            try:
+                os.remove(oldest)
+                self.deleted += 1
+                self.logger.info("Deleted old segment %s", oldest)
+            except OSError:
+                self.logger.warning("Could not delete %s", oldest, exc_info=True)
+
+    def _close_segment(self) -> None:
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+
+    def close(self) -> None:
+        self._close_segment()
+
+    def summary(self) -> Dict[str, Any]:
+        filename = self.filename
+        try:
+            size = os.path.getsize(filename) if filename else 0
+        except OSError:
+            size = 0
+        return {
+            "stage": "recording",
+            "segments": self.segment_count,
+            "frames": self.frames,
+            "repeated": self.repeated,
+            "skipped": self.skipped,
+            "gaps": self.gaps,
+            "deleted": self.deleted,
+            "file": os.path.basename(filename) if filename else None,
+            "bytes": size,
+            "encode_ms": round(1000 * self._encode_time, 2),
+        }
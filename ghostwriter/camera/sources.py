@@ -0,0 +1,192 @@
+"""Frame sources: cameras, video files, image directories and synthetic scenes.
+
+Every source offers the part of the `cv.VideoCapture` interface the pipeline
+uses, `read()`, `isOpened()` and `release()`, so they're interchangeable, and
+iterating over one yields its frames.
+"""
+import glob
+import logging
+import os
+import time
+from typing import Iterator, Optional, Sequence, Tuple, Union
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.capture import CaptureSettings, open_camera
+
+IMAGE_EXTENSIONS = (".bmp", ".jpeg", ".jpg", ".png", ".tif", ".tiff")
+
+
+class FrameSource:
+    """Base class; subclasses implement `read`."""
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        raise NotImplementedError
+
+    def isOpened(self) -> bool:
+        return True
+
+    def release(self) -> None:
+        pass
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        while True:
+            ok, frame = self.read()
+            if not ok:
+                return
+            yield frame
+
+
+class ReplaySource(FrameSource):
+    """
+    Replays frames held in memory, e.g. a clip loaded with `load_clip`.
+
+    :param loop: Start over at the end instead of stopping.
+    :param fps: Hand out frames no faster than this, like a camera would;
+        by default they come as fast as they're read.
+    """
+
+    def __init__(
+        self,
+        frames: Sequence[np.ndarray],
+        loop: bool = False,
+        fps: Optional[float] = None,
+    ):
+        self.frames = frames
+        self.loop = loop
+        self.interval = 1.0 / fps if fps else 0.0
+        self.position = 0
+        self._next = None
+
+    def read(self):
+        if self.position >= len(self.frames):
+            if not self.loop or not len(self.frames):
+                return False, None
+            self.position = 0
+        if self.interval:
+            now = time.monotonic()
+            if self._next is not None and now < self._next:
+                time.sleep(self._next - now)
+            self._next = max(now, self._next or now) + self.interval
+        frame = self.frames[self.position]
+        self.position += 1
+        return True, frame.copy()
+
+
+class ImageDirectorySource(FrameSource):
+    """The images in a directory, in file name order."""
+
+    def __init__(self, directory: str, loop: bool = False):
+        self.logger = logging.getLogger(__name__)
+        self.paths = sorted(
+            path
+            for path in glob.glob(os.path.join(directory, "*"))
+            if path.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        self.loop = loop
+        self.position = 0
+
+    def isOpened(self) -> bool:
+        return bool(self.paths)
+
+    def read(self):
+        if self.position >= len(self.paths):
+            if not self.loop or not self.paths:
+                return False, None
+            self.position = 0
+        path = self.paths[self.position]
+        self.position += 1
+        frame = cv.imread(path)
+        if frame is None:
+            self.logger.error("Could not read %s", path)
+            return False, None
+        return True, frame
+
+
+class SyntheticSource(FrameSource):
+    """
+    A reproducible scene: a fixed noisy background with a bright disc
+    sweeping across it and a dark square bobbing up and down.
+
+    :param frames: Number of frames before the source ends; None never ends.
+    :param seed: Seed for the background noise.
+    """
+
+    def __init__(
+        self,
+        width: int = 640,
+        height: int = 480,
+        frames: Optional[int] = None,
+        seed: int = 0,
+    ):
+        self.width = width
+        self.height = height
+        self.frames = frames
+        self.position = 0
+        rng = np.random.RandomState(seed)
+        ramp = np.linspace(40, 160, width, dtype=np.float32)
+        background = np.empty((height, width, 3), np.float32)
+        background[...] = ramp[np.newaxis, :, np.newaxis]
+        background += rng.normal(0, 8, size=background.shape)
+        self.background = np.clip(background, 0, 255).astype(np.uint8)
+
+    def read(self):
+        if self.frames is not None and self.position >= self.frames:
+            return False, None
+        t = self.position
+        self.position += 1
+        frame = self.background.copy()
+        size = min(self.width, self.height)
+        x = int((0.1 + 0.8 * ((0.01 * t) % 1)) * self.width)
+        y = int(self.height * (0.5 + 0.3 * np.sin(0.05 * t)))
+        cv.circle(frame, (x, self.height // 2), size // 8, (220, 230, 240), -1)
+        side = size // 10
+        left = self.width // 4
+        cv.rectangle(frame, (left, y - side), (left + side, y), (20, 20, 30), -1)
+        return True, frame
+
+
+def open_source(
+    spec: Union[int, str],
+    loop: bool = False,
+    settings: Optional[CaptureSettings] = None,
+):
+    """
+    Open a camera index, video file, image directory, or a synthetic scene
+    given as "synthetic" or "synthetic:WIDTHxHEIGHT". `loop` applies to image
+    directories; load a video with `load_clip` to replay it in a loop.
+    `settings` apply to cameras; see `ghostwriter.camera.capture`.
+    """
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return open_camera(int(spec), settings)
+    if spec.startswith("synthetic"):
+        _, _, size = spec.partition(":")
+        if size:
+            width, height = (int(value) for value in size.split("x"))
+            return SyntheticSource(width, height)
+        return SyntheticSource()
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, loop=loop)
+    return cv.VideoCapture(spec)
+
+
+def load_clip(
+    source: Union[int, str, FrameSource], frames: Optional[int] = None
+) -> list:
+    """
+    Read up to `frames` frames into memory, so replays don't pay to decode.
+    Endless sources, like cameras and synthetic scenes, need a limit.
+    """
+    if isinstance(source, (int, str)):
+        source = open_source(source)
+    clip = []
+    try:
+        while frames is None or len(clip) < frames:
+            ok, frame = source.read()
+            if not ok:
+                break
+            clip.append(frame)
+    finally:
+        source.release()
+    return clip
@@ -0,0 +1,160 @@
+"""Background subtraction algorithms, and picking one that keeps up.
+
+The subtractors' costs differ by orders of magnitude, so `benchmark_subtractors`
+times each over a clip at several resolutions, and `choose_subtractor` picks
+the most preferred one that meets a frame rate on the current machine.
+"""
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.benchmark import LatencyStats
+
+BACKGROUND_SUBTRACTION_ALGORITHMS = {
+    "MOG2": cv.createBackgroundSubtractorMOG2,
+    "KNN": cv.createBackgroundSubtractorKNN,
+    "CNT": cv.bgsegm.createBackgroundSubtractorCNT,
+    "GMG": cv.bgsegm.createBackgroundSubtractorGMG,  # Fucking great
+    "GSOC": cv.bgsegm.createBackgroundSubtractorGSOC,  # Meh
+    "LSBP": cv.bgsegm.createBackgroundSubtractorLSBP,  # Interesting
+    "MOG": cv.bgsegm.createBackgroundSubtractorMOG,
+}
+
+# Most preferred first, by how the masks look for the trail effect.
+PREFERENCE = ("GMG", "LSBP", "MOG2", "KNN", "CNT", "MOG", "GSOC")
+
+
+def _resident_bytes() -> int:
+    """Resident memory of this process, or 0 where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def resize_clip(clip: Sequence[np.ndarray], scale: float) -> List[np.ndarray]:
+    if scale == 1:
+        return list(clip)
+    return [
+        cv.resize(frame, None, fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+        for frame in clip
+    ]
+
+
+def benchmark_subtractor(
+    name: str,
+    clip: Sequence[np.ndarray],
+    learning_rate: float = 0.1,
+    budget: Optional[float] = None,
+    factory: Optional[Callable[[], Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Run one subtractor over `clip` and report its cost and mask stability.
+
+    `flicker` is the mean fraction of mask pixels that change between
+    consecutive frames, lower being steadier. It skips the first mask, which
+    most subtractors fill with foreground. With a `budget` in seconds per
+    frame, the run stops early once the median is well over it, and the
+    result is marked `"complete": False`.
+
+    :param factory: Creates the subtractor; defaults to the one named in
+        `BACKGROUND_SUBTRACTION_ALGORITHMS`.
+    """
+    factory = factory or BACKGROUND_SUBTRACTION_ALGORITHMS[name]
+    memory_before = _resident_bytes()
+    subtractor = factory()
+    stats = LatencyStats(name)
+    previous = None
+    flicker = []
+    complete = True
+    for number, frame in enumerate(clip):
+        start = time.perf_counter()
+        mask = subtractor.apply(frame, learningRate=learning_rate)
+        stats.add(time.perf_counter() - start)
+        if number >= 2:
+            flicker.append(np.count_nonzero(mask != previous) / mask.size)
+        previous = mask
+        if budget is not None and number >= 4 and stats.percentile(50) > 2 * budget:
+            complete = False
+            break
+    result = stats.summary()
+    result.update(
+        height=clip[0].shape[0],
+        width=clip[0].shape[1],
+        flicker=round(float(np.mean(flicker)), 4) if flicker else 0.0,
+        memory_mb=round(max(_resident_bytes() - memory_before, 0) / 2**20, 1),
+        complete=complete,
+    )
+    return result
+
+
+def benchmark_subtractors(
+    clip: Sequence[np.ndarray],
+    algorithms: Iterable[str] = PREFERENCE,
+    scales: Iterable[float] = (1.0, 0.5, 0.25),
+    budget: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """`benchmark_subtractor` for every algorithm at every scale."""
+    logger = logging.getLogger(__name__)
+    results = []
+    for scale in scales:
+        scaled = resize_clip(clip, scale)
+        for name in algorithms:
+            result = benchmark_subtractor(name, scaled, budget=budget)
+            result["scale"] = scale
+            logger.info("%s", result)
+            results.append(result)
+    return results
+
+
+def choose_subtractor(
+    clip: Sequence[np.ndarray],
+    target_fps: float,
+    algorithms: Iterable[str] = PREFERENCE,
+    headroom: float = 0.5,
+    scale: float = 1.0,
+) -> str:
+    """
+    The first of `algorithms` whose 90th percentile latency on `clip` fits in
+    `headroom` of the frame time at `target_fps`, leaving the rest for the
+    compositing. Falls back to the fastest if none does. `scale` is the
+    fraction of the frame size the subtractor will run at, e.g. the
+    compositor's, and the clip is timed at that size.
+    """
+    logger = logging.getLogger(__name__)
+    budget = headroom / target_fps
+    clip = resize_clip(clip, scale)
+    results = []
+    for name in algorithms:
+        result = benchmark_subtractor(name, clip, budget=budget)
+        results.append(result)
+        if result["complete"] and result["p90_ms"] / 1000 <= budget:
+            logger.info("Chose %s: %s", name, result)
+            return name
+    fastest = min(results, key=lambda result: result["p50_ms"])
+    logger.warning(
+        "No subtractor meets %s fps; using the fastest, %s", target_fps, fastest
+    )
+    return fastest["stage"]
+
+
+def format_results(results: Sequence[Dict[str, Any]]) -> str:
+    columns = (
+        "stage",
+        "scale",
+        "width",
+        "fps",
+        "p50_ms",
+        "p90_ms",
+        "flicker",
+        "memory_mb",
+    )
+    lines = ["".join("{:>10}".format(column) for column in columns)]
+    for result in results:
+        lines.append("".join("{:>10}".format(result[column]) for column in columns))
+    return "\n".join(lines)
@@ -0,0 +1,57 @@
+"""
+The effects of `test_animations.py`, computed for the whole panel at once with
+`ghostwriter.pixel.animations` and paced by `FrameScheduler`.
+"""
+import logging
+
+import board
+import neopixel
+
+from ghostwriter.pixel.animations import (
+    Animation,
+    Blend,
+    Chase,
+    Comet,
+    EffectSequence,
+    Pulse,
+    Rainbow,
+    Solid,
+    Sparkle,
+)
+from ghostwriter.pixel.framebuffer import LedFramebuffer, NeoPixelBackend
+from ghostwriter.pixel.layout import PanelLayout
+from ghostwriter.pixel.scheduler import FrameScheduler
+
+PURPLE = (180, 0, 255)
+WHITE = (255, 255, 255)
+AMBER = (255, 100, 0)
+JADE = (0, 255, 40)
+
+pixel_pin = board.D18
+layout = PanelLayout(16, 16)
+
+pixels = neopixel.NeoPixel(pixel_pin, layout.count, auto_write=False)
+framebuffer = LedFramebuffer(
+    NeoPixelBackend(pixels), brightness=0.5, index=layout.index
+)
+
+effects = EffectSequence(
+    Comet(PURPLE, speed=0.01, tail_length=10, bounce=True),
+    Blend(Rainbow(period=2), Sparkle(WHITE, density=0.05), "screen"),
+    Chase(WHITE, speed=0.1, size=3, spacing=6),
+    Pulse(AMBER, period=3),
+    Blend(Solid(JADE), Sparkle(WHITE, density=0.1), "lighten"),
+    Rainbow(period=2),
+    advance_interval=5,
+)
+
+# Effects are rendered in panel coordinates from each LED's strip position, so
+# they run along the wiring the way the adafruit ones do.
+scheduler = FrameScheduler(
+    Animation(effects, index=layout.index), framebuffer.show, fps=60.0
+)
+try:
+    scheduler.run()
+finally:
+    logging.getLogger(__name__).warning(scheduler.summary())
+    framebuffer.clear()
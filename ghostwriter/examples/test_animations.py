@@ -5,7 +5,11 @@ This example repeatedly displays all available animations, at a five second inte
 For NeoPixel FeatherWing. Update pixel_pin and pixel_num to match your wiring if using
 a different form of NeoPixels.
 This example does not work on SAMD21 (M0) boards.
+
+Frames are paced by `FrameScheduler` rather than a busy loop.
 """
+import logging
+
 import board
 import neopixel
 
@@ -25,6 +29,8 @@ from adafruit_led_animation.animation.customcolorchase import CustomColorChase
 from adafruit_led_animation.sequence import AnimationSequence
 from adafruit_led_animation.color import PURPLE, WHITE, AMBER, JADE, MAGENTA, ORANGE
 
+from ghostwriter.pixel.scheduler import FrameScheduler
+
 # Update to match the pin connected to your NeoPixels
 pixel_pin = board.D18
 # Update to match the number of NeoPixels you have connected
@@ -66,5 +72,14 @@ animations = AnimationSequence(
     auto_clear=True,
 )
 
-while True:
-    animations.animate()
+# The animations draw straight into the strip's buffer, so render and push in turn.
+scheduler = FrameScheduler(
+    render=lambda t: animations.animate(show=False),
+    show=lambda frame: pixels.show(),
+    fps=60.0,
+    pipelined=False,
+)
+try:
+    scheduler.run()
+finally:
+    logging.getLogger(__name__).warning(scheduler.summary())
@@ -0,0 +1,251 @@
+"""Where the frame time goes: per-stage timers, rolling histograms and rates.
+
+Stages time themselves with `METRICS.timer(name)` or `@METRICS.timed(name)`
+and count frames with `METRICS.tick(name)`. Until `--profile` turns the
+registry on, those are a flag check and a shared no-op context manager, so
+they can stay in the hot loops.
+
+    python -m ghostwriter.camera.examples.background --profile metrics.prom
+
+The snapshot is logged with the pipeline's stats and, given a file, written
+there as JSON or, for a .prom file, in the Prometheus text format a node
+exporter's textfile collector picks up.
+"""
+import argparse
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+QUANTILES = (0.5, 0.9, 0.99)
+PROMETHEUS_EXTENSIONS = (".prom", ".txt")
+
+
+class Histogram:
+    """The last `window` durations of one stage, and lifetime totals."""
+
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def quantiles(self, quantiles=QUANTILES) -> List[float]:
+        with self._lock:
+            samples = list(self.samples)
+        if not samples:
+            return [0.0 for _ in quantiles]
+        return [float(q) for q in np.quantile(samples, quantiles)]
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {"count": self.count}
+        for q, value in zip(QUANTILES, self.quantiles()):
+            summary["p{:g}_ms".format(100 * q)] = round(1000 * value, 3)
+        summary["max_ms"] = round(1000 * self.max, 3)
+        return summary
+
+
+class Rate:
+    """Events per second over the last `window` events."""
+
+    def __init__(self, window: int = 100, clock: Callable[[], float] = time.monotonic):
+        self.times = deque(maxlen=window)
+        self.count = 0
+        self.clock = clock
+
+    def tick(self) -> None:
+        self.times.append(self.clock())
+        self.count += 1
+
+    @property
+    def fps(self) -> float:
+        times = list(self.times)
+        if len(times) < 2 or times[-1] <= times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _NotTimed:
+    """The timer handed out while metrics are off; it does nothing."""
+
+    def __enter__(self) -> "_NotTimed":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NOT_TIMED = _NotTimed()
+
+
+class Metrics:
+    """
+    A registry of named histograms and rates, created on first use.
+
+    Disabled, `timer` hands out one shared no-op and `tick` and `observe`
+    return straight away.
+    """
+
+    def __init__(self, enabled: bool = False, window: int = 1000):
+        self.enabled = enabled
+        self.window = window
+        self.histograms: Dict[str, Histogram] = {}
+        self.rates: Dict[str, Rate] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> Histogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram(self.window))
+        return histogram
+
+    def rate(self, name: str) -> Rate:
+        rate = self.rates.get(name)
+        if rate is None:
+            with self._lock:
+                rate = self.rates.setdefault(name, Rate())
+        return rate
+
+    def timer(self, name: str):
+        """Context manager that records how long its block takes."""
+        if not self.enabled:
+            return _NOT_TIMED
+        return _Timer(self.histogram(name))
+
+    def timed(self, name: str):
+        """Decorator that records how long each call takes."""
+
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with _Timer(self.histogram(name)):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def observe(self, name: str, seconds: float) -> None:
+        if self.enabled:
+            self.histogram(name).observe(seconds)
+
+    def tick(self, name: str) -> None:
+        if self.enabled:
+            self.rate(name).tick()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.rates.clear()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Every metric's summary, by name."""
+        snapshot = {
+            name: histogram.summary()
+            for name, histogram in sorted(self.histograms.items())
+        }
+        for name, rate in sorted(self.rates.items()):
+            snapshot.setdefault(name, {}).update(
+                frames=rate.count, fps=round(rate.fps, 1)
+            )
+        return snapshot
+
+    def summary(self) -> Dict[str, Any]:
+        """The snapshot as a `Pipeline` reporter."""
+        return dict(stage="profile", **self.snapshot())
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {"time": time.time(), "metrics": self.snapshot()}, indent=2, sort_keys=True
+        )
+
+    def to_prometheus(self, prefix: str = "ghostwriter") -> str:
+        lines = []
+        for name, histogram in sorted(self.histograms.items()):
+            metric = _metric_name(prefix, name, "seconds")
+            lines.append("# TYPE {} summary".format(metric))
+            for q, value in zip(QUANTILES, histogram.quantiles()):
+                lines.append('{}{{quantile="{:g}"}} {:.6g}'.format(metric, q, value))
+            lines.append("{}_sum {:.6g}".format(metric, histogram.total))
+            lines.append("{}_count {}".format(metric, histogram.count))
+        for name, rate in sorted(self.rates.items()):
+            metric = _metric_name(prefix, name, "fps")
+            lines.append("# TYPE {} gauge".format(metric))
+            lines.append("{} {:.6g}".format(metric, rate.fps))
+            metric = _metric_name(prefix, name, "frames_total")
+            lines.append("# TYPE {} counter".format(metric))
+            lines.append("{} {}".format(metric, rate.count))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """
+        Write the metrics to `path`, in the Prometheus text format for .prom
+        and .txt files and as JSON otherwise. The file is replaced in one go,
+        so a collector never reads half of it.
+        """
+        if path.endswith(PROMETHEUS_EXTENSIONS):
+            text = self.to_prometheus()
+        else:
+            text = self.to_json()
+        temporary = "{}.tmp{}".format(path, os.getpid())
+        with open(temporary, "w") as fp:
+            fp.write(text)
+        os.replace(temporary, path)
+
+
+def _metric_name(prefix: str, name: str, unit: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "{}_{}_{}".format(prefix, name, unit))
+
+
+METRICS = Metrics()
+
+
+def profile_reporters(
+    args: argparse.Namespace, metrics: Optional[Metrics] = None
+) -> List[Callable[[], Dict[str, Any]]]:
+    """
+    Turn on `metrics` if `--profile` was given, and return the `Pipeline`
+    reporters that log them and write them to the `--profile` file.
+    """
+    metrics = METRICS if metrics is None else metrics
+    if args.profile is None:
+        return []
+    metrics.enabled = True
+
+    def report() -> Dict[str, Any]:
+        if args.profile:
+            metrics.write(args.profile)
+        return metrics.summary()
+
+    return [report]
@@ -0,0 +1,337 @@
+"""Whole-panel LED animations computed with NumPy.
+
+Each effect renders every LED at once from a time value into a float32
+`(height, width, 3)` RGB array with values from 0 to 1. Positions along the
+strip come from a layout index, so effects run along the wiring the way the
+adafruit `led_animation` ones do. Effects combine with `Blend` and
+`EffectSequence`, and `Animation` turns one into uint8 frames for
+`FrameScheduler` and `LedFramebuffer`.
+"""
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from ghostwriter.camera.buffers import FrameBufferPool
+
+Color = Tuple[int, int, int]
+
+
+def _color_wheel() -> np.ndarray:
+    """adafruit's `colorwheel`, as a `(256, 3)` table scaled to 0..1."""
+    position = np.arange(256)
+    ramp = 3 * (position % 85)
+    wheel = np.zeros((256, 3))
+    for third, (rising, falling) in enumerate([(1, 0), (2, 1), (0, 2)]):
+        rows = position // 85 == third
+        wheel[rows, falling] = 255 - ramp[rows]
+        wheel[rows, rising] = ramp[rows]
+    wheel[255] = wheel[0]
+    return (wheel / 255).astype(np.float32)
+
+
+COLOR_WHEEL = _color_wheel()
+
+
+def _rgb(color: Color) -> np.ndarray:
+    return np.asarray(color, np.float32) / 255
+
+
+class Effect:
+    """
+    Renders the whole panel for a point in time.
+
+    Subclasses implement `render`, writing into `out` and returning it.
+    `positions` is the float32 strip position of every LED, shaped
+    `(height, width)`.
+    """
+
+    def render(self, t: float, positions: np.ndarray, out: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        """Forget any state carried between frames."""
+
+
+class Solid(Effect):
+    def __init__(self, color: Color):
+        self.color = _rgb(color)
+
+    def render(self, t, positions, out):
+        out[...] = self.color
+        return out
+
+
+class Pulse(Effect):
+    """Fades `color` in and out once every `period` seconds."""
+
+    def __init__(self, color: Color, period: float = 5.0):
+        self.color = _rgb(color)
+        self.period = period
+
+    def render(self, t, positions, out):
+        level = 0.5 - 0.5 * np.cos(2 * np.pi * t / self.period)
+        out[...] = level * self.color
+        return out
+
+
+class Rainbow(Effect):
+    """The color wheel spread along the strip, turning once every `period`."""
+
+    def __init__(self, period: float = 5.0, spacing: float = 1.0):
+        self.period = period
+        self.spacing = spacing
+
+    def render(self, t, positions, out):
+        hue = positions * (256 * self.spacing / positions.size)
+        hue += 256 * t / self.period
+        np.take(COLOR_WHEEL, hue.astype(np.intp) & 255, axis=0, out=out)
+        return out
+
+
+class Chase(Effect):
+    """Runs of `size` lit LEDs separated by `spacing`, moving one LED per `speed`."""
+
+    def __init__(
+        self,
+        color: Color,
+        speed: float = 0.1,
+        size: int = 2,
+        spacing: int = 3,
+        reverse: bool = False,
+    ):
+        self.color = _rgb(color)
+        self.speed = speed
+        self.size = size
+        self.spacing = spacing
+        self.reverse = reverse
+
+    def render(self, t, positions, out):
+        step = int(t / self.speed)
+        offset = positions + (step if self.reverse else -step)
+        lit = np.mod(offset, self.size + self.spacing) < self.size
+        np.multiply(lit[..., np.newaxis], self.color, out=out)
+        return out
+
+
+class Comet(Effect):
+    """
+    A head moving one LED per `speed` seconds, trailing a fading tail.
+
+    The tail's brightness profile is a decay kernel computed once; each frame
+    looks every LED's distance behind the head up in it.
+
+    :param decay: Brightness kept by each LED further down the tail; by
+        default the tail fades linearly, like adafruit's.
+    """
+
+    def __init__(
+        self,
+        color: Color,
+        speed: float = 0.01,
+        tail_length: int = 10,
+        bounce: bool = False,
+        decay: Optional[float] = None,
+    ):
+        self.color = _rgb(color)
+        self.speed = speed
+        self.tail_length = tail_length
+        self.bounce = bounce
+        if decay is None:
+            kernel = np.linspace(1, 0, tail_length, endpoint=False)
+        else:
+            kernel = np.power(decay, np.arange(tail_length))
+        # Index tail_length is the zero every LED outside the tail looks up.
+        self.kernel = np.append(kernel, 0).astype(np.float32)
+
+    def render(self, t, positions, out):
+        count = positions.size
+        step = int(t / self.speed)
+        direction = 1
+        if self.bounce:
+            cycle = 2 * (count - 1) if count > 1 else 1
+            step %= cycle
+            if step >= count:
+                step, direction = cycle - step, -1
+        else:
+            # Let the tail run off the end before starting again.
+            step %= count + self.tail_length
+        distance = direction * (step - positions)
+        outside = (distance < 0) | (distance >= self.tail_length)
+        distance[outside] = self.tail_length
+        level = np.take(self.kernel, distance.astype(np.intp))
+        np.multiply(level[..., np.newaxis], self.color, out=out)
+        return out
+
+
+class Sparkle(Effect):
+    """
+    Random LEDs flash `color` and fade out.
+
+    :param density: Fraction of LEDs lit per `speed` seconds.
+    :param fade: Brightness kept after each `speed` seconds.
+    """
+
+    def __init__(
+        self,
+        color: Color,
+        speed: float = 0.1,
+        density: float = 0.05,
+        fade: float = 0.5,
+        seed: Optional[int] = None,
+    ):
+        self.color = _rgb(color)
+        self.speed = speed
+        self.density = density
+        self.fade = fade
+        self.seed = seed
+        self.reset()
+
+    def reset(self) -> None:
+        self._rng = np.random.default_rng(self.seed)
+        self._level = None
+        self._step = None
+
+    def render(self, t, positions, out):
+        step = int(t / self.speed)
+        if self._level is None or self._level.shape != positions.shape:
+            self._level = np.zeros(positions.shape, np.float32)
+            self._step = step - 1
+        # Catch up on every step since the last frame, but no more than it
+        # takes a sparkle to fade out.
+        for _ in range(min(max(step - self._step, 0), 32)):
+            self._level *= self.fade
+            lit = self._rng.random(positions.shape, np.float32) < self.density
+            self._level[lit] = 1
+        self._step = step
+        np.multiply(self._level[..., np.newaxis], self.color, out=out)
+        return out
+
+
+def _normal(base, top, out):
+    np.copyto(out, top)
+    return out
+
+
+def _add(base, top, out):
+    np.add(base, top, out=out)
+    return np.minimum(out, 1, out=out)
+
+
+def _screen(base, top, out):
+    # 1 - (1 - base)(1 - top) = base + top - base * top
+    product = np.multiply(base, top)
+    np.add(base, top, out=out)
+    return np.subtract(out, product, out=out)
+
+
+BLEND_MODES: Dict[str, Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]] = {
+    "normal": _normal,
+    "add": _add,
+    "multiply": lambda base, top, out: np.multiply(base, top, out=out),
+    "screen": _screen,
+    "lighten": lambda base, top, out: np.maximum(base, top, out=out),
+    "darken": lambda base, top, out: np.minimum(base, top, out=out),
+}
+
+
+class Blend(Effect):
+    """
+    Renders `top` over `base` with one of `BLEND_MODES`.
+
+    :param opacity: Mix of the blended result with `base`, from 0 to 1.
+    """
+
+    def __init__(self, base: Effect, top: Effect, mode="add", opacity: float = 1.0):
+        self.base = base
+        self.top = top
+        self.mode = BLEND_MODES[mode]
+        self.opacity = opacity
+        self._top = None
+
+    def reset(self) -> None:
+        self.base.reset()
+        self.top.reset()
+
+    def render(self, t, positions, out):
+        if self._top is None or self._top.shape != out.shape:
+            self._top = np.empty_like(out)
+            self._base = np.empty_like(out)
+        self.base.render(t, positions, out)
+        self.top.render(t, positions, self._top)
+        if self.opacity >= 1:
+            return self.mode(out, self._top, out)
+        np.copyto(self._base, out)
+        self.mode(self._base, self._top, out)
+        # base + opacity * (blended - base)
+        np.subtract(out, self._base, out=out)
+        np.multiply(out, self.opacity, out=out)
+        return np.add(out, self._base, out=out)
+
+
+class EffectSequence(Effect):
+    """
+    Shows each effect for `advance_interval` seconds in turn, like adafruit's
+    `AnimationSequence`. Each effect's clock restarts when it comes on.
+    """
+
+    def __init__(self, *effects: Effect, advance_interval: float = 5.0):
+        self.effects = effects
+        self.advance_interval = advance_interval
+        self._current = None
+
+    def current(self, t: float) -> int:
+        return int(t // self.advance_interval) % len(self.effects)
+
+    def reset(self) -> None:
+        self._current = None
+        for effect in self.effects:
+            effect.reset()
+
+    def render(self, t, positions, out):
+        current = self.current(t)
+        if current != self._current:
+            self.effects[current].reset()
+            self._current = current
+        local = t % self.advance_interval
+        return self.effects[current].render(local, positions, out)
+
+
+class Animation:
+    """
+    Turns an effect into uint8 RGB frames, e.g. `render` for a `FrameScheduler`.
+
+    Frames come from a two-deep ring of buffers, so a frame stays intact while
+    it's being pushed and the next one renders.
+
+    :param index: Strip position of each LED, e.g. a layout's `index`;
+        defaults to the panel's rows laid end to end.
+    """
+
+    def __init__(
+        self,
+        effect: Effect,
+        width: int = 16,
+        height: int = 16,
+        index: Optional[np.ndarray] = None,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.effect = effect
+        if index is None:
+            index = np.arange(width * height).reshape(height, width)
+        self.positions = np.asarray(index, np.float32)
+        self.pool = FrameBufferPool(depth=2)
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self.positions.shape + (3,)
+
+    def __call__(self, t: float) -> np.ndarray:
+        canvas = self.effect.render(
+            t, self.positions, self.pool.get("canvas", self.shape, np.float32)
+        )
+        np.multiply(canvas, 255, out=canvas)
+        frame = self.pool.next("frame", self.shape)
+        # Values are within 0..255 already; the cast truncates like `int()`.
+        np.copyto(frame, canvas, casting="unsafe")
+        return frame
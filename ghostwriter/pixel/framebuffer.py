@@ -0,0 +1,210 @@
+"""A NumPy framebuffer for the LED panel.
+
+Frames are whole `(height, width, 3)` arrays. Brightness and gamma are folded
+into one lookup table applied in a single vectorized pass, the result is
+reordered into the strip's byte order, and the strip is only written when the
+bytes actually differ from the last frame sent. The WS2812 protocol always
+clocks out the whole chain, so skipping unchanged frames is as fine-grained
+as the diff can usefully get.
+"""
+import logging
+import time
+from typing import Optional
+
+import numpy as np
+
+from ghostwriter.metrics import METRICS
+from ghostwriter.pixel.layout import gather_index
+
+
+class StripBackend:
+    """Something that can take a strip's worth of bytes and latch them."""
+
+    n = 0
+    bpp = 3
+    # The byte order `write` takes, or None for whatever the caller sends.
+    strip_order: Optional[str] = None
+
+    def write(self, data: np.ndarray) -> None:
+        """Copy `n * bpp` bytes, already in the strip's byte order."""
+        raise NotImplementedError
+
+    def show(self) -> None:
+        raise NotImplementedError
+
+
+class MockStrip(StripBackend):
+    """
+    An in-memory strip for tests and benchmarks.
+
+    `latency_per_pixel` simulates the time the real strip takes to clock out
+    each pixel (about 30 microseconds for a WS2812 at 800 kHz).
+    """
+
+    def __init__(self, n: int, bpp: int = 3, latency_per_pixel: float = 0.0):
+        self.n = n
+        self.bpp = bpp
+        self.latency_per_pixel = latency_per_pixel
+        self.buf = bytearray(n * bpp)
+        self.shows = 0
+
+    def write(self, data: np.ndarray) -> None:
+        memoryview(self.buf)[:] = data.tobytes()
+
+    def show(self) -> None:
+        if self.latency_per_pixel:
+            time.sleep(self.latency_per_pixel * self.n)
+        self.shows += 1
+
+    @property
+    def pixels(self) -> np.ndarray:
+        """The latched bytes, one row per pixel."""
+        return np.frombuffer(bytes(self.buf), np.uint8).reshape(self.n, self.bpp)
+
+
+class NeoPixelBackend(StripBackend):
+    """
+    Drives an adafruit `neopixel.NeoPixel`.
+
+    The strip's own brightness is pinned to 1 and auto-write turned off, since
+    the framebuffer applies brightness itself. Bytes go straight into the
+    pixel buffer when the library exposes it, in the strip's byte order, and
+    through slice assignment otherwise, in RGB order, which the library then
+    reorders itself.
+    """
+
+    def __init__(self, pixels):
+        self.logger = logging.getLogger(__name__)
+        self.pixels = pixels
+        self.n = pixels.n
+        self.bpp = getattr(pixels, "bpp", 3)
+        pixels.auto_write = False
+        pixels.brightness = 1.0
+        self._buffer = getattr(pixels, "_post_brightness_buffer", None)
+        self._offset = getattr(pixels, "_offset", 0)
+        if self._buffer is None:
+            self.logger.info("No raw pixel buffer; falling back to slice writes")
+            self.strip_order = "RGB"
+        else:
+            byteorder = getattr(pixels, "byteorder", None)
+            self.strip_order = byteorder if isinstance(byteorder, str) else None
+
+    def write(self, data: np.ndarray) -> None:
+        if self._buffer is not None:
+            end = self._offset + data.size
+            memoryview(self._buffer)[self._offset : end] = data.tobytes()
+        else:
+            # Slice assignment takes colors in RGB order and reorders itself.
+            self.pixels[:] = [tuple(pixel) for pixel in data.reshape(-1, self.bpp)]
+
+    def show(self) -> None:
+        self.pixels.show()
+
+
+class LedFramebuffer:
+    """
+    Holds the panel state as a `(height, width, 3)` uint8 array.
+
+    :param backend: Where the bytes go; see `MockStrip` and `NeoPixelBackend`.
+    :param brightness: Scale from 0 to 1, applied in the lookup table.
+    :param gamma: Gamma applied before brightness; 1 leaves values linear.
+    :param input_order: Channel order of frames passed to `show`, e.g. "BGR"
+        for OpenCV images.
+    :param strip_order: Byte order the strip expects ("GRB" for WS2812).
+        Defaults to the order the backend takes, if it has one, and to "GRB"
+        otherwise; a different one raises `ValueError`, since the colors
+        would come out swapped.
+    :param index: Strip position of each pixel, shaped like the frame, e.g.
+        the `index` of a `PanelLayout`; defaults to the panel's rows laid end
+        to end.
+    """
+
+    def __init__(
+        self,
+        backend: StripBackend,
+        width: int = 16,
+        height: int = 16,
+        brightness: float = 1.0,
+        gamma: float = 1.0,
+        input_order: str = "RGB",
+        strip_order: Optional[str] = None,
+        index: Optional[np.ndarray] = None,
+    ):
+        self.backend = backend
+        self.width = width
+        self.height = height
+        self.frame = np.zeros((height, width, 3), np.uint8)
+        self._gamma = gamma
+        self._brightness = brightness
+        self._lut = self._build_lut()
+        count = width * height
+        required = backend.strip_order
+        if strip_order is None:
+            strip_order = required or "GRB"
+        elif required is not None and strip_order != required:
+            raise ValueError(
+                "{} takes {} bytes, not {}".format(
+                    type(backend).__name__, required, strip_order
+                )
+            )
+        self.strip_order = strip_order
+        self._gather = gather_index(index, count, input_order, strip_order)
+        self._corrected = np.empty((height, width, 3), np.uint8)
+        self._bytes = np.empty(3 * count, np.uint8)
+        self._sent = None
+        self.writes = 0
+        self.skipped = 0
+
+    @property
+    def brightness(self) -> float:
+        return self._brightness
+
+    @brightness.setter
+    def brightness(self, value: float) -> None:
+        self._brightness = value
+        self._lut = self._build_lut()
+        self._sent = None
+
+    @property
+    def gamma(self) -> float:
+        return self._gamma
+
+    @gamma.setter
+    def gamma(self, value: float) -> None:
+        self._gamma = value
+        self._lut = self._build_lut()
+        self._sent = None
+
+    def _build_lut(self) -> np.ndarray:
+        levels = np.power(np.linspace(0, 1, 256), self._gamma) * self._brightness
+        return np.clip(np.rint(levels * 255), 0, 255).astype(np.uint8)
+
+    def _encode(self, frame: np.ndarray) -> np.ndarray:
+        np.take(self._lut, frame, out=self._corrected)
+        return np.take(self._corrected.reshape(-1), self._gather, out=self._bytes)
+
+    def show(self, frame: Optional[np.ndarray] = None) -> bool:
+        """Send `frame` (or the current state); False if nothing changed."""
+        if frame is not None:
+            np.copyto(self.frame, frame)
+        data = self._encode(self.frame)
+        if self._sent is not None and np.array_equal(data, self._sent):
+            self.skipped += 1
+            return False
+        with METRICS.timer("led_write"):
+            self.backend.write(data)
+            self.backend.show()
+        METRICS.tick("led_write")
+        if self._sent is None:
+            self._sent = data.copy()
+        else:
+            np.copyto(self._sent, data)
+        self.writes += 1
+        return True
+
+    def fill(self, color) -> bool:
+        self.frame[...] = color
+        return self.show()
+
+    def clear(self) -> bool:
+        return self.fill(0)
@@ -1,24 +1,39 @@
 from adafruit_blinka.board.raspberrypi.raspi_40pin import pin
+import argparse
 import time
 import neopixel
+import numpy as np
+
+from ghostwriter.metrics import profile_reporters
+from ghostwriter.pixel.framebuffer import LedFramebuffer, NeoPixelBackend
+from ghostwriter.utils import add_profile_argument, add_verbose_argument, set_up_logging
 
 # GPIO.XX =  pin.DXX
 
 
 def main():
-    pixels = neopixel.NeoPixel(pin.D18, 16 * 16, brightness=0.05)
+    parser = argparse.ArgumentParser(description="Show a gradient on the LEDs.")
+    add_profile_argument(parser)
+    add_verbose_argument(parser)
+    args = parser.parse_args()
+    set_up_logging(args.verbose)
+    reporters = profile_reporters(args)
+
+    pixels = neopixel.NeoPixel(pin.D18, 16 * 16, auto_write=False)
+    framebuffer = LedFramebuffer(NeoPixelBackend(pixels), brightness=0.05)
     try:
-        run(pixels)
+        run(framebuffer)
     finally:
-        for i in range(pixels.n):
-            pixels[i] = [0, 0, 0]
+        framebuffer.clear()
+        for report in reporters:
+            print(report())
 
 
-def run(pixels):
-    n = pixels.n
-    for i in range(n):
-        pixel_value = (100 % 256, (2 * i) % 256, (128 - 2 * i) % 256)
-        pixels[i % pixels.n] = pixel_value
+def run(framebuffer):
+    n = framebuffer.width * framebuffer.height
+    i = np.arange(n)
+    pixel_values = np.stack([np.full(n, 100), (2 * i) % 256, (128 - 2 * i) % 256], -1)
+    framebuffer.show(pixel_values.astype(np.uint8).reshape(framebuffer.frame.shape))
 
 
 if __name__ == "__main__":
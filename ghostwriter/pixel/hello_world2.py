@@ -2,33 +2,59 @@
 A debug script that should make N pixels change from red -> green -> blue over a few seconds.
 
 Note that the color bit depth decreases as brightness decreases and the rate is limited
-by the call to `pixels.fill`, even if inc = 0
+by the strip write, whatever `fps` asks for; the scheduler then skips steps.
 """
 from adafruit_blinka.board.raspberrypi.raspi_40pin import pin
-import time
+import argparse
 import neopixel
+import numpy as np
+
+from ghostwriter.metrics import profile_reporters
+from ghostwriter.pixel.framebuffer import LedFramebuffer, NeoPixelBackend
+from ghostwriter.pixel.scheduler import FrameScheduler
+from ghostwriter.utils import add_profile_argument, add_verbose_argument, set_up_logging
 
 # number of LEDs; fewer than available is OK
 N = 16 * 16
 # brightness parameter: increase to ~1 if you see strange behavior
 brightness = 1
-# time increment in sec; LEDs response time is not fast and decreases with num LEDs
-inc = 0.0005
+# color steps per second; LEDs response time is not fast and decreases with num LEDs
+fps = 200.0
+
+
+def test(reporters=()):
+    pixels = neopixel.NeoPixel(pin.D18, N, auto_write=False)
+    framebuffer = LedFramebuffer(
+        NeoPixelBackend(pixels), width=N, height=1, brightness=brightness
+    )
+    frame = np.zeros_like(framebuffer.frame)
 
+    def render(t):
+        # The scheduler skips steps when the strip is slow; never past blue.
+        j = min(int(round(t * fps)), 2 * 255)
+        if j < 255:
+            # red to green
+            frame[...] = (255 - j, j, 0)
+        else:
+            # green to blue
+            j -= 255
+            frame[...] = (0, 255 - j, j)
+        return frame
 
-def test():
-    pixels = neopixel.NeoPixel(pin.D18, N, brightness=brightness)
-    # red to green
-    for j in range(255):
-        pixels.fill((255 - j, j, 0))
-        time.sleep(inc)
-    # green to blue
-    for j in range(255):
-        pixels.fill((0, 255 - j, j))
-        time.sleep(inc)
+    # The framebuffer copies each frame, so one buffer is enough unpipelined.
+    scheduler = FrameScheduler(render, framebuffer.show, fps=fps, pipelined=False)
+    scheduler.run(duration=2 * 255 / fps)
+    print(scheduler.summary())
+    for report in reporters:
+        print(report())
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_profile_argument(parser)
+    add_verbose_argument(parser)
+    args = parser.parse_args()
+    set_up_logging(args.verbose)
     print("script started")
-    test()
+    test(profile_reporters(args))
     print("script finished")
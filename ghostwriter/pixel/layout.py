@@ -0,0 +1,160 @@
+"""How the LEDs of a panel, or a wall of panels, are wired into one strip.
+
+A layout's `index` is an array shaped like the image it displays, holding the
+strip position of every pixel. It's turned once into a flat gather index, so
+mapping a downsampled frame onto the strip's byte buffer is a single `np.take`.
+"""
+from typing import Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+DOWNSAMPLING = {"nearest": cv.INTER_NEAREST, "area": cv.INTER_AREA}
+
+
+def gather_index(
+    index: Optional[np.ndarray],
+    count: int,
+    input_order: str = "RGB",
+    strip_order: str = "GRB",
+) -> np.ndarray:
+    """
+    Byte `k` of the strip comes from byte `gather[k]` of the flattened frame.
+
+    :param index: Strip position of each pixel in row-major image order, or
+        None for rows laid end to end.
+    :param count: Number of pixels.
+    :param input_order: Channel order of the frames, e.g. "BGR" for OpenCV.
+    :param strip_order: Byte order the strip expects ("GRB" for WS2812).
+    """
+    if index is None:
+        order = np.arange(count)
+    else:
+        index = np.ravel(index)
+        if index.size != count or np.any(np.sort(index) != np.arange(count)):
+            raise ValueError("Layout index must hold each strip position once")
+        order = np.argsort(index)
+    channels = np.array([input_order.index(c) for c in strip_order])
+    return (3 * order[:, np.newaxis] + channels).ravel()
+
+
+def downsample(
+    image: np.ndarray,
+    size: Tuple[int, int],
+    method: str = "nearest",
+    dst: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Shrink `image` to `size` (width, height).
+
+    "nearest" picks one camera pixel per LED; "area" averages every pixel the
+    LED covers, which is steadier on noisy or finely detailed frames.
+    """
+    return cv.resize(image, size, dst=dst, interpolation=DOWNSAMPLING[method])
+
+
+class Layout:
+    """Maps image pixels to strip positions through an `index` array."""
+
+    def __init__(self, index: np.ndarray):
+        self._index = np.ascontiguousarray(index)
+        self._gathers = {}
+
+    @property
+    def index(self) -> np.ndarray:
+        """Strip position of every pixel, shaped `(height, width)`."""
+        return self._index
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self._index.shape
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """`(width, height)`, as `cv.resize` and `downsample` take it."""
+        return self._index.shape[::-1]
+
+    @property
+    def count(self) -> int:
+        return self._index.size
+
+    def gather(self, input_order: str = "RGB", strip_order: str = "GRB"):
+        return gather_index(self._index, self.count, input_order, strip_order)
+
+    def to_strip(
+        self,
+        frame: np.ndarray,
+        input_order: str = "RGB",
+        strip_order: str = "GRB",
+        out: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        The strip's bytes for a `(height, width, 3)` frame.
+
+        Gather indices are cached per channel order, so steady-state calls
+        are one `np.take`.
+        """
+        key = (input_order, strip_order)
+        if key not in self._gathers:
+            self._gathers[key] = self.gather(input_order, strip_order)
+        return np.take(frame.reshape(-1), self._gathers[key], out=out)
+
+
+class PanelLayout(Layout):
+    """
+    One rectangular panel wired as a single strip.
+
+    :param width: LEDs along the direction the strip starts in.
+    :param height: Rows (or columns, if `vertical`) of LEDs.
+    :param serpentine: Every other row runs back the other way, as on most
+        flexible WS2812 matrices; otherwise each row starts at the same side.
+    :param vertical: The strip runs down columns instead of across rows.
+    :param rotation: Quarter turns counterclockwise of the panel as mounted.
+    :param mirror: Flip left to right, e.g. when the panel is seen from behind.
+    """
+
+    def __init__(
+        self,
+        width: int = 16,
+        height: int = 16,
+        serpentine: bool = True,
+        vertical: bool = False,
+        rotation: int = 0,
+        mirror: bool = False,
+    ):
+        index = np.arange(width * height).reshape(height, width)
+        if serpentine:
+            index[1::2] = index[1::2, ::-1]
+        if vertical:
+            index = index.T
+        index = np.rot90(index, rotation)
+        if mirror:
+            index = index[:, ::-1]
+        super().__init__(index)
+
+
+class TiledLayout(Layout):
+    """
+    Identical panels tiled in a grid and chained into one strip.
+
+    Panels are chained along each row of tiles, left to right, with every
+    other row running right to left if `serpentine`.
+
+    :param panel: Layout of each panel.
+    :param columns: Panels across.
+    :param rows: Panels down.
+    """
+
+    def __init__(
+        self, panel: Layout, columns: int, rows: int = 1, serpentine: bool = False
+    ):
+        chain = np.arange(columns * rows).reshape(rows, columns)
+        if serpentine:
+            chain[1::2] = chain[1::2, ::-1]
+        tiles = chain[:, :, np.newaxis, np.newaxis] * panel.count + panel.index
+        # (rows, columns, height, width) -> (rows * height, columns * width)
+        height, width = panel.shape
+        super().__init__(
+            tiles.transpose(0, 2, 1, 3).reshape(rows * height, columns * width)
+        )
+        self.panel = panel
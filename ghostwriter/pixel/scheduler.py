@@ -0,0 +1,193 @@
+"""Fixed-timestep animation loop for the LED strip.
+
+Frame deadlines sit on a fixed grid of the monotonic clock, `start + k / fps`,
+so the animation neither drifts with the time the strip write takes nor spins
+a core waiting for the next frame.
+"""
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from ghostwriter.metrics import METRICS
+
+
+class _Pusher(threading.Thread):
+    """Pushes frames to the strip on its own thread, one at a time."""
+
+    def __init__(self, show: Callable[[Any], Any]):
+        super().__init__(name="led-push", daemon=True)
+        self.logger = logging.getLogger(__name__)
+        self.show = show
+        self._frame = None
+        self._pending = False
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def submit(self, frame: Any) -> None:
+        """Hand over `frame`, first waiting for the previous one to go out."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending or self._closed)
+            self._frame = frame
+            self._pending = True
+            self._condition.notify_all()
+
+    def run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                frame = self._frame
+            try:
+                self.show(frame)
+            except Exception:
+                self.logger.exception("Pushing a frame failed")
+            with self._condition:
+                self._frame = None
+                self._pending = False
+                self._condition.notify_all()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Finish the frame in flight, then stop."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending)
+            self._closed = True
+            self._condition.notify_all()
+        self.join(timeout)
+
+
+class FrameScheduler:
+    """
+    Renders and pushes frames at a fixed rate.
+
+    When the loop falls a whole period or more behind, the missed deadlines
+    are skipped and counted as dropped, rather than rendered late and pushing
+    every later frame back. When it's ahead it sleeps until just before the
+    deadline, then yields for the last `spin` seconds.
+
+    :param render: Called with the frame's time, in seconds since the start
+        on the deadline grid; returns the frame to push.
+    :param show: Pushes a frame, e.g. `LedFramebuffer.show`.
+    :param fps: Target frames per second.
+    :param pipelined: Push each frame on a background thread while the next
+        one renders. `render` must then return a fresh array (or alternate
+        between buffers) rather than overwrite the frame being pushed. Turn it
+        off for renderers that draw straight into the strip's own buffer.
+    :param spin: Seconds before a deadline to stop sleeping and yield instead.
+    """
+
+    def __init__(
+        self,
+        render: Callable[[float], Any],
+        show: Callable[[Any], Any],
+        fps: float = 30.0,
+        pipelined: bool = True,
+        spin: float = 0.001,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.render = render
+        self.show = show
+        self.period = 1.0 / fps
+        self.pipelined = pipelined
+        self.spin = spin
+        self._clock = clock
+        self._sleep = sleep
+        self._stop_event = threading.Event()
+        self.frames = 0
+        self.dropped = 0
+        self._started = None
+        self._finished = None
+        self._lateness = 0.0
+        self._lateness_squared = 0.0
+        self._max_lateness = 0.0
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def sleep_until(self, deadline: float) -> None:
+        remaining = deadline - self._clock()
+        if remaining > self.spin:
+            self._sleep(remaining - self.spin)
+        while self._clock() < deadline:
+            self._sleep(0)
+
+    def run(
+        self, duration: Optional[float] = None, frames: Optional[int] = None
+    ) -> None:
+        """Run until stopped, or for `duration` seconds or `frames` frames."""
+        pusher = _Pusher(self.show) if self.pipelined else None
+        if pusher is not None:
+            pusher.start()
+        push = self.show if pusher is None else pusher.submit
+        self._stop_event.clear()
+        start = self._started = self._clock()
+        self._finished = None
+        tick = 0
+
+        def done() -> bool:
+            return (
+                self._stop_event.is_set()
+                or (frames is not None and self.frames >= frames)
+                or (duration is not None and tick * self.period >= duration)
+            )
+
+        frame = self.render(0.0)
+        try:
+            while not done():
+                deadline = start + tick * self.period
+                self.sleep_until(deadline)
+                push(frame)
+                lateness = self._clock() - deadline
+                self._record(lateness)
+                METRICS.observe("lateness", lateness)
+
+                tick += 1
+                behind = math.floor((self._clock() - start) / self.period) - tick
+                if behind > 0:
+                    self.dropped += behind
+                    tick += behind
+                # Don't render a frame past the end just to throw it away.
+                if done():
+                    break
+                with METRICS.timer("render"):
+                    frame = self.render(tick * self.period)
+        finally:
+            if pusher is not None:
+                pusher.close()
+            self._finished = self._clock()
+
+    def _record(self, lateness: float) -> None:
+        self.frames += 1
+        self._lateness += lateness
+        self._lateness_squared += lateness * lateness
+        self._max_lateness = max(self._max_lateness, lateness)
+
+    @property
+    def fps(self) -> float:
+        if self._started is None:
+            return 0.0
+        end = self._clock() if self._finished is None else self._finished
+        return self.frames / (end - self._started) if end > self._started else 0.0
+
+    @property
+    def jitter(self) -> float:
+        """Standard deviation of how late frames were pushed, in seconds."""
+        if not self.frames:
+            return 0.0
+        mean = self._lateness / self.frames
+        return math.sqrt(max(self._lateness_squared / self.frames - mean * mean, 0))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "stage": "animation",
+            "frames": self.frames,
+            "fps": round(self.fps, 1),
+            "target_fps": round(1.0 / self.period, 1),
+            "dropped": self.dropped,
+            "jitter_ms": round(1000 * self.jitter, 3),
+            "max_late_ms": round(1000 * self._max_lateness, 3),
+        }
@@ -3,7 +3,8 @@ import logging
 
 
 def set_up_logging(verbose: int = 1) -> None:
-    if verbose > 2:
+    """Log warnings, or with `verbose` 1 also info, and with 2 or more debug."""
+    if verbose >= 2:
         level = logging.DEBUG
     elif verbose == 1:
         level = logging.INFO
@@ -17,15 +18,207 @@ def set_up_logging(verbose: int = 1) -> None:
     logging.basicConfig(format=log_format, level=level)
 
 
-def default_arguments(description: str) -> argparse.ArgumentParser:
+def detection_scale(value: str):
+    """An argparse type: "auto", or a fraction of the frame from 0 to 1."""
+    if value == "auto":
+        return value
+    try:
+        scale = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "expected 'auto' or a number, got {!r}".format(value)
+        )
+    if not 0 < scale <= 1:
+        raise argparse.ArgumentTypeError(
+            "expected a scale above 0 and at most 1, got {}".format(scale)
+        )
+    return scale
+
+
+def default_arguments(
+    description: str, detection: bool = False
+) -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description=description)
-    parser.add_argument("--camera", help="Camera number.", type=int, default=0)
+    parser.add_argument(
+        "--camera",
+        help="Camera number; give several to capture from several cameras.",
+        type=int,
+        nargs="+",
+        default=[0],
+    )
+    parser.add_argument(
+        "--source",
+        nargs="+",
+        help="Read frames from video files, image directories or 'synthetic' "
+        "(or 'synthetic:640x480') instead of --camera.",
+    )
+    parser.add_argument(
+        "--capture-width", type=int, help="Ask the camera for this frame width."
+    )
+    parser.add_argument(
+        "--capture-height", type=int, help="Ask the camera for this frame height."
+    )
+    parser.add_argument(
+        "--capture-fps", type=float, help="Ask the camera for this frame rate."
+    )
+    parser.add_argument(
+        "--fourcc",
+        help="Ask the camera for this pixel format, e.g. MJPG, which most USB "
+        "cameras need for high resolutions at full frame rate.",
+    )
+    parser.add_argument(
+        "--capture-buffer-size",
+        type=int,
+        help="Frames the camera driver may queue; 1 keeps the lag lowest.",
+    )
+    parser.add_argument(
+        "--latest-frame",
+        action="store_true",
+        help="Grab continuously and only decode the newest frame.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Processing threads shared by every camera; by default one per "
+        "camera, up to the number of cores.",
+    )
+    parser.add_argument(
+        "--headless", action="store_true", help="Don't open any windows."
+    )
+    parser.add_argument(
+        "--preview-fps",
+        type=float,
+        default=10.0,
+        help="Refresh windows and the HTTP preview at most this often.",
+    )
+    parser.add_argument(
+        "--preview-port",
+        type=int,
+        help="Serve an MJPEG preview of every view over HTTP on this port.",
+    )
+    parser.add_argument(
+        "--preview-host",
+        default="127.0.0.1",
+        help="Interface for --preview-port; 0.0.0.0 serves the whole network.",
+    )
+    add_profile_argument(parser)
+    parser.add_argument(
+        "--motion-gate",
+        action="store_true",
+        help="Only do the full processing while something in front of the "
+        "camera moves.",
+    )
+    parser.add_argument(
+        "--motion-threshold",
+        type=float,
+        default=0.01,
+        help="Fraction of the scene that has to change to wake --motion-gate.",
+    )
+    parser.add_argument(
+        "--motion-hold",
+        type=float,
+        default=3.0,
+        help="Seconds of stillness before --motion-gate goes idle.",
+    )
+    parser.add_argument(
+        "--idle-fps",
+        type=float,
+        default=1.0,
+        help="Frames to process per second while --motion-gate is idle.",
+    )
+    if detection:
+        from ghostwriter.camera.detection import DETECTION_POLICIES
+
+        parser.add_argument(
+            "--detection-policy",
+            choices=DETECTION_POLICIES,
+            default="roi",
+            help="Scan the full frame every frame (full), or only every "
+            "--detection-interval frames and in between re-detect around "
+            "tracked faces (roi) or just track them (track).",
+        )
+        parser.add_argument(
+            "--detection-interval",
+            type=int,
+            default=10,
+            help="Frames between full-frame face scans.",
+        )
+        parser.add_argument(
+            "--detection-scale",
+            type=detection_scale,
+            default="auto",
+            help="Run the cascades at this fraction of the frame resolution "
+            "(e.g. 0.5 or 0.25), or 'auto' to pick it from the face sizes seen.",
+        )
+        parser.add_argument(
+            "--detection-workers",
+            type=int,
+            default=0,
+            help="Run full-frame detection on this many worker processes "
+            "instead of the processing thread (ignores --detection-policy).",
+        )
+    add_verbose_argument(parser)
+    return parser
+
+
+def add_profile_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="FILE",
+        help="Time each stage and log the results with the stats; with FILE, "
+        "also write them there (Prometheus text for .prom, else JSON).",
+    )
+
+
+def add_verbose_argument(parser: argparse.ArgumentParser) -> None:
     parser.add_argument(
         "-v",
         "--verbose",
         type=int,
         default=0,
-        nargs="+",
-        help="Logging verbosity",
+        help="Logging verbosity: 1 for info, with the stats and --profile "
+        "output, 2 for debug.",
     )
-    return parser
+
+
+def capture_settings(args: argparse.Namespace):
+    """The camera settings chosen on the command line, for `open_source`."""
+    from ghostwriter.camera.capture import CaptureSettings
+
+    return CaptureSettings(
+        width=args.capture_width,
+        height=args.capture_height,
+        fps=args.capture_fps,
+        fourcc=args.fourcc,
+        buffer_size=args.capture_buffer_size,
+        latest=args.latest_frame,
+    )
+
+
+def motion_gate(args: argparse.Namespace):
+    """A new `MotionGate` as chosen on the command line, or None without
+    --motion-gate. Each camera needs its own. The scene counts as still once
+    under a fifth of the wake-up threshold changes."""
+    if not args.motion_gate:
+        return None
+    from ghostwriter.camera.motion import MotionGate
+
+    return MotionGate(
+        start=args.motion_threshold,
+        stop=args.motion_threshold / 5,
+        hold_seconds=args.motion_hold,
+        idle_fps=args.idle_fps,
+    )
+
+
+def source_specs(args: argparse.Namespace) -> list:
+    """The frame sources chosen on the command line, for `open_source`."""
+    specs = args.camera if args.source is None else args.source
+    return list(specs) if isinstance(specs, (list, tuple)) else [specs]
+
+
+def source_spec(args: argparse.Namespace):
+    """The first frame source chosen on the command line."""
+    return source_specs(args)[0]
@@ -0,0 +1,108 @@
+import time
+
+import numpy as np
+
+from ghostwriter.pixel.animations import (
+    COLOR_WHEEL,
+    Animation,
+    Blend,
+    Comet,
+    EffectSequence,
+    Rainbow,
+    Solid,
+    Sparkle,
+)
+
+
+def colorwheel(pos):
+    """adafruit's per-pixel color wheel."""
+    if pos < 0 or pos > 255:
+        return 0, 0, 0
+    if pos < 85:
+        return 255 - pos * 3, pos * 3, 0
+    if pos < 170:
+        pos -= 85
+        return 0, 255 - pos * 3, pos * 3
+    pos -= 170
+    return pos * 3, 0, 255 - pos * 3
+
+
+def per_pixel_rainbow(n, t, period):
+    offset = int(256 * t / period)
+    return [colorwheel((i * 256 // n + offset) & 255) for i in range(n)]
+
+
+def per_pixel_comet(n, t, speed, tail_length, color):
+    head = int(t / speed) % (n + tail_length)
+    pixels = [(0, 0, 0)] * n
+    for i in range(tail_length):
+        if 0 <= head - i < n:
+            level = 1 - i / tail_length
+            pixels[head - i] = tuple(int(level * c) for c in color)
+    return pixels
+
+
+def test_color_wheel_matches_adafruit():
+    expected = np.array([colorwheel(pos) for pos in range(255)])
+    np.testing.assert_array_equal(np.rint(255 * COLOR_WHEEL[:255]), expected)
+
+
+def test_rainbow_matches_per_pixel_version():
+    frame = Animation(Rainbow(period=2.0))(0.3)
+
+    expected = np.array(per_pixel_rainbow(256, 0.3, 2.0)).reshape(16, 16, 3)
+    np.testing.assert_allclose(frame, expected, atol=1)
+
+
+def test_comet_tail_decays_behind_head():
+    comet = Comet((255, 0, 255), speed=0.01, tail_length=4)
+    frame = Animation(comet, width=8, height=1)(0.055)
+
+    np.testing.assert_array_equal(frame[0, :, 0], [0, 0, 63, 127, 191, 255, 0, 0])
+    assert not frame[..., 1].any()
+
+
+def test_blend_and_sequence():
+    red, blue = Solid((255, 0, 0)), Solid((0, 0, 255))
+    blended = Animation(Blend(red, blue, "add", opacity=0.5), 2, 1)(0)
+    np.testing.assert_array_equal(blended[0, 0], [255, 0, 127])
+
+    sparkle = Sparkle((255, 255, 255), density=1.0, seed=0)
+    sequence = EffectSequence(red, sparkle, advance_interval=1.0)
+    animation = Animation(sequence, 4, 1)
+    assert animation(0.5)[0, 0].tolist() == [255, 0, 0]
+    assert animation(1.05)[0, 0].tolist() == [255, 255, 255]
+
+
+def test_animation_double_buffers_frames():
+    animation = Animation(Rainbow())
+    first = animation(0.0)
+    second = animation(0.5)
+    assert first is not second
+    assert animation(1.0) is first
+
+
+def test_benchmark_against_per_pixel_effects():
+    n = 256
+    effect = Blend(Rainbow(period=2.0), Comet((255, 0, 255), tail_length=10), "lighten")
+    animation = Animation(effect)
+    times = np.arange(100) / 60.0
+
+    start = time.perf_counter()
+    for t in times:
+        animation(t)
+    vectorized = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for t in times:
+        rainbow = per_pixel_rainbow(n, t, 2.0)
+        comet = per_pixel_comet(n, t, 0.01, 10, (255, 0, 255))
+        [tuple(map(max, a, b)) for a, b in zip(rainbow, comet)]
+    per_pixel = time.perf_counter() - start
+
+    print(
+        "numpy: {:.3f} ms/frame, per-pixel: {:.3f} ms/frame".format(
+            1000 * vectorized / len(times), 1000 * per_pixel / len(times)
+        )
+    )
+    assert vectorized < per_pixel
@@ -0,0 +1,103 @@
+import tracemalloc
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.buffers import FrameBufferPool
+from ghostwriter.camera.colors import xkcd_color_matrix_like
+from ghostwriter.camera.effects import TRAIL_KERNEL, TrailCompositor
+from ghostwriter.camera.pipeline import FramePacket
+
+
+def synthetic_frames(num_frames, shape=(120, 160, 3)):
+    rng = np.random.RandomState(0)
+    for index in range(num_frames):
+        frame = rng.randint(0, 20, size=shape, dtype=np.uint8)
+        center = (10 + 6 * index % shape[1], shape[0] // 2)
+        cv.circle(frame, center, 20, (200, 180, 160), -1)
+        yield FramePacket(index, float(index), {"frame": frame})
+
+
+class LegacyTrailCompositor:
+    """The allocating loop body from `background.py`, as the reference."""
+
+    def __init__(self, back_sub):
+        self.back_sub = back_sub
+        self.output_green = None
+
+    def __call__(self, packet):
+        frame = packet.images["frame"]
+        if self.output_green is None:
+            self.output_green = np.zeros_like(frame)
+            self.last_pink = np.zeros_like(frame)
+            self.pink = xkcd_color_matrix_like(frame, color_name="hot pink")
+            self.green = xkcd_color_matrix_like(frame, color_name="neon green")
+        foreground_mask = self.back_sub.apply(frame, learningRate=0.1)
+        background_mask = ~foreground_mask
+        pink_mask = cv.bitwise_and(self.pink, self.pink, mask=foreground_mask)
+        green_mask = cv.bitwise_and(self.green, self.green, mask=foreground_mask)
+        output_green = self.output_green
+        output_green = cv.bitwise_and(output_green, output_green, mask=background_mask)
+        output_green += green_mask
+        self.output_green = cv.filter2D(output_green, -1, TRAIL_KERNEL)
+        output = pink_mask.copy()
+        mask = (np.maximum(pink_mask, self.last_pink).sum(axis=2) < 150).astype(
+            np.uint8
+        )
+        self.last_pink = output.copy()
+        output += cv.bitwise_and(self.output_green, self.output_green, mask=mask)
+        return packet._replace(images={"Output": output})
+
+
+def peak_bytes_per_frame(effect, packets):
+    """Peak traced allocation while processing each frame."""
+    peaks = []
+    for packet in packets:
+        tracemalloc.start()
+        effect(packet)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return peaks
+
+
+def test_pool_reuses_buffers():
+    pool = FrameBufferPool(depth=2)
+    first = pool.get("a", (4, 4))
+    assert pool.get("a", (4, 4)) is first
+    assert pool.get("a", (4, 4), np.float32) is not first
+    ring = [pool.next("b", (4, 4)) for _ in range(3)]
+    assert ring[0] is ring[2] and ring[0] is not ring[1]
+    assert pool.allocations == 4
+    assert not pool.zeros("c", (2, 2)).any()
+
+
+def test_trail_compositor_matches_legacy():
+    # The legacy trail wrapped around on shadows, so leave them out.
+    legacy = LegacyTrailCompositor(
+        cv.createBackgroundSubtractorMOG2(detectShadows=False)
+    )
+    pooled = TrailCompositor(cv.createBackgroundSubtractorMOG2(detectShadows=False))
+    for packet in synthetic_frames(20):
+        expected = legacy(packet).images["Output"]
+        actual = pooled(packet).images["Output"]
+        # The fused trail rounds once instead of per channel, which only
+        # shows in neon green's faint blue and red.
+        difference = np.abs(actual.astype(int) - expected)
+        assert difference.max() <= 3
+        assert difference.mean() < 0.5
+
+
+def test_trail_compositor_allocates_nothing_per_frame():
+    packets = list(synthetic_frames(12))
+    frame_bytes = packets[0].images["frame"].nbytes
+
+    legacy = LegacyTrailCompositor(cv.createBackgroundSubtractorMOG2())
+    pooled = TrailCompositor(cv.createBackgroundSubtractorMOG2())
+    legacy_peaks = peak_bytes_per_frame(legacy, packets)[2:]
+    pooled_peaks = peak_bytes_per_frame(pooled, packets)[2:]
+    allocations = pooled.pool.allocations
+    pooled(packets[0])
+
+    assert min(legacy_peaks) > frame_bytes
+    assert max(pooled_peaks) < 4096
+    assert pooled.pool.allocations == allocations
@@ -0,0 +1,84 @@
+import os
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+import ghostwriter.cache
+from ghostwriter.cache import cached
+from ghostwriter.camera.colors import ColorStore, COLOR_FILE
+from ghostwriter.camera.detection import load_cascade
+from ghostwriter.paths import DATA_DIR
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ghostwriter.cache, "CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+def test_entries_are_rebuilt_when_the_source_changes(tmp_path, cache_dir):
+    source = tmp_path / "numbers.txt"
+    source.write_text("1 2 3")
+    builds = []
+
+    def build(path):
+        builds.append(path)
+        np.save(path, np.loadtxt(str(source)))
+
+    first = cached(str(source), "npy", build)
+    assert cached(str(source), "npy", build) == first
+    assert len(builds) == 1
+
+    source.write_text("4 5 6 7")
+    os.utime(str(source), (0, 12345))
+    second = cached(str(source), "npy", build)
+
+    assert second != first and not os.path.exists(first)
+    np.testing.assert_array_equal(np.load(second), [4, 5, 6, 7])
+    assert os.listdir(str(cache_dir)) == [os.path.basename(second)]
+
+
+def test_sources_with_the_same_name_keep_their_own_entries(tmp_path, cache_dir):
+    paths = []
+    for directory in ("a", "b"):
+        (tmp_path / directory).mkdir()
+        source = tmp_path / directory / "numbers.txt"
+        source.write_text(directory)
+        paths.append(str(source))
+
+    def build(path):
+        with open(path, "w") as fp:
+            fp.write("built")
+
+    first = [cached(path, "txt", build) for path in paths]
+    second = [cached(path, "txt", build) for path in paths]
+    assert first == second and first[0] != first[1]
+    assert all(os.path.exists(entry) for entry in first)
+
+
+def test_cached_color_store_matches_parsed(cache_dir):
+    parsed = ColorStore.from_file(COLOR_FILE, use_cache=False)
+    first = ColorStore.from_file(COLOR_FILE)
+    second = ColorStore.from_file(COLOR_FILE)
+
+    assert first.names == second.names == parsed.names
+    np.testing.assert_array_equal(second.bgr, parsed.bgr)
+    np.testing.assert_array_equal(second.lut, parsed.lut)
+    assert len(os.listdir(str(cache_dir))) == 3
+    assert ColorStore.from_file(COLOR_FILE, lut_bits=4).lut_bits == 4
+
+
+def test_cached_cascade_detects_like_the_original(cache_dir):
+    path = os.path.join(DATA_DIR, "haarcascades", "haarcascade_smile.xml")
+    original = load_cascade(path, use_cache=False)
+    cached_cascade = load_cascade(path)
+
+    assert [name.endswith(".yml.gz") for name in os.listdir(str(cache_dir))] == [True]
+    rng = np.random.RandomState(0)
+    image = cv.GaussianBlur(rng.randint(0, 256, (120, 160)).astype(np.uint8), (5, 5), 0)
+    kwargs = dict(scaleFactor=1.05, minNeighbors=0)
+    np.testing.assert_array_equal(
+        cached_cascade.detectMultiScale(image, **kwargs),
+        original.detectMultiScale(image, **kwargs),
+    )
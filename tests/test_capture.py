@@ -0,0 +1,191 @@
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.capture import (
+    CaptureSettings,
+    LatestFrameCapture,
+    configure_capture,
+    fourcc_string,
+)
+from ghostwriter.camera.probe import enumerate_modes, measure_latency, probe
+
+
+class FakeCamera:
+    """Delivers a frame every `interval` seconds, numbered in its pixels,
+    in the nearest of a few modes to what it's asked for."""
+
+    SIZES = ((320, 240), (640, 480))
+
+    def __init__(self, interval=0.005, lag=0, frames=None):
+        self.interval = interval
+        self.lag = lag
+        self.remaining = frames
+        self.count = 0
+        self.lit = []
+        self.light = False
+        self.props = {
+            cv.CAP_PROP_FRAME_WIDTH: 640,
+            cv.CAP_PROP_FRAME_HEIGHT: 480,
+            cv.CAP_PROP_FPS: 30,
+            cv.CAP_PROP_FOURCC: cv.VideoWriter_fourcc(*"YUYV"),
+            cv.CAP_PROP_BUFFERSIZE: 4,
+        }
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        if prop == cv.CAP_PROP_FRAME_WIDTH:
+            value = min((w for w, _ in self.SIZES), key=lambda w: abs(w - value))
+        elif prop == cv.CAP_PROP_FRAME_HEIGHT:
+            value = min((h for _, h in self.SIZES), key=lambda h: abs(h - value))
+        elif prop == cv.CAP_PROP_FPS:
+            value = min(value, 30)
+        self.props[prop] = value
+        return True
+
+    def get(self, prop):
+        return self.props.get(prop, 0)
+
+    def grab(self):
+        if self.remaining is not None:
+            if self.remaining == 0:
+                return False
+            self.remaining -= 1
+        time.sleep(self.interval)
+        self.count += 1
+        self.lit.append(self.light)
+        return True
+
+    def retrieve(self):
+        # The sensor shows the light as it was `lag` frames ago.
+        lit = self.lit[max(0, len(self.lit) - 1 - self.lag)]
+        frame = np.full((4, 4, 3), 200 if lit else 20, np.uint8)
+        frame[0, 0, 0] = self.count % 256
+        return True, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        self.released = True
+
+
+def test_configure_capture_reports_what_the_camera_did():
+    camera = FakeCamera()
+    mode = configure_capture(
+        camera, CaptureSettings(width=700, height=500, fps=60, fourcc="MJPG")
+    )
+    assert mode == {
+        "width": 640,
+        "height": 480,
+        "fps": 30,
+        "fourcc": "MJPG",
+        "buffer_size": 4,
+    }
+    assert fourcc_string(cv.VideoWriter_fourcc(*"YUYV")) == "YUYV"
+
+
+def test_enumerate_modes():
+    modes = enumerate_modes(FakeCamera(), fourccs=["MJPG"], rates=[30, 60])
+    assert [(m["width"], m["height"]) for m in modes] == [(320, 240), (640, 480)]
+
+
+def test_latest_frame_capture_skips_stale_frames():
+    camera = FakeCamera(interval=0.002)
+    cap = LatestFrameCapture(camera)
+    try:
+        assert cap.read()[0]
+        time.sleep(0.05)
+        grabbed = camera.count
+        ok, frame = cap.read()
+        # The frame grabbed after the read asked for one, not a queued one.
+        assert ok and int(frame[0, 0, 0]) > grabbed
+        assert cap.summary()["skipped"] >= 10
+    finally:
+        cap.release()
+    assert camera.released
+
+
+def test_latest_frame_capture_ends_with_the_camera():
+    cap = LatestFrameCapture(FakeCamera(interval=0, frames=3))
+    frames = 0
+    while cap.read()[0]:
+        frames += 1
+    cap.release()
+    assert 1 <= frames <= 3
+
+
+class StuckCamera(FakeCamera):
+    """A camera whose grab hangs in the driver until `unstick` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.unstick = threading.Event()
+
+    def grab(self):
+        self.unstick.wait()
+        return super().grab()
+
+
+def test_latest_frame_capture_releases_after_a_stuck_grab():
+    camera = StuckCamera()
+    cap = LatestFrameCapture(camera, timeout=0.05)
+    cap.release()
+    assert not camera.released
+    camera.unstick.set()
+    cap._thread.join(1)
+    assert camera.released
+
+
+def test_measure_latency():
+    camera = FakeCamera(interval=0.005, lag=4)
+
+    def flash(on):
+        camera.light = on
+
+    latency = measure_latency(camera, flash, trials=3, dark_seconds=0.03)
+    assert latency["missed"] == 0
+    assert latency["frames"] == 3
+    # Four frames of lag, plus up to one for the frame being exposed.
+    assert 15 <= latency["p50_ms"] <= 60
+
+
+def test_probe_every_mode():
+    cameras = []
+    opened = []
+
+    def open_capture(index, settings):
+        opened.append(settings)
+        camera = FakeCamera(interval=0.001, lag=1)
+        cameras.append(camera)
+        configure_capture(camera, settings)
+        if settings.latest:
+            return LatestFrameCapture(camera)
+        return camera
+
+    def flash(on):
+        cameras[-1].light = on
+
+    results = probe(
+        0,
+        CaptureSettings(buffer_size=1, latest=True),
+        flash,
+        trials=2,
+        dark_seconds=0.02,
+        open_capture=open_capture,
+    )
+    assert len(results) == 4
+    for result in results:
+        assert result["latest"] and result["buffer_size"] == 1
+        assert result["measured_fps"] > 0
+        assert result["missed"] == 0
+    assert all(camera.released for camera in cameras)
+    # Modes are listed on the backend they'll be opened with.
+    assert all(settings.configured for settings in opened)
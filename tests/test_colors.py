@@ -0,0 +1,46 @@
+import numpy as np
+
+from ghostwriter.camera.colors import (
+    ColorStore,
+    load_xkcd_colors,
+    load_xkcd_store,
+    xkcd_color_view_like,
+)
+
+
+def test_store_matches_color_dict():
+    store = load_xkcd_store()
+    colors = load_xkcd_colors()
+    assert len(store) == len(colors) == 949
+    assert store.bgr.shape == (949, 3)
+    assert store["hot pink"] == colors["hot pink"] == (141, 2, 255)
+
+
+def test_palette_colors_are_their_own_nearest():
+    store = load_xkcd_store()
+    image = store.bgr.reshape(1, -1, 3)
+    indices = store.nearest(image, exact=True)
+    np.testing.assert_array_equal(store.bgr[indices[0]], store.bgr)
+
+
+def test_lut_quantizer_is_close_to_exact():
+    store = ColorStore(
+        ["black", "white", "red"], [(0, 0, 0), (255, 255, 255), (0, 0, 255)]
+    )
+    rng = np.random.RandomState(0)
+    frame = rng.randint(0, 256, size=(64, 64, 3)).astype(np.uint8)
+
+    quantized = store.quantize(frame)
+    exact = store.quantize(frame, exact=True)
+
+    assert quantized.shape == frame.shape
+    assert (quantized == exact).all(axis=-1).mean() > 0.95
+    assert store.names_of(np.array([[[10, 5, 240]]]))[0, 0] == "red"
+
+
+def test_solid_view_does_not_allocate_a_frame():
+    frame = np.zeros((1080, 1920, 3), np.uint8)
+    view = xkcd_color_view_like(frame, "hot pink")
+    assert view.shape == frame.shape
+    assert view.strides[:2] == (0, 0)
+    assert tuple(view[5, 7]) == (141, 2, 255)
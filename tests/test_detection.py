@@ -0,0 +1,128 @@
+import argparse
+
+import numpy as np
+import pytest
+
+from ghostwriter.camera.detection import (
+    CascadeDetector,
+    DetectionScheduler,
+    ScaleSelector,
+    detect_scaled,
+)
+from ghostwriter.utils import detection_scale
+
+
+class FakeCascade:
+    """Finds a fixed set of rectangles, in the coordinates of what it's given."""
+
+    def __init__(self, find):
+        self.find = find
+        self.calls = []
+
+    def detectMultiScale(self, image, *args, **kwargs):
+        self.calls.append(image.shape)
+        return self.find(image)
+
+
+def textured_frame(x, y, size=40, shape=(240, 320)):
+    rng = np.random.RandomState(1)
+    frame = np.zeros(shape, np.uint8)
+    frame[y : y + size, x : x + size] = rng.randint(0, 255, (size, size))
+    return frame
+
+
+def test_features_are_searched_in_face_bands():
+    face = FakeCascade(lambda image: [(10, 20, 60, 60)])
+    eyes = FakeCascade(lambda image: [(5, 5, 10, 10)])
+    smiles = FakeCascade(lambda image: [])
+    detector = CascadeDetector(face, eyes, smiles)
+
+    (detection,) = detector.detect(np.zeros((100, 100), np.uint8))
+
+    assert detection.face == (10, 20, 60, 60)
+    assert detection.eyes == [(15, 25, 10, 10)]
+    assert eyes.calls == [(30, 60)]
+    assert smiles.calls == [(20, 60)]
+
+
+def test_features_of_small_faces_are_searched_at_full_resolution():
+    eyes = FakeCascade(lambda image: [])
+    smiles = FakeCascade(lambda image: [])
+    faces = [(0, 0, 240, 240), (0, 0, 160, 160)]
+    detector = CascadeDetector(
+        FakeCascade(lambda image: faces), eyes, smiles, scale=0.5
+    )
+
+    for face in faces:
+        detector.detect_features(np.zeros((480, 640), np.uint8), face)
+
+    # 120 pixels wide at half size keeps eyes findable; 80 doesn't.
+    assert eyes.calls == [(60, 120), (80, 160)]
+
+
+def test_scheduler_tracks_between_full_scans():
+    position = {"x": 50}
+
+    def find_face(image):
+        if image.shape == (240, 320):
+            return [(position["x"], 60, 40, 40)]
+        return []
+
+    face = FakeCascade(find_face)
+    none = FakeCascade(lambda image: [])
+    scheduler = DetectionScheduler(
+        CascadeDetector(face, none, none), policy="track", interval=5
+    )
+
+    for frame_index in range(10):
+        position["x"] = 50 + 3 * frame_index
+        (detection,) = scheduler(textured_frame(position["x"], 60))
+        assert abs(detection.face[0] - position["x"]) <= 2
+
+    assert scheduler.stats.full_scans == 2
+    assert scheduler.summary()["frames"] == 10
+
+
+def test_scheduler_rescans_full_frame_when_tracks_are_lost():
+    face = FakeCascade(
+        lambda image: [(50, 60, 40, 40)] if image.shape[0] == 240 else []
+    )
+    none = FakeCascade(lambda image: [])
+    scheduler = DetectionScheduler(
+        CascadeDetector(face, none, none), policy="roi", interval=100, max_misses=0
+    )
+
+    scheduler(textured_frame(50, 60))
+    scheduler(textured_frame(50, 60))
+
+    assert scheduler.stats.roi_scans == 1
+    assert scheduler.stats.full_scans == 2
+
+
+def test_detect_scaled_maps_rectangles_back():
+    cascade = FakeCascade(lambda image: [(10, 5, 20, 20)])
+
+    rects = detect_scaled(
+        cascade, np.zeros((200, 400), np.uint8), 0.25, minSize=(80, 80)
+    )
+
+    assert cascade.calls == [(50, 100)]
+    assert rects == [(40, 20, 80, 80)]
+
+
+def test_scale_selector_follows_face_sizes():
+    selector = ScaleSelector(levels=(1.0, 0.5, 0.25), min_face=48, patience=2)
+    assert selector.scale == 1.0
+    selector.observe([(0, 0, 200, 200)])
+    assert selector.scale == 0.25
+    selector.observe([])
+    selector.observe([])
+    assert selector.scale == 0.5
+
+
+def test_detection_scale_argument():
+    assert detection_scale("auto") == "auto"
+    assert detection_scale("0.25") == 0.25
+    for value in ("0", "2", "half"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            detection_scale(value)
@@ -0,0 +1,130 @@
+import os
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.colors import load_xkcd_colors
+from ghostwriter.camera.effects import (
+    TRAIL_KERNEL,
+    TrailCompositor,
+    TrailEffect,
+)
+from ghostwriter.camera.pipeline import FramePacket
+from ghostwriter.camera.sources import SyntheticSource
+
+# Regenerate with `python tests/test_effects.py` after deliberate changes.
+GOLDEN_TRAIL = os.path.join(os.path.dirname(__file__), "data", "trail_golden.png")
+
+
+def synthetic_packets(num_frames, width=320, height=240):
+    source = SyntheticSource(width, height, frames=num_frames)
+    for index, frame in enumerate(source):
+        yield FramePacket(index, index / 30, {"frame": frame})
+
+
+def moving_masks(num_frames, width=160, height=120):
+    for index in range(num_frames):
+        mask = np.zeros((height, width), np.uint8)
+        center = (10 + 6 * index % width, height // 2)
+        cv.circle(mask, center, 20, 255, -1)
+        # A shadow, which counts as foreground.
+        cv.circle(mask, (width - center[0], height // 3), 8, 127, -1)
+        yield mask
+
+
+def per_channel_trail(masks):
+    """The trail as `background.py` first composited it, one color at a time."""
+    colors = load_xkcd_colors()
+    trail = last_pink = None
+    for mask in masks:
+        mask = np.where(mask > 0, 255, 0).astype(np.uint8)
+        if trail is None:
+            trail = np.zeros(mask.shape + (3,), np.uint8)
+            last_pink = np.zeros_like(trail)
+            pink = np.full_like(trail, colors["hot pink"])
+            green = np.full_like(trail, colors["neon green"])
+        pink_mask = cv.bitwise_and(pink, pink, mask=mask)
+        trail = cv.bitwise_and(trail, trail, mask=~mask)
+        trail += cv.bitwise_and(green, green, mask=mask)
+        trail = cv.filter2D(trail, -1, TRAIL_KERNEL)
+        quiet = (np.maximum(pink_mask, last_pink).sum(axis=2) < 150).astype(np.uint8)
+        last_pink = pink_mask
+        output = pink_mask + cv.bitwise_and(trail, trail, mask=quiet)
+    return output
+
+
+def fused_trail(masks):
+    effect = TrailEffect()
+    for mask in masks:
+        output = effect(mask)
+    return output
+
+
+def test_trail_effect_matches_per_channel_trail():
+    actual = fused_trail(moving_masks(30)).astype(int)
+    expected = per_channel_trail(moving_masks(30))
+    difference = np.abs(actual - expected)
+    assert difference.max() <= 3
+    assert difference.mean() < 0.5
+
+
+def test_trail_effect_golden_image():
+    golden = cv.imread(GOLDEN_TRAIL)
+    np.testing.assert_array_equal(fused_trail(moving_masks(30)), golden)
+
+
+def test_scaled_compositor_sizes():
+    compositor = TrailCompositor(cv.createBackgroundSubtractorMOG2(), scale=0.25)
+    for packet in synthetic_packets(5):
+        images = compositor(packet).images
+    assert images["Frame"].shape == (240, 320, 3)
+    assert images["Output"].shape == (240, 320, 3)
+    assert images["Foreground Mask"].shape == (60, 80)
+    assert images["OutputDown"].shape == (16, 16, 3)
+    assert "Background image" not in images
+
+
+def test_scaled_compositor_tracks_the_full_size_one():
+    full = TrailCompositor(cv.createBackgroundSubtractorMOG2())
+    quarter = TrailCompositor(cv.createBackgroundSubtractorMOG2(), scale=0.25)
+    for packet in synthetic_packets(30):
+        expected = full(packet).images["Foreground Mask"]
+        actual = quarter(packet).images["Foreground Mask"] > 0
+    # The moving shapes are foreground at both sizes.
+    small = cv.resize(expected, actual.shape[::-1], interpolation=cv.INTER_AREA)
+    agreement = np.mean((small > 0) == actual)
+    assert agreement > 0.95
+
+
+def test_background_image_on_demand():
+    compositor = TrailCompositor(cv.createBackgroundSubtractorMOG2(), scale=0.5)
+    assert compositor.background_image() is None
+    for packet in synthetic_packets(3):
+        compositor(packet)
+    assert compositor.background_image().shape == (120, 160, 3)
+
+    shown = TrailCompositor(
+        cv.createBackgroundSubtractorMOG2(), scale=0.5, background_view=True
+    )
+    assert "Background image" in shown(next(synthetic_packets(1))).images
+
+
+def test_small_trail_compositor_sizes():
+    compositor = TrailCompositor(
+        cv.createBackgroundSubtractorMOG2(),
+        scale=0.5,
+        trail_size=(64, 48),
+        full_size_views=(),
+    )
+    for packet in synthetic_packets(5):
+        images = compositor(packet).images
+    assert images["Frame"].shape == (240, 320, 3)
+    assert images["Output"].shape == (48, 64, 3)
+    assert images["Foreground Mask"].shape == (48, 64)
+    assert images["OutputDown"].shape == (16, 16, 3)
+    assert images["Output"].any()
+
+
+if __name__ == "__main__":
+    os.makedirs(os.path.dirname(GOLDEN_TRAIL), exist_ok=True)
+    cv.imwrite(GOLDEN_TRAIL, fused_trail(moving_masks(30)))
@@ -0,0 +1,28 @@
+import numpy as np
+
+from ghostwriter.camera.exposure import AutoExposure
+from ghostwriter.camera.gamma import GammaCorrector
+
+
+def test_dark_scene_converges_to_target():
+    rng = np.random.RandomState(0)
+    gray = rng.randint(0, 60, size=(240, 320)).astype(np.uint8)
+    exposure = AutoExposure(target=0.45, budget=1.0)
+
+    for _ in range(40):
+        gamma = exposure.update(gray)
+
+    assert gamma < 1.0
+    corrected = GammaCorrector().correct(gray, gamma)
+    assert abs(corrected.mean() / 255.0 - 0.45) < 0.05
+
+
+def test_stride_grows_when_over_budget():
+    gray = np.full((480, 640), 128, np.uint8)
+    exposure = AutoExposure(stride=1, budget=0.0, max_stride=8)
+
+    for _ in range(5):
+        exposure.update(gray)
+
+    assert exposure.stride == 8
+    assert exposure.summary()["stride"] == 8
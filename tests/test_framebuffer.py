@@ -0,0 +1,103 @@
+import time
+
+import numpy as np
+import pytest
+
+from ghostwriter.pixel.framebuffer import LedFramebuffer, MockStrip, NeoPixelBackend
+
+
+class FakeNeoPixel(list):
+    """A `neopixel.NeoPixel` without the raw buffer: colors go in as RGB."""
+
+    def __init__(self, n):
+        super().__init__([(0, 0, 0)] * n)
+        self.n = n
+
+    def show(self):
+        pass
+
+
+def test_show_reorders_channels_and_applies_brightness():
+    strip = MockStrip(4)
+    framebuffer = LedFramebuffer(strip, width=2, height=2, brightness=0.5)
+    frame = np.zeros((2, 2, 3), np.uint8)
+    frame[0, 1] = (200, 100, 50)
+
+    assert framebuffer.show(frame)
+
+    np.testing.assert_array_equal(strip.pixels[1], [50, 100, 25])
+    assert not strip.pixels[[0, 2, 3]].any()
+
+
+def test_bgr_input_and_custom_index():
+    strip = MockStrip(4)
+    # Serpentine: the second row runs right to left.
+    index = np.array([[0, 1], [3, 2]])
+    framebuffer = LedFramebuffer(
+        strip, width=2, height=2, input_order="BGR", strip_order="RGB", index=index
+    )
+    frame = np.zeros((2, 2, 3), np.uint8)
+    frame[1, 0] = (1, 2, 3)
+
+    framebuffer.show(frame)
+
+    np.testing.assert_array_equal(strip.pixels[3], [3, 2, 1])
+
+
+def test_slice_writes_take_rgb():
+    pixels = FakeNeoPixel(4)
+    framebuffer = LedFramebuffer(NeoPixelBackend(pixels), width=2, height=2)
+    frame = np.zeros((2, 2, 3), np.uint8)
+    frame[0, 1] = (1, 2, 3)
+
+    framebuffer.show(frame)
+
+    assert framebuffer.strip_order == "RGB"
+    assert pixels[1] == (1, 2, 3)
+    with pytest.raises(ValueError):
+        LedFramebuffer(NeoPixelBackend(pixels), width=2, height=2, strip_order="GRB")
+
+
+def test_unchanged_frames_are_skipped():
+    strip = MockStrip(16 * 16)
+    framebuffer = LedFramebuffer(strip)
+    frame = np.full((16, 16, 3), 7, np.uint8)
+
+    assert framebuffer.show(frame)
+    assert not framebuffer.show(frame.copy())
+    framebuffer.brightness = 0.5
+    assert framebuffer.show()
+
+    assert strip.shows == 2
+    assert (framebuffer.writes, framebuffer.skipped) == (2, 1)
+
+
+def test_benchmark_against_per_pixel_writes():
+    n = 16 * 16
+    strip = MockStrip(n)
+    framebuffer = LedFramebuffer(strip, brightness=0.05)
+    rng = np.random.RandomState(0)
+    frames = rng.randint(0, 256, size=(50, 16, 16, 3)).astype(np.uint8)
+
+    start = time.perf_counter()
+    for frame in frames:
+        framebuffer.show(frame)
+    bulk = time.perf_counter() - start
+
+    # The per-pixel path the scripts used: scale, reorder and store each pixel.
+    buf = bytearray(3 * n)
+    start = time.perf_counter()
+    for frame in frames:
+        for i, (r, g, b) in enumerate(frame.reshape(-1, 3).tolist()):
+            buf[3 * i : 3 * i + 3] = bytes(
+                (int(g * 0.05), int(r * 0.05), int(b * 0.05))
+            )
+    per_pixel = time.perf_counter() - start
+
+    print(
+        "framebuffer: {:.3f} ms/frame, per-pixel: {:.3f} ms/frame".format(
+            1000 * bulk / len(frames), 1000 * per_pixel / len(frames)
+        )
+    )
+    assert framebuffer.writes == len(frames)
+    assert bulk < per_pixel
@@ -0,0 +1,58 @@
+import numpy as np
+
+from ghostwriter.camera.gamma import GammaCorrector
+
+
+def test_tables_are_built_lazily():
+    corrector = GammaCorrector()
+    image = np.arange(256, dtype=np.uint8).reshape(16, 16)
+
+    corrected = corrector.correct(image, 1.0)
+
+    assert corrector._built.sum() == 1
+    np.testing.assert_allclose(corrected, image, atol=1)
+    assert corrector.lookup_tables.shape == (128, 256)
+    assert corrector._built.all()
+
+
+def test_gamma_range_endpoints():
+    corrector = GammaCorrector(gamma_min=0.5, gamma_max=5.0)
+    image = np.full((2, 2), 128, np.uint8)
+    for gamma in (0.0, 0.5, 5.0, 100.0):
+        corrector.correct(image, gamma)
+    assert corrector.correct(image, 5.0)[0, 0] == corrector.correct(image, 9.0)[0, 0]
+
+
+def test_interpolation_lies_between_levels():
+    snapped = GammaCorrector(num_levels=4, gamma_min=0.5, gamma_max=4.0)
+    blended = GammaCorrector(
+        num_levels=4, gamma_min=0.5, gamma_max=4.0, interpolate=True
+    )
+    low, high = snapped.lookup_table(1.0), snapped.lookup_table(2.0)
+
+    middle = blended.lookup_table(np.sqrt(2.0))
+
+    assert np.all(middle <= low) and np.all(middle >= high)
+    assert np.any(middle < low) and np.any(middle > high)
+
+
+def test_batch_matches_single_frames():
+    corrector = GammaCorrector()
+    rng = np.random.RandomState(0)
+    frames = rng.randint(0, 256, size=(5, 8, 8, 3)).astype(np.uint8)
+
+    shared = corrector.correct_batch(frames, 0.7)
+    per_channel = corrector.correct_batch(frames, [0.5, 1.0, 2.0])
+    per_frame = corrector.correct_batch(frames, np.linspace(0.5, 2, 5)[:, None])
+
+    for n, frame in enumerate(frames):
+        np.testing.assert_array_equal(shared[n], corrector.correct(frame, 0.7))
+        np.testing.assert_array_equal(
+            per_channel[n], corrector.correct(frame, [0.5, 1.0, 2.0])
+        )
+        np.testing.assert_array_equal(
+            per_frame[n], corrector.correct(frame, np.linspace(0.5, 2, 5)[n])
+        )
+    np.testing.assert_array_equal(
+        per_channel[..., 2], corrector.correct_batch(frames[..., 2].copy(), 2.0)
+    )
@@ -0,0 +1,95 @@
+import io
+import time
+
+import cv2 as cv
+import numpy as np
+from PIL import Image, ImageSequence
+
+from ghostwriter.camera.colors import ColorStore, load_xkcd_store
+from ghostwriter.camera.gif import GifSink, GifWriter, export_gif, xkcd_palette
+from ghostwriter.camera.pipeline import FramePacket
+
+
+def moving_square(index, size=(60, 80)):
+    frame = np.zeros(size + (3,), np.uint8)
+    frame[:] = (40, 120, 40)
+    frame[10:20, 5 + 3 * index : 15 + 3 * index] = (180, 105, 255)
+    return frame
+
+
+def decode(data):
+    with Image.open(io.BytesIO(data)) as gif:
+        return [
+            (np.array(frame.convert("RGB")), frame.info.get("duration"))
+            for frame in ImageSequence.Iterator(gif)
+        ]
+
+
+def test_delta_frames_decode_to_the_originals():
+    output = io.BytesIO()
+    palette = ColorStore(["green", "pink"], np.array([[40, 120, 40], [180, 105, 255]]))
+    with GifWriter(output, palette) as writer:
+        for index in range(10):
+            writer.write(moving_square(index), index / 10)
+        # Repeated frames extend the last one instead of adding frames.
+        writer.write(moving_square(9), 1.0)
+        writer.write(moving_square(9), 1.1)
+
+    frames = decode(output.getvalue())
+    assert len(frames) == 10
+    for index, (frame, duration) in enumerate(frames):
+        np.testing.assert_array_equal(frame[..., ::-1], moving_square(index))
+    assert [duration for _, duration in frames] == [100] * 9 + [300]
+
+
+def test_delta_frames_are_smaller():
+    sizes = {}
+    for delta in (True, False):
+        output = io.BytesIO()
+        with GifWriter(output, "adaptive", delta=delta) as writer:
+            for index in range(20):
+                writer.write(moving_square(index, (240, 320)), index / 10)
+        sizes[delta] = len(output.getvalue())
+    print("GIF bytes with deltas: {}, without: {}".format(sizes[True], sizes[False]))
+    assert sizes[True] < sizes[False] / 2
+
+
+def test_sink_fits_the_palette_after_the_black_frames():
+    output = io.BytesIO()
+    sink = GifSink(output, view="Output", start_when=np.any)
+    black = np.zeros((60, 80, 3), np.uint8)
+    for index in range(3):
+        sink.write(FramePacket(index, index / 10, {"Output": black}))
+    for index in range(3, 8):
+        sink.write(FramePacket(index, index / 10, {"Output": moving_square(index)}))
+    sink.close()
+
+    frames = decode(output.getvalue())
+    assert len(frames) == 5
+    np.testing.assert_array_equal(frames[-1][0][..., ::-1], moving_square(7))
+
+
+def test_xkcd_palette_picks_used_colors():
+    frame = moving_square(0)
+    palette = xkcd_palette(frame, colors=4)
+
+    assert len(palette) == 2
+    assert set(palette.names) == set(load_xkcd_store().names_of(frame).ravel())
+
+
+def test_export_video(tmp_path):
+    video = str(tmp_path / "clip.avi")
+    writer = cv.VideoWriter(video, 0, cv.VideoWriter_fourcc(*"MJPG"), 30.0, (320, 240))
+    for index in range(60):
+        writer.write(moving_square(index % 60, (240, 320)))
+    writer.release()
+
+    start = time.perf_counter()
+    gif = export_gif(video, str(tmp_path / "clip.gif"), fps=10, width=160)
+    print(
+        "Exported {} frames in {:.3f}s".format(gif.frames, time.perf_counter() - start)
+    )
+
+    with Image.open(str(tmp_path / "clip.gif")) as image:
+        assert image.size == (160, 120)
+        assert image.n_frames == 20
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+import pytest
+
+from ghostwriter.pixel.framebuffer import LedFramebuffer, MockStrip
+from ghostwriter.pixel.layout import PanelLayout, TiledLayout, downsample
+
+
+def test_serpentine_panel():
+    layout = PanelLayout(4, 3)
+
+    np.testing.assert_array_equal(
+        layout.index, [[0, 1, 2, 3], [7, 6, 5, 4], [8, 9, 10, 11]]
+    )
+    np.testing.assert_array_equal(
+        PanelLayout(2, 3, vertical=True).index, [[0, 3, 4], [1, 2, 5]]
+    )
+    np.testing.assert_array_equal(
+        PanelLayout(2, 2, serpentine=False, rotation=1).index, [[1, 3], [0, 2]]
+    )
+
+
+def test_tiled_panels_chain_in_order():
+    layout = TiledLayout(PanelLayout(2, 2), columns=2, rows=2, serpentine=True)
+
+    assert layout.shape == (4, 4)
+    np.testing.assert_array_equal(
+        layout.index,
+        [[0, 1, 4, 5], [3, 2, 7, 6], [12, 13, 8, 9], [15, 14, 11, 10]],
+    )
+
+
+def test_to_strip_matches_per_pixel_loop():
+    layout = TiledLayout(PanelLayout(16, 16, rotation=2), columns=2)
+    rng = np.random.RandomState(0)
+    frame = rng.randint(0, 256, size=layout.shape + (3,)).astype(np.uint8)
+
+    start = time.perf_counter()
+    data = layout.to_strip(frame, input_order="BGR")
+    elapsed = time.perf_counter() - start
+
+    expected = np.zeros((layout.count, 3), np.uint8)
+    for (row, col), position in np.ndenumerate(layout.index):
+        blue, green, red = frame[row, col]
+        expected[position] = (green, red, blue)
+    print("to_strip for {} LEDs: {:.1f} us".format(layout.count, 1e6 * elapsed))
+    np.testing.assert_array_equal(data.reshape(-1, 3), expected)
+
+
+def test_framebuffer_uses_layout_index():
+    layout = PanelLayout(2, 2)
+    strip = MockStrip(layout.count)
+    framebuffer = LedFramebuffer(strip, 2, 2, strip_order="RGB", index=layout.index)
+    frame = np.arange(12, dtype=np.uint8).reshape(2, 2, 3)
+
+    framebuffer.show(frame)
+
+    np.testing.assert_array_equal(strip.pixels, frame.reshape(-1, 3)[[0, 1, 3, 2]])
+
+
+def test_bad_index_is_rejected():
+    with pytest.raises(ValueError):
+        LedFramebuffer(MockStrip(4), 2, 2, index=np.zeros((2, 2), int))
+
+
+def test_area_downsample_averages():
+    image = np.zeros((32, 32, 3), np.uint8)
+    image[::2, ::2] = 255
+
+    nearest = downsample(image, (16, 16))
+    area = downsample(image, (16, 16), "area")
+
+    assert nearest.min() == 255
+    assert np.all(np.abs(area.astype(int) - 64) <= 1)
@@ -0,0 +1,124 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from ghostwriter.camera.pipeline import CallbackSink, Pipeline
+from ghostwriter.camera.sources import SyntheticSource
+from ghostwriter.metrics import METRICS, Metrics, Rate, profile_reporters
+from ghostwriter.utils import default_arguments, set_up_logging
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    with metrics.timer("stage"):
+        pass
+    metrics.tick("stage")
+    metrics.observe("stage", 1.0)
+
+    @metrics.timed("call")
+    def call(x):
+        return 2 * x
+
+    assert call(3) == 6
+    assert metrics.snapshot() == {}
+
+
+def test_timers_and_rates():
+    metrics = Metrics(enabled=True)
+
+    @metrics.timed("call")
+    def call():
+        time.sleep(0.002)
+
+    for _ in range(5):
+        call()
+        with metrics.timer("block"):
+            pass
+        metrics.tick("block")
+    snapshot = metrics.snapshot()
+    assert snapshot["call"]["count"] == 5
+    assert snapshot["call"]["p50_ms"] >= 2
+    assert snapshot["block"]["count"] == 5
+    assert snapshot["block"]["frames"] == 5
+    assert metrics.summary()["stage"] == "profile"
+
+
+def test_rate():
+    times = iter(np.arange(0, 10, 0.1))
+    rate = Rate(window=10, clock=lambda: next(times))
+    for _ in range(20):
+        rate.tick()
+    assert abs(rate.fps - 10) < 1e-6
+
+
+def test_rolling_window():
+    metrics = Metrics(enabled=True, window=10)
+    for value in [1.0] * 10 + [0.001] * 10:
+        metrics.observe("stage", value)
+    histogram = metrics.histogram("stage")
+    assert histogram.count == 20
+    assert histogram.quantiles([0.99])[0] == 0.001
+    assert histogram.max == 1.0
+
+
+def test_write_json_and_prometheus(tmp_path):
+    metrics = Metrics(enabled=True)
+    metrics.observe("sink.LedSink", 0.01)
+    metrics.tick("capture")
+
+    metrics.write(str(tmp_path / "metrics.json"))
+    data = json.loads((tmp_path / "metrics.json").read_text())
+    assert data["metrics"]["sink.LedSink"]["count"] == 1
+
+    metrics.write(str(tmp_path / "metrics.prom"))
+    text = (tmp_path / "metrics.prom").read_text()
+    assert "# TYPE ghostwriter_sink_LedSink_seconds summary" in text
+    assert 'ghostwriter_sink_LedSink_seconds{quantile="0.5"} 0.01' in text
+    assert "ghostwriter_sink_LedSink_seconds_count 1" in text
+    assert "ghostwriter_capture_frames_total 1" in text
+    assert not list(tmp_path.glob("*.tmp*"))
+
+
+def test_profile_pipeline(tmp_path):
+    path = str(tmp_path / "metrics.prom")
+    args = argparse.Namespace(profile=path)
+    METRICS.reset()
+    try:
+        reporters = profile_reporters(args)
+        source = SyntheticSource(64, 48, frames=20)
+        pipeline = Pipeline(
+            source,
+            lambda packet: packet,
+            sinks=[CallbackSink(lambda image: None, "frame")],
+            reporters=reporters,
+        )
+        pipeline.run()
+    finally:
+        METRICS.enabled = False
+    snapshot = METRICS.snapshot()
+    METRICS.reset()
+    assert snapshot["capture"]["frames"] == 20
+    assert snapshot["process"]["count"] > 0
+    assert "CallbackSink" in snapshot
+    assert "ghostwriter_capture_seconds_count" in open(path).read()
+    assert profile_reporters(argparse.Namespace(profile=None)) == []
+
+
+def test_profile_output_can_be_logged():
+    args = default_arguments("test").parse_args(["--profile", "-v", "1"])
+    assert args.verbose == 1 and args.profile == ""
+    set_up_logging(args.verbose)
+
+
+def test_disabled_overhead():
+    metrics = Metrics()
+    iterations = 100000
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with metrics.timer("stage"):
+            pass
+    per_call = (time.perf_counter() - start) / iterations
+    print("disabled timer: {:.0f} ns".format(1e9 * per_call))
+    assert per_call < 5e-6
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from ghostwriter.camera.motion import MotionDetector, MotionGate, gate_process
+from ghostwriter.camera.pipeline import FramePacket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def scene(moving=False, brightness=80):
+    rng = np.random.default_rng(0)
+    frame = np.full((480, 640, 3), brightness, np.uint8)
+    # Sensor noise, which shrinking should average away.
+    frame += rng.integers(0, 8, frame.shape, dtype=np.uint8)
+    if moving:
+        frame[100:300, 200:400] = 250
+    return frame
+
+
+def test_motion_detector():
+    detector = MotionDetector()
+    assert detector(scene()) == 1.0
+    assert detector(scene()) == 0.0
+    # The box covers an eighth of the frame.
+    assert detector(scene(moving=True)) == pytest.approx(0.125, abs=0.02)
+    # A slow change in the light is absorbed into the reference.
+    for frame in range(200):
+        level = detector(scene(brightness=80 + frame // 5))
+    assert level < 0.002
+
+
+def test_motion_gate_hysteresis_and_idle_rate():
+    clock = FakeClock()
+    gate = MotionGate(hold_seconds=1.0, idle_fps=2.0, clock=clock)
+    still, moving = scene(), scene(moving=True)
+
+    def run(frame, seconds, fps=10):
+        processed = 0
+        for _ in range(int(seconds * fps)):
+            processed += gate(frame)
+            clock.now = round(clock.now + 1.0 / fps, 6)
+        return processed
+
+    # Stays awake through the hold time after the first frame, then only lets
+    # two frames a second through.
+    assert run(still, 1.0) == 10
+    assert gate.active
+    assert run(still, 0.5) == 1
+    assert not gate.active
+    assert run(still, 2.0) == 4
+
+    # Wakes on the first moving frame.
+    assert gate(moving)
+    assert gate.active and gate.wakes == 1
+    summary = gate.summary()
+    assert summary["stage"] == "motion"
+    assert summary["processed"] + summary["skipped"] == 36
+
+    with pytest.raises(ValueError):
+        MotionGate(start=0.001, stop=0.01)
+
+
+def test_gate_process():
+    clock = FakeClock()
+    gate = MotionGate(hold_seconds=0.0, idle_fps=0.0, clock=clock)
+    process = gate_process(lambda packet: packet, gate)
+    still = FramePacket(0, 0.0, {"frame": scene()})
+    assert process(still) is still
+    clock.now = 1.0
+    assert process(still) is None
+    assert process(still) is None
+    assert gate.skipped == 2
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import numpy as np
+
+from ghostwriter.camera.multicamera import FairQueue, MultiCameraPipeline
+from ghostwriter.camera.pipeline import CallbackSink, DisplaySink
+
+
+class FakeCapture:
+    def __init__(self, num_frames, value):
+        self.remaining = num_frames
+        self.value = value
+        self.released = False
+
+    def read(self):
+        if self.remaining == 0:
+            return False, None
+        self.remaining -= 1
+        return True, np.full((4, 4), self.value, np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+def test_fair_queue_round_robin():
+    queue = FairQueue(3, maxlen=4)
+    for lane in range(3):
+        for item in range(3):
+            queue.put(lane, (lane, item))
+    served = []
+    for _ in range(6):
+        lane, item = queue.get(timeout=0)
+        served.append(item)
+        queue.done(lane)
+    assert served == [(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1)]
+
+
+def test_fair_queue_one_frame_per_camera_in_flight():
+    queue = FairQueue(2)
+    queue.put(0, "a")
+    queue.put(0, "b")
+    assert queue.get(timeout=0) == (0, "a")
+    # Camera 0 is busy, so its next frame waits.
+    assert queue.get(timeout=0) is None
+    queue.done(0)
+    assert queue.get(timeout=0) == (0, "b")
+
+
+def test_fair_queue_drops_oldest_and_finishes():
+    queue = FairQueue(2, maxlen=2)
+    lane = queue.lanes[0]
+    for item in range(4):
+        lane.put(item)
+    assert lane.dropped == 2
+    queue.close(0)
+    queue.close(1)
+    assert not queue.finished
+    assert queue.get(timeout=0) == (0, 2)
+    queue.done(0)
+    assert queue.get(timeout=0) == (0, 3)
+    assert queue.finished
+
+
+def test_multi_camera_pipeline():
+    sources = [FakeCapture(15, value) for value in (1, 2, 3)]
+    seen = [[] for _ in sources]
+    active = {}
+    overlaps = []
+    lock = threading.Lock()
+
+    def make_process(camera):
+        def process(packet):
+            with lock:
+                if active.get(camera):
+                    overlaps.append(camera)
+                active[camera] = True
+            time.sleep(0.001)
+            with lock:
+                active[camera] = False
+            out = packet.images["frame"] + 1
+            out[0, 0] = packet.index
+            return packet._replace(images={"out": out})
+
+        return process
+
+    shown = {}
+    pipeline = MultiCameraPipeline(
+        sources,
+        [make_process(camera) for camera in range(3)],
+        sinks=[[CallbackSink(camera_seen.append, "out")] for camera_seen in seen],
+        display=DisplaySink(show=shown.__setitem__, wait_key=lambda delay: -1),
+        workers=2,
+        buffer_size=32,
+    )
+    pipeline.run(stats_interval=60)
+
+    assert all(source.released for source in sources)
+    assert not overlaps
+    for value, camera_seen in zip((1, 2, 3), seen):
+        assert len(camera_seen) == 15
+        assert all((image[0, 1:] == value + 1).all() for image in camera_seen)
+        # Published in capture order.
+        assert [image[0, 0] for image in camera_seen] == list(range(15))
+    assert shown and set(shown) <= {"cam0: out", "cam1: out", "cam2: out"}
+    stats = {stage["stage"]: stage for stage in pipeline.stats()}
+    assert stats["capture-cam1"]["frames"] == 15
+    assert stats["worker-0"]["frames"] + stats["worker-1"]["frames"] == 45
@@ -0,0 +1,129 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from ghostwriter.camera.detection import CascadeDetector
+from ghostwriter.camera.parallel import DetectionPool, ReorderBuffer
+
+
+class SlowCascade:
+    """Finds one face per 64 columns of bright pixels, slowly."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def detectMultiScale(self, image, *args, **kwargs):
+        time.sleep(self.delay)
+        columns = int(image[0].sum()) // 255 // 64
+        return [(64 * n, 0, 32, 32) for n in range(columns)]
+
+
+class NoCascade:
+    def detectMultiScale(self, image, *args, **kwargs):
+        return []
+
+
+def slow_detector():
+    return CascadeDetector(SlowCascade(0.02), NoCascade(), NoCascade())
+
+
+class SizedCascade:
+    """A big face in full-size frames, a small one in shrunk frames."""
+
+    def detectMultiScale(self, image, *args, **kwargs):
+        if image.shape[1] == 256:
+            return [(0, 0, 200, 200)]
+        return [(0, 0, 10, 10)]
+
+
+class AutoScaleDetector:
+    scale = "auto"
+
+    def __call__(self):
+        return CascadeDetector(SizedCascade(), NoCascade(), NoCascade())
+
+
+class DyingCascade:
+    def detectMultiScale(self, image, *args, **kwargs):
+        os._exit(1)
+
+
+def dying_detector():
+    return CascadeDetector(DyingCascade(), NoCascade(), NoCascade())
+
+
+def broken_detector():
+    raise IOError("no cascades here")
+
+
+def frame_with_faces(faces):
+    frame = np.zeros((64, 256), np.uint8)
+    frame[:, : 64 * faces] = 255
+    return frame
+
+
+def test_reorder_buffer_releases_in_order():
+    buffer = ReorderBuffer()
+    for index in (3, 5, 8):
+        buffer.expect(index)
+    buffer.put(5, "five")
+    assert buffer.get() is None
+    buffer.put(3, "three")
+    assert buffer.get() == (3, "three")
+    assert buffer.get() == (5, "five")
+
+
+def test_pool_detects_in_frame_order():
+    pool = DetectionPool(slow_detector, workers=3)
+    try:
+        pool.start((64, 256))
+        for index in range(12):
+            pool.submit(index, frame_with_faces(index % 4), context=index * 10)
+        results = [pool.next_result(timeout=10) for _ in range(12)]
+    finally:
+        pool.close()
+
+    assert [index for index, _, _ in results] == list(range(12))
+    assert [context for _, context, _ in results] == [10 * n for n in range(12)]
+    for index, _, detections in results:
+        assert [d.face for d in detections] == [
+            (64 * n, 0, 32, 32) for n in range(index % 4)
+        ]
+    assert pool.summary()["frames"] == 12
+
+
+def test_pool_reports_worker_start_failures():
+    pool = DetectionPool(broken_detector, workers=1)
+    with pytest.raises(RuntimeError):
+        pool.start((8, 8))
+
+
+def test_pool_picks_the_auto_scale_for_every_worker():
+    pool = DetectionPool(AutoScaleDetector(), workers=2)
+    faces = []
+    try:
+        pool.start((64, 256))
+        for index in range(2):
+            pool.submit(index, frame_with_faces(0))
+            _, _, detections = pool.next_result(timeout=10)
+            faces.append(detections[0].face)
+    finally:
+        pool.close()
+    # The first face lets the pool scan the next frame, on whichever worker,
+    # at a quarter of the size.
+    assert faces == [(0, 0, 200, 200), (0, 0, 40, 40)]
+
+
+def test_pool_reports_dead_workers():
+    pool = DetectionPool(dying_detector, workers=1)
+    try:
+        pool.start((64, 256))
+        pool.submit(0, frame_with_faces(1))
+        start = time.monotonic()
+        with pytest.raises(RuntimeError):
+            pool.next_result(timeout=None)
+        assert time.monotonic() - start < 5
+    finally:
+        pool.close()
@@ -0,0 +1,127 @@
+import logging
+import time
+
+import numpy as np
+
+from ghostwriter.camera.buffers import FrameBufferPool
+from ghostwriter.camera.pipeline import (
+    CallbackSink,
+    EnlargedSink,
+    Pipeline,
+    RingBuffer,
+    Sink,
+)
+
+
+class FakeCapture:
+    def __init__(self, num_frames):
+        self.remaining = num_frames
+        self.released = False
+
+    def read(self):
+        if self.remaining == 0:
+            return False, None
+        self.remaining -= 1
+        return True, np.full((4, 4, 3), self.remaining, np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+def test_ring_buffer_drops_oldest():
+    buffer = RingBuffer(maxlen=2)
+    for item in range(5):
+        buffer.put(item)
+    assert buffer.dropped == 3
+    assert buffer.get(timeout=0) == 3
+    assert buffer.get(timeout=0) == 4
+    assert buffer.get(timeout=0) is None
+
+
+def test_ring_buffer_get_latest():
+    buffer = RingBuffer(maxlen=3)
+    for item in range(3):
+        buffer.put(item)
+    assert buffer.get_latest(timeout=0) == 2
+    assert len(buffer) == 0
+    assert buffer.dropped == 2
+
+
+def test_pipeline_runs_to_end_of_source(caplog):
+    source = FakeCapture(num_frames=20)
+    seen = []
+
+    def process(packet):
+        return packet._replace(images={"sum": packet.images["frame"] + 1})
+
+    pipeline = Pipeline(
+        source, process, sinks=[CallbackSink(seen.append, view="sum")], buffer_size=32
+    )
+    pipeline.run(stats_interval=60)
+
+    assert source.released
+    assert len(seen) == 20
+    stats = {stage["stage"]: stage for stage in pipeline.stats()}
+    assert stats["capture"]["frames"] == 20
+    assert stats["process"]["dropped"] == 0
+    # The end of a clip is no error.
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+
+
+def test_pipeline_reports_sources_without_frames(caplog):
+    pipeline = Pipeline(FakeCapture(num_frames=0), lambda packet: packet, sinks=[])
+    pipeline.run(stats_interval=60)
+    assert [r.levelno for r in caplog.records].count(logging.ERROR) == 1
+
+
+class SlowSink(Sink):
+    """Keeps every frame it's given, slower than they're produced."""
+
+    buffer_size = 16
+    drop = "newest"
+
+    def __init__(self, view):
+        self.view = view
+        self.kept = []
+
+    def write(self, packet):
+        time.sleep(0.005)
+        self.kept.append((packet.index, packet.images[self.view]))
+
+
+def test_slow_sinks_get_frames_the_pool_cannot_overwrite():
+    pool = FrameBufferPool(depth=2)
+
+    def process(packet):
+        # Like the compositor, write into a pooled buffer that's reused two
+        # frames later.
+        output = pool.next("output", (4, 4))
+        output[...] = packet.index
+        return packet._replace(
+            images={"frame": packet.images["frame"], "Output": output}
+        )
+
+    recorder = SlowSink("Output")
+    enlarged = SlowSink("Output")
+    pipeline = Pipeline(
+        FakeCapture(num_frames=12),
+        process,
+        sinks=[recorder, EnlargedSink(enlarged, ["Output"])],
+        buffer_size=16,
+    )
+    pipeline.run(stats_interval=60)
+
+    for sink in (recorder, enlarged):
+        assert len(sink.kept) == 12
+        for index, image in sink.kept:
+            assert (image == index).all()
+
+
+def test_wrapped_sinks_are_named_after_the_sink_they_wrap():
+    pipeline = Pipeline(
+        FakeCapture(num_frames=2),
+        lambda packet: packet,
+        sinks=[EnlargedSink(SlowSink("frame"), ["frame"])],
+    )
+    pipeline.run(stats_interval=60)
+    assert "SlowSink" in {stage["stage"] for stage in pipeline.stats()}
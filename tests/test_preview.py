@@ -0,0 +1,113 @@
+import http.client
+import time
+import urllib.request
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.pipeline import (
+    CallbackSink,
+    DisplaySink,
+    EnlargedSink,
+    FramePacket,
+    Pipeline,
+    enlarge_views,
+)
+from ghostwriter.camera.preview import BOUNDARY, MjpegServer, PreviewSink
+from ghostwriter.camera.sources import ReplaySource, SyntheticSource
+
+
+def test_snapshot_and_stream_over_loopback():
+    server = MjpegServer(port=0).start()
+    try:
+        image = np.zeros((24, 32, 3), np.uint8)
+        image[:, 16:] = 255
+        server.publish("Foreground Mask", image)
+        url = "http://127.0.0.1:{}/".format(server.port)
+
+        with urllib.request.urlopen(url + "Foreground%20Mask.jpg") as response:
+            jpeg = np.frombuffer(response.read(), np.uint8)
+        decoded = cv.imdecode(jpeg, cv.IMREAD_COLOR)
+        assert decoded.shape == image.shape
+        assert abs(int(decoded[0, 0, 0]) - 0) < 10
+        assert abs(int(decoded[0, -1, 0]) - 255) < 10
+
+        with urllib.request.urlopen(url) as response:
+            assert b"Foreground%20Mask.mjpg" in response.read()
+
+        connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+        connection.request("GET", "/Foreground%20Mask.mjpg")
+        response = connection.getresponse()
+        assert BOUNDARY in response.getheader("Content-Type")
+        assert response.readline().strip() == b"--" + BOUNDARY.encode()
+        connection.close()
+    finally:
+        server.close()
+
+
+def test_preview_sink_is_throttled():
+    published = []
+
+    class FakeServer:
+        def publish(self, view, image):
+            published.append(view)
+
+    sink = PreviewSink(FakeServer(), views=["Output"], fps=10.0)
+    for index in range(30):
+        image = np.zeros((2, 2, 3), np.uint8)
+        sink.write(FramePacket(index, index / 30, {"Output": image, "Other": image}))
+    assert published == ["Output"] * 10
+
+
+def test_display_rate_is_independent_of_processing():
+    shown = []
+    display = DisplaySink(
+        show=lambda name, image: shown.append(name),
+        wait_key=lambda delay: -1,
+        max_fps=20.0,
+    )
+    pipeline = Pipeline(
+        ReplaySource(list(SyntheticSource(32, 24, frames=40)), fps=100.0),
+        lambda packet: packet,
+        display=display,
+    )
+    start = time.monotonic()
+    pipeline.run(stats_interval=60)
+    elapsed = time.monotonic() - start
+
+    assert len(shown) <= 20 * elapsed + 1
+    assert pipeline.stats()[1]["frames"] == 40
+
+
+def test_small_views_are_enlarged_only_when_shown():
+    frame = np.zeros((48, 64, 3), np.uint8)
+    output = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    packet = FramePacket(0, 0.0, {"Frame": frame, "Output": output})
+
+    enlarged = enlarge_views(packet, ["Output", "Missing"]).images["Output"]
+    assert enlarged.shape == (48, 64)
+    np.testing.assert_array_equal(enlarged[::16, ::16], output)
+    assert packet.images["Output"] is output
+
+    shown = {}
+    display = DisplaySink(
+        show=shown.__setitem__, wait_key=lambda delay: -1, full_size_views=["Output"]
+    )
+    display.write(packet)
+    assert shown["Output"].shape == (48, 64)
+
+    published = []
+
+    class FakeServer:
+        def publish(self, view, image):
+            published.append(image.shape)
+
+    sink = PreviewSink(FakeServer(), ["Output"], fps=10.0, full_size_views=["Output"])
+    for index in range(3):
+        sink.write(packet._replace(index=index, timestamp=index / 30))
+    assert published == [(48, 64)]
+
+    written = []
+    sink = EnlargedSink(CallbackSink(written.append, "Output"), ["Output"])
+    sink.write(packet)
+    assert written[0].shape == (48, 64)
@@ -0,0 +1,76 @@
+import os
+
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.pipeline import FramePacket, Pipeline, RingBuffer
+from ghostwriter.camera.recording import RecordingSink
+
+
+def packet(index, timestamp, value=100):
+    image = np.full((32, 48, 3), value, np.uint8)
+    return FramePacket(index, timestamp, {"Output": image})
+
+
+def frame_count(filename):
+    capture = cv.VideoCapture(filename)
+    count = 0
+    while capture.read()[0]:
+        count += 1
+    capture.release()
+    return count
+
+
+def test_frames_follow_timestamps(tmp_path):
+    sink = RecordingSink(str(tmp_path), "Output", fps=10.0, segment_seconds=None)
+    # Captured at 5 fps for one second, then 20 fps for half a second.
+    timestamps = [1000 + i / 5 for i in range(5)] + [1001 + i / 20 for i in range(10)]
+    for index, timestamp in enumerate(timestamps):
+        sink.write(packet(index, timestamp))
+    sink.close()
+
+    summary = sink.summary()
+    assert summary["repeated"] == 5
+    assert summary["skipped"] == 5
+    assert frame_count(sink.segments[-1]) == 15
+
+
+def test_segments_rotate_and_old_ones_are_deleted(tmp_path):
+    sink = RecordingSink(
+        str(tmp_path), "Output", fps=10.0, segment_seconds=1.0, max_segments=2
+    )
+    for index in range(40):
+        sink.write(packet(index, 2000 + index / 10))
+    sink.close()
+
+    assert sink.segment_count == 4
+    assert sink.deleted == 2
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        os.path.basename(name) for name in sink.segments
+    )
+    assert all(frame_count(name) == 10 for name in sink.segments)
+
+
+def test_start_when_and_gaps(tmp_path):
+    sink = RecordingSink(str(tmp_path), "Output", fps=10.0, start_when=np.any)
+    sink.write(packet(0, 0.0, value=0))
+    assert not sink.segments
+    sink.write(packet(1, 0.1))
+    sink.write(packet(2, 60.0))
+    sink.close()
+
+    assert sink.gaps == 1
+    assert frame_count(sink.segments[-1]) == 2
+
+
+def test_pipeline_gives_sink_its_own_queue():
+    buffer = RingBuffer(maxlen=2, drop="newest")
+    for item in range(5):
+        buffer.put(item)
+    assert buffer.dropped == 3
+    assert buffer.get(timeout=0) == 0
+
+    sink = RecordingSink("unused", "Output", buffer_size=5)
+    pipeline = Pipeline(None, lambda packet: packet, sinks=[sink])
+    assert pipeline.sinks[0].input_buffer.maxlen == 5
+    assert pipeline.sinks[0].input_buffer.drop == "newest"
@@ -0,0 +1,118 @@
+import numpy as np
+
+from ghostwriter.pixel.framebuffer import LedFramebuffer, MockStrip
+from ghostwriter.pixel.scheduler import FrameScheduler
+
+
+class FakeClock:
+    """Time that only moves when the scheduler sleeps or work is done."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        # Yielding takes a microsecond.
+        self.now += max(seconds, 1e-6)
+
+
+def test_pushes_on_the_deadline_grid_with_slow_writes():
+    clock = FakeClock()
+    pushed, rendered = [], []
+
+    def render(t):
+        rendered.append(t)
+        clock.now += 0.002
+        return t
+
+    def show(frame):
+        pushed.append(clock.now)
+        # Half the frame period, as a 256 LED strip takes.
+        clock.now += 0.0077
+
+    scheduler = FrameScheduler(
+        render, show, fps=60.0, pipelined=False, clock=clock, sleep=clock.sleep
+    )
+    scheduler.run(frames=30)
+
+    summary = scheduler.summary()
+    print(summary)
+    assert summary["frames"] == 30
+    assert summary["dropped"] == 0
+    # The first frame goes out as soon as it's rendered, the rest on time.
+    assert pushed[0] == 0.002
+    np.testing.assert_allclose(pushed[1:], np.arange(1, 30) / 60.0, atol=1e-5)
+    np.testing.assert_allclose(rendered, np.arange(30) / 60.0)
+
+
+def test_pipelined_pushes_every_frame():
+    # Each push takes ~7.7 ms, half the frame period, on the pusher thread.
+    strip = MockStrip(256, latency_per_pixel=30e-6)
+    framebuffer = LedFramebuffer(strip)
+    times = []
+
+    def render(t):
+        times.append(t)
+        return np.full((16, 16, 3), len(times) % 256, np.uint8)
+
+    scheduler = FrameScheduler(render, framebuffer.show, fps=60.0)
+    scheduler.run(frames=30)
+
+    print(scheduler.summary())
+    assert scheduler.frames == 30
+    assert strip.shows == 30
+    steps = np.diff(times) * 60
+    np.testing.assert_allclose(steps, np.rint(steps), atol=1e-6)
+
+
+def test_slow_renderer_skips_deadlines_instead_of_drifting():
+    clock = FakeClock()
+    times = []
+
+    def render(t):
+        times.append(t)
+        clock.now += 0.025
+        return t
+
+    scheduler = FrameScheduler(
+        render,
+        lambda frame: None,
+        fps=100.0,
+        pipelined=False,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+    scheduler.run(duration=0.3)
+
+    print(scheduler.summary())
+    # Every 10 ms deadline in the 0.3 s is either met late or skipped, and the
+    # frames keep to the grid.
+    assert scheduler.frames + scheduler.dropped == 30
+    assert scheduler.dropped == 18
+    steps = np.diff(times) * 100
+    np.testing.assert_allclose(steps, np.rint(steps), atol=1e-6)
+    assert set(np.rint(steps)) == {2, 3}
+
+
+def test_nothing_is_rendered_past_the_end():
+    clock = FakeClock()
+    times = []
+
+    def render(t):
+        times.append(t)
+        return t
+
+    def show(frame):
+        # A slow strip: each write costs two and a half periods.
+        clock.now += 0.025
+
+    scheduler = FrameScheduler(
+        render, show, fps=100.0, pipelined=False, clock=clock, sleep=clock.sleep
+    )
+    scheduler.run(duration=0.1)
+
+    assert scheduler.dropped > 0
+    assert max(times) < 0.1
+    assert len(times) == scheduler.frames
@@ -0,0 +1,59 @@
+import cv2 as cv
+import numpy as np
+
+from ghostwriter.camera.benchmark import BENCHMARKS, run_benchmark
+from ghostwriter.camera.pipeline import CallbackSink, Pipeline
+from ghostwriter.camera.sources import (
+    ImageDirectorySource,
+    ReplaySource,
+    SyntheticSource,
+    load_clip,
+    open_source,
+)
+
+
+def test_synthetic_source_is_reproducible():
+    first = load_clip(SyntheticSource(64, 48, frames=5))
+    second = load_clip("synthetic:64x48", frames=5)
+
+    assert len(first) == 5
+    assert first[0].shape == (48, 64, 3)
+    for a, b in zip(first, second):
+        np.testing.assert_array_equal(a, b)
+    assert not np.array_equal(first[0], first[-1])
+
+
+def test_image_directory_source(tmp_path):
+    for index in range(3):
+        image = np.full((8, 8, 3), index, np.uint8)
+        cv.imwrite(str(tmp_path / "frame{:03d}.png".format(index)), image)
+    (tmp_path / "notes.txt").write_text("not an image")
+
+    source = open_source(str(tmp_path), loop=True)
+    assert isinstance(source, ImageDirectorySource)
+    values = [source.read()[1][0, 0, 0] for _ in range(4)]
+    assert values == [0, 1, 2, 0]
+
+
+def test_replay_source_feeds_the_pipeline():
+    clip = load_clip("synthetic:32x24", frames=10)
+    seen = []
+    pipeline = Pipeline(
+        ReplaySource(clip),
+        lambda packet: packet,
+        sinks=[CallbackSink(seen.append, view="frame")],
+        buffer_size=16,
+    )
+    pipeline.run(stats_interval=60)
+
+    assert len(seen) == 10
+    np.testing.assert_array_equal(seen[3], clip[3])
+
+
+def test_benchmarks_run_headless():
+    clip = load_clip("synthetic:320x240", frames=10)
+    for name in BENCHMARKS:
+        result = run_benchmark(name, BENCHMARKS[name](), clip, warmup=1)
+        print(result)
+        assert result["frames"] == 10
+        assert result["p50_ms"] <= result["p99_ms"] <= result["max_ms"]
@@ -0,0 +1,70 @@
+import logging
+import time
+
+import cv2 as cv
+
+from ghostwriter.camera.sources import SyntheticSource, load_clip
+from ghostwriter.camera.subtractors import (
+    BACKGROUND_SUBTRACTION_ALGORITHMS,
+    PREFERENCE,
+    benchmark_subtractor,
+    benchmark_subtractors,
+    choose_subtractor,
+    format_results,
+)
+
+
+def test_preference_covers_every_algorithm():
+    assert sorted(PREFERENCE) == sorted(BACKGROUND_SUBTRACTION_ALGORITHMS)
+
+
+def test_benchmark_subtractors_at_each_scale():
+    clip = load_clip(SyntheticSource(160, 120, frames=12))
+    results = benchmark_subtractors(clip, ["MOG2", "KNN"], scales=[1.0, 0.5])
+
+    assert [(r["stage"], r["width"]) for r in results] == [
+        ("MOG2", 160),
+        ("KNN", 160),
+        ("MOG2", 80),
+        ("KNN", 80),
+    ]
+    for result in results:
+        assert result["frames"] == 12
+        assert result["complete"]
+        assert 0 <= result["flicker"] <= 1
+    print()
+    print(format_results(results))
+
+
+def test_flicker_of_a_static_scene_is_zero():
+    clip = [SyntheticSource(64, 48).background] * 10
+    result = benchmark_subtractor("MOG2", clip)
+    assert result["flicker"] == 0.0
+
+
+def test_benchmark_stops_early_when_over_budget():
+    class Slow:
+        def apply(self, frame, learningRate=None):
+            time.sleep(0.002)
+            return cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+
+    clip = load_clip(SyntheticSource(32, 24, frames=30))
+    result = benchmark_subtractor("slow", clip, budget=0.0005, factory=Slow)
+    assert not result["complete"]
+    assert result["frames"] < 30
+
+
+def test_choose_subtractor():
+    clip = load_clip(SyntheticSource(64, 48, frames=10))
+    # Anything keeps up at one frame a minute, so the first preference wins.
+    assert choose_subtractor(clip, 1 / 60, ["MOG2", "KNN"]) == "MOG2"
+    # Nothing keeps up at a million; fall back to the fastest.
+    assert choose_subtractor(clip, 1e6, ["MOG2", "KNN"]) in ("MOG2", "KNN")
+
+
+def test_choose_subtractor_times_the_processing_size(caplog):
+    caplog.set_level(logging.INFO)
+    clip = load_clip(SyntheticSource(64, 48, frames=10))
+    assert choose_subtractor(clip, 1 / 60, ["MOG2"], scale=0.5) == "MOG2"
+    (chosen,) = [r for r in caplog.records if r.getMessage().startswith("Chose")]
+    assert chosen.args[1]["width"] == 32